@@ -0,0 +1,110 @@
+# Анимации раундов в фоне
+# Раунд уже рассчитан, обработчик сразу свободен; кадры правят одно сообщение,
+# а последний кадр заменяется итогом раунда
+
+import asyncio
+import logging
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+from config import GAME_TIMINGS
+from outbox import LOW, NORMAL, priority
+
+class Animator:
+    """Фоновые анимации с учётом лимитов Telegram на чат:
+    - кадр пропускается, если чат под flood control или правка была меньше
+      min_interval назад;
+    - новая анимация в том же чате обрывает кадры предыдущей, та сразу показывает итог;
+    - итог раунда отправляется всегда, при необходимости после retry_after"""
+    def __init__(self, frame_delay=None, min_interval=None):
+        self.frame_delay = GAME_TIMINGS['slots_animation'] if frame_delay is None else frame_delay
+        self.min_interval = GAME_TIMINGS['animation_min_interval'] if min_interval is None else min_interval
+        self.tasks = set()
+        self.current = {}      # chat_id -> последняя запущенная анимация
+        self.last_sent = {}    # chat_id -> время последнего запроса в чат
+        self.blocked = {}      # chat_id -> до какого момента действует retry_after
+        self.frames = 0
+        self.dropped = 0
+
+    def play(self, message, frames, final, reply_markup=None):
+        """Запустить анимацию в чате сообщения и сразу вернуть управление"""
+        task = asyncio.create_task(self.run(message, frames, final, reply_markup))
+        self.current[message.chat.id] = task
+        self.tasks.add(task)
+        task.add_done_callback(self.finished)
+        return task
+
+    def finished(self, task):
+        self.tasks.discard(task)
+        for chat_id, current in list(self.current.items()):
+            if current is task:
+                del self.current[chat_id]
+                self.last_sent.pop(chat_id, None)
+                if self.blocked.get(chat_id, 0) <= time.monotonic():
+                    self.blocked.pop(chat_id, None)
+
+    def can_send(self, chat_id, task):
+        now = time.monotonic()
+        return (self.current.get(chat_id) is task
+                and now >= self.blocked.get(chat_id, 0)
+                and now - self.last_sent.get(chat_id, float('-inf')) >= self.min_interval)
+
+    async def send(self, chat_id, call, level=NORMAL):
+        self.last_sent[chat_id] = time.monotonic()
+        try:
+            with priority(level):
+                return await call()
+        except TelegramRetryAfter as e:
+            self.blocked[chat_id] = time.monotonic() + e.retry_after
+            raise
+
+    async def run(self, message, frames, final, reply_markup):
+        chat_id = message.chat.id
+        task = asyncio.current_task()
+        try:
+            anim = None
+            for frame in frames:
+                if anim is not None:
+                    await asyncio.sleep(self.frame_delay)
+                if not self.can_send(chat_id, task):
+                    self.dropped += 1
+                    continue
+                try:
+                    # Кадры - низший приоритет: очередь отправки выбросит их первыми
+                    if anim is None:
+                        anim = await self.send(chat_id, lambda: message.answer(frame), LOW)
+                    else:
+                        await self.send(chat_id, lambda: anim.edit_text(frame), LOW)
+                    self.frames += 1
+                except (TelegramRetryAfter, TelegramBadRequest):
+                    self.dropped += 1
+
+            # Итог: правкой кадра, а если кадров не было - отдельным сообщением
+            for _ in range(3):
+                delay = self.blocked.get(chat_id, 0) - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                try:
+                    if anim is None:
+                        await self.send(chat_id, lambda: message.answer(final, reply_markup=reply_markup))
+                    else:
+                        await self.send(chat_id, lambda: anim.edit_text(final, reply_markup=reply_markup))
+                    return
+                except TelegramRetryAfter:
+                    continue
+            logging.warning(f"Итог раунда не доставлен в чат {chat_id}")
+        except Exception:
+            logging.exception(f"Ошибка анимации в чате {chat_id}")
+
+    async def drain(self):
+        """Дождаться всех анимаций"""
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks), return_exceptions=True)
+
+    def metrics(self):
+        return {
+            'playing': len(self.tasks),
+            'frames': self.frames,
+            'dropped': self.dropped
+        }
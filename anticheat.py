@@ -0,0 +1,239 @@
+# Анти-чит
+# Потоковый детектор: состояние каждого игрока обновляется при расчёте раунда за O(1),
+# без запросов к истории игр. Игры за час - скользящее окно из двух счётчиков,
+# частые игры - кольцевой буфер последних отметок времени, винрейт - битовая маска
+# последних исходов. Состояние периодически сохраняется в anticheat_state.
+# В памяти - только недавно игравшие и отмеченные флагами: остальные подгружаются из базы
+# при первой игре и выгружаются после сохранения, когда долго не играли или не влезают в лимит
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict, deque
+
+from config import ANTI_CHEAT
+
+HOUR = 3600
+
+class Activity:
+    """Состояние одного игрока"""
+    __slots__ = ('recent', 'last_bet', 'same_bets', 'window', 'current', 'previous',
+                 'outcomes', 'games', 'wins', 'flags')
+
+    def __init__(self, rapid_fire):
+        self.recent = deque(maxlen=rapid_fire)  # время последних rapid_fire игр
+        self.last_bet = None
+        self.same_bets = 0     # одинаковых ставок подряд
+        self.window = 0        # номер текущего часа
+        self.current = 0       # игр в текущем часе
+        self.previous = 0      # игр в прошлом часе
+        self.outcomes = 0      # выигрыши последних игр, младший бит - последняя
+        self.games = 0         # игр в маске (не больше win_rate_window)
+        self.wins = 0
+        self.flags = ()
+
+    def dump(self):
+        return json.dumps([list(self.recent), self.last_bet, self.same_bets, self.window, self.current,
+                           self.previous, self.outcomes, self.games, self.wins, list(self.flags)])
+
+    def restore(self, state):
+        recent, self.last_bet, self.same_bets, self.window, self.current, \
+            self.previous, self.outcomes, self.games, self.wins, flags = json.loads(state)
+        self.recent.extend(recent)
+        self.flags = tuple(flags)
+        return self
+
+class CheatDetector:
+    """Флаги подозрительной активности: rapid_fire, same_bet, games_per_hour, win_rate"""
+    def __init__(self, settings=None):
+        s = dict(ANTI_CHEAT, **(settings or {}))
+        patterns = s['suspicious_patterns']
+        self.settings = s
+        self.rapid_fire = patterns['rapid_fire']
+        self.rapid_fire_seconds = s['rapid_fire_seconds']
+        self.same_bet_count = patterns['same_bet_count']
+        self.max_games_per_hour = s['max_games_per_hour']
+        self.window_size = s['win_rate_window']
+        self.window_mask = (1 << self.window_size) - 1
+        self.min_games = s['min_games_for_check']
+        self.max_win_rate = s['max_win_rate']
+        self.capacity = s['cache_size']
+        self.idle_ttl = s['idle_ttl']
+        self.users = OrderedDict()  # от давно игравших к недавним
+        self.dirty = set()     # изменились после последнего сохранения
+        self.task = None
+        # Метрики
+        self.events = 0
+        self.raised = 0
+        self.checkpoints = 0
+        self.last_checkpoint_ms = 0.0
+        self.loaded = 0
+        self.evicted = 0
+
+    def observe(self, user_id, bet, result, now=None):
+        """Учесть рассчитанный раунд. Возвращает новые флаги игрока (обычно пустой кортеж)"""
+        if now is None:
+            now = time.time()
+        a = self.users.get(user_id)
+        if a is None:
+            a = self.users[user_id] = Activity(self.rapid_fire)
+        else:
+            self.users.move_to_end(user_id)
+        self.dirty.add(user_id)
+        self.events += 1
+        raised = []
+
+        recent = a.recent
+        recent.append(now)
+        if now - recent[0] <= self.rapid_fire_seconds and len(recent) == self.rapid_fire:
+            raised.append('rapid_fire')
+
+        if bet != a.last_bet:
+            a.last_bet = bet
+            a.same_bets = 1
+        else:
+            a.same_bets += 1
+            if a.same_bets >= self.same_bet_count:
+                raised.append('same_bet')
+
+        # Скользящее окно: прошлый час учитывается с весом оставшейся в окне доли
+        window = now // HOUR
+        if window != a.window:
+            a.previous = a.current if window == a.window + 1 else 0
+            a.current = 0
+            a.window = window
+        a.current += 1
+        if a.current + a.previous * (1 - (now - window * HOUR) / HOUR) > self.max_games_per_hour:
+            raised.append('games_per_hour')
+
+        won = result > bet
+        games = a.games
+        if games == self.window_size:
+            a.wins += won - (a.outcomes >> (games - 1))
+        else:
+            a.games = games = games + 1
+            a.wins += won
+        a.outcomes = ((a.outcomes << 1) | won) & self.window_mask
+        if games >= self.min_games and a.wins > games * self.max_win_rate:
+            raised.append('win_rate')
+
+        if not raised:
+            return ()
+        raised = tuple(flag for flag in raised if flag not in a.flags)
+        if raised:
+            a.flags += raised
+            self.raised += len(raised)
+            logging.warning(f"Анти-чит: игрок {user_id} - {', '.join(raised)}")
+        return raised
+
+    def flags(self, user_id):
+        a = self.users.get(user_id)
+        return a.flags if a is not None else ()
+
+    def win_rate(self, user_id):
+        """Доля выигрышей в последних играх или None, если игр меньше min_games_for_check"""
+        a = self.users.get(user_id)
+        if a is None or a.games < self.min_games:
+            return None
+        return a.wins / a.games
+
+    def clear(self, user_id):
+        """Снять флаги игрока (после проверки администратором)"""
+        a = self.users.get(user_id)
+        if a is not None and a.flags:
+            a.flags = ()
+            self.dirty.add(user_id)
+
+    def flagged(self):
+        return {user_id: a.flags for user_id, a in self.users.items() if a.flags}
+
+    def load(self, rows):
+        """Восстановить состояние из пар (user_id, state)"""
+        self.users = OrderedDict((user_id, Activity(self.rapid_fire).restore(state)) for user_id, state in rows)
+        self.dirty = set()
+
+    async def fetch(self, db, user_ids):
+        """Подгрузить из базы сохранённое состояние игроков, которых нет в памяти.
+        Вызывается перед observe: выгруженный игрок продолжает свои окна, а не начинает заново"""
+        missing = [user_id for user_id in user_ids if user_id not in self.users]
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            rows = await db.fetchall(f'SELECT user_id, state FROM anticheat_state '
+                                     f'WHERE user_id IN ({",".join("?" * len(chunk))})', chunk)
+            for user_id, state in rows:
+                # Пока шло чтение, игрок мог сыграть снова - его состояние в памяти новее
+                if user_id not in self.users:
+                    self.users[user_id] = Activity(self.rapid_fire).restore(state)
+                    self.loaded += 1
+
+    def evict(self, now=None):
+        """Выгрузить давно не игравших и тех, кто не влезает в cache_size. Несохранённые
+        и отмеченные флагами остаются: первые ждут сохранения, вторые - проверки администратором"""
+        if now is None:
+            now = time.time()
+        for user_id in list(self.users):
+            a = self.users[user_id]
+            if len(self.users) <= self.capacity and a.recent and now - a.recent[-1] < self.idle_ttl:
+                break
+            if user_id not in self.dirty and not a.flags:
+                del self.users[user_id]
+                self.evicted += 1
+
+    def start(self, db):
+        if self.task is None and self.settings['checkpoint_interval']:
+            self.task = asyncio.create_task(self.run(db))
+
+    async def run(self, db):
+        while True:
+            await asyncio.sleep(self.settings['checkpoint_interval'])
+            try:
+                await self.checkpoint(db)
+            except Exception as e:
+                logging.exception(f"Ошибка сохранения состояния анти-чита: {e}")
+
+    async def checkpoint(self, db, chunk=5000):
+        """Сохранить изменившихся игроков транзакциями по chunk штук:
+        между транзакциями пишущее соединение свободно для расчёта раундов"""
+        dirty, self.dirty = list(self.dirty), set()
+        start = time.perf_counter()
+        for i in range(0, len(dirty), chunk):
+            batch = dirty[i:i + chunk]
+            async with db.write_lock:
+                try:
+                    await db.conn.executemany('INSERT OR REPLACE INTO anticheat_state VALUES (?, ?)',
+                                              [(user_id, self.users[user_id].dump()) for user_id in batch])
+                    await db.conn.commit()
+                except Exception:
+                    await db.conn.rollback()
+                    self.dirty.update(dirty[i:])
+                    raise
+        if dirty:
+            self.checkpoints += 1
+            self.last_checkpoint_ms = (time.perf_counter() - start) * 1000
+        self.evict()
+        return len(dirty)
+
+    async def stop(self, db):
+        """Остановить фоновое сохранение и сохранить остаток"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.checkpoint(db)
+
+    def metrics(self):
+        return {
+            'users': len(self.users),
+            'events': self.events,
+            'raised': self.raised,
+            'flagged': sum(1 for a in self.users.values() if a.flags),
+            'dirty': len(self.dirty),
+            'checkpoints': self.checkpoints,
+            'last_checkpoint_ms': self.last_checkpoint_ms,
+            'loaded': self.loaded,
+            'evicted': self.evicted,
+        }
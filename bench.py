@@ -0,0 +1,1180 @@
+#!/usr/bin/env python3
+"""
+Бенчмарки казино-бота
+Запуск: python bench.py <команда>
+"""
+
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+# Добавляем текущую директорию в путь для импорта
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+def percentile(values, p):
+    """Перцентиль p (0-100) по отсортированной копии"""
+    values = sorted(values)
+    if not values:
+        return 0.0
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+class FakeMessage:
+    """Сообщение-заглушка: отвечает без обращения к Bot API"""
+    def __init__(self, user_id, text=None):
+        self.text = text
+        self.from_user = SimpleNamespace(id=user_id, username=f"user{user_id}", first_name="bench")
+        self.chat = SimpleNamespace(id=user_id)
+        self.answers = []
+
+    async def answer(self, text, reply_markup=None):
+        self.answers.append(text)
+        return self
+
+    async def edit_text(self, text, reply_markup=None):
+        self.answers.append(text)
+        return self
+
+    async def delete(self):
+        return True
+
+class FakeCallback:
+    """Нажатие inline-кнопки-заглушка"""
+    def __init__(self, user_id, data):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id, username=f"user{user_id}", first_name="bench")
+        self.message = FakeMessage(user_id)
+
+def make_state(storage, user_id):
+    """FSMContext игрока поверх переданного хранилища"""
+    from aiogram.fsm.context import FSMContext
+    from aiogram.fsm.storage.base import StorageKey
+    return FSMContext(storage=storage, key=StorageKey(bot_id=0, chat_id=user_id, user_id=user_id))
+
+def make_update(update_id, user_id, text=None, data=None):
+    """Апдейт в том виде, в каком его присылает Telegram: сообщение или нажатие кнопки"""
+    user = {"id": user_id, "is_bot": False, "first_name": "bench", "username": f"user{user_id}"}
+    chat = {"id": user_id, "type": "private", "first_name": "bench"}
+    if data is None:
+        message = {"message_id": update_id, "date": 0, "chat": chat, "from": user, "text": text}
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return {"update_id": update_id, "message": message}
+    message = {"message_id": update_id, "date": 1, "chat": chat, "text": "🎰"}  # date 0 - недоступное сообщение
+    return {"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": user, "chat_instance": "0", "message": message, "data": data}}
+
+class StubBotAPI:
+    """Локальная заглушка Bot API: отвечает на методы бота без выхода в сеть,
+    latency - имитация сетевой задержки до Telegram. Как и настоящий Telegram,
+    отвечает 429 с retry_after, если в чат за секунду пришло больше chat_limit
+    запросов или всего больше global_limit"""
+    def __init__(self, latency=0.0, chat_limit=None, global_limit=None, retry_after=1):
+        from collections import Counter
+        self.latency = latency
+        self.chat_limit = chat_limit
+        self.global_limit = global_limit
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.floods = 0
+        self.log = []   # (время, метод, chat_id, текст) принятых запросов
+        self.server = None
+
+    def flooded(self, chat_id, now):
+        recent = [c for t, _, c, _ in self.log[-1000:] if now - t < 1.0]
+        return (self.chat_limit is not None and recent.count(chat_id) >= self.chat_limit) \
+            or (self.global_limit is not None and len(recent) >= self.global_limit)
+
+    async def handle(self, request):
+        from aiohttp import web
+        method = request.match_info['method']
+        data = await request.post()
+        chat_id = int(data["chat_id"]) if "chat_id" in data else None
+        now = time.monotonic()
+        if chat_id is not None and self.flooded(chat_id, now):
+            self.floods += 1
+            return web.json_response({
+                "ok": False, "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after}}, status=429)
+        self.calls[method] += 1
+        self.log.append((now, method, chat_id, data.get("text")))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method in ("sendMessage", "editMessageText"):
+            result = {"message_id": self.calls[method], "date": 0, "text": data.get("text", ""),
+                      "chat": {"id": chat_id, "type": "private"}}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self):
+        from aiohttp import web
+        from aiohttp.test_utils import TestServer
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self.server = TestServer(app)
+        await self.server.start_server()
+        return self
+
+    def bot(self, outbox=None):
+        """Bot, который ходит в заглушку вместо api.telegram.org (через очередь outbox, если задана)"""
+        from aiogram import Bot
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        session = AiohttpSession(api=TelegramAPIServer.from_base(str(self.server.make_url("")).rstrip("/")))
+        if outbox is not None:
+            session.middleware(outbox)
+        return Bot("123456:TEST", session=session, parse_mode="MarkdownV2")
+
+    async def close(self):
+        await self.server.close()
+
+class LegacyDB:
+    """Прежний синхронный слой: sqlite3 прямо в event loop (для сравнения)"""
+    def __init__(self, path):
+        from database import UserCache
+        self.path = path
+        self.conn = None
+        self.history = None
+        self.users = UserCache(0)
+
+    async def connect(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        from database import DB
+        # Схема та же, что у асинхронного DB
+        db = await DB(self.path).connect()
+        await db.close()
+        return self
+
+    async def close(self):
+        self.conn.close()
+
+    async def create_user(self, user_id, username=None):
+        self.conn.execute('INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)', (user_id, username))
+        self.conn.commit()
+
+    async def get_balance(self, user_id):
+        user = self.conn.execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        return user[2] if user else 0
+
+    async def update_balance(self, user_id, amount):
+        self.conn.execute('UPDATE users SET balance = balance + ? WHERE user_id = ?', (amount, user_id))
+        self.conn.commit()
+
+    async def add_game(self, user_id, game_type, bet, result, multiplier):
+        self.conn.execute('INSERT INTO games VALUES (NULL, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)',
+                          (user_id, game_type, bet, result, multiplier))
+        self.conn.execute('UPDATE users SET total_games = total_games + 1, total_wins = total_wins + ? WHERE user_id = ?',
+                          (1 if result > 0 else 0, user_id))
+        self.conn.commit()
+
+    async def settle_round(self, user_id, game, bet, mult, prepaid=False):
+        if not prepaid:
+            if bet > await self.get_balance(user_id):
+                return None
+            await self.update_balance(user_id, -bet)
+        result = int(bet * mult)
+        if result: await self.update_balance(user_id, result)
+        await self.add_game(user_id, game, bet, result, mult)
+        return result
+
+    async def get_stats(self):
+        users = self.conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        games, bets, wins = self.conn.execute('SELECT COUNT(*), SUM(bet), SUM(result) FROM games').fetchone()
+        return users, games, bets or 0, wins or 0
+
+def fill_games(path, count):
+    """Заполнить историю игр, чтобы /stats читал заметный объём"""
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO games (user_id, game_type, bet, result, multiplier) VALUES (?, ?, ?, ?, ?)',
+                     ((i % 1000, 'dice', 100, 200 if i % 3 else 0, 2.0) for i in range(count)))
+    conn.commit()
+    conn.close()
+
+async def run_handlers(db, users=50, rate=200, duration=3.0, history=0):
+    """Настоящие обработчики с фиксированной частотой апдейтов: половина - ставки
+    в кости, половина - меню игр без БД, каждый сотый - админский /stats.
+    Время обработчика считается от момента прихода апдейта, включая ожидание event loop"""
+    import bot
+    from aiogram.fsm.storage.memory import MemoryStorage
+
+    bot.db = db
+    await db.connect()
+    for user_id in range(1, users + 1):
+        await db.create_user(user_id, f"user{user_id}")
+        await db.update_balance(user_id, 10 ** 9)
+    if history:
+        fill_games(db.path, history)
+
+    latencies = {'bet': [], 'menu': []}
+
+    async def update(i, arrived):
+        user_id = i % users + 1
+        if i % 100 == 99:
+            await bot.stats(FakeMessage(bot.ADMIN_ID, "/stats"))
+            return
+        if i % 2:
+            await bot.games_menu(FakeCallback(user_id, "games"))
+            latencies['menu'].append(time.perf_counter() - arrived)
+            return
+        # Своё состояние на каждую ставку: апдейты одного игрока не отменяют друг друга
+        state = make_state(MemoryStorage(), user_id)
+        await state.set_state(bot.GameStates.waiting_bet)
+        await state.update_data(game="dice")
+        await bot.handle_bet(FakeMessage(user_id, "100"), state)
+        latencies['bet'].append(time.perf_counter() - arrived)
+
+    tasks = []
+    total = int(rate * duration)
+    start = time.perf_counter()
+    for i in range(total):
+        arrival = start + i / rate
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(update(i, arrival)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    await db.close()
+    return latencies, elapsed
+
+def bench_handlers():
+    """p99 времени обработчика ставки под параллельной нагрузкой"""
+    from database import DB
+
+    users, rate, duration, history = 50, 200, 3.0, 300000
+    print(f"⚡ Обработчики: {users} игроков, {rate} апдейтов/сек, {duration:.0f} сек, "
+          f"1% апдейтов - /stats по {history} играм\n")
+    for name, factory in (("sqlite3 в event loop", LegacyDB), ("aiosqlite", DB)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = factory(os.path.join(tmp, 'bench.db'))
+            latencies, elapsed = asyncio.run(run_handlers(db, users, rate, duration, history))
+        print(f"{name}:")
+        for kind, title in (('bet', 'ставка'), ('menu', 'меню')):
+            values = latencies[kind]
+            print(f"  {title}: p50 {percentile(values, 50) * 1000:.1f} мс, "
+                  f"p99 {percentile(values, 99) * 1000:.1f} мс, "
+                  f"макс {max(values) * 1000:.1f} мс")
+        print(f"  апдейтов: {rate * duration / elapsed:.0f}/сек\n")
+
+async def run_rounds(db, settle, users=20, rounds=100):
+    """Параллельные раунды в кости: settle(user_id) рассчитывает один раунд"""
+    await db.connect()
+    for user_id in range(1, users + 1):
+        await db.create_user(user_id, f"user{user_id}")
+        await db.update_balance(user_id, 10 ** 9)
+
+    async def player(user_id):
+        for _ in range(rounds):
+            await settle(db, user_id)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(player(user_id) for user_id in range(1, users + 1)))
+    elapsed = time.perf_counter() - start
+    metrics = db.history.metrics() if db.history else None
+    await db.close()
+    return users * rounds / elapsed, metrics
+
+async def settle_separately(db, user_id, bet=100):
+    """Прежний порядок: проверка баланса и три отдельных коммита"""
+    from games import dice
+    if bet > await db.get_balance(user_id):
+        return
+    await db.update_balance(user_id, -bet)
+    won, msg, mult = dice()
+    result = int(bet * mult) if won else 0
+    if won: await db.update_balance(user_id, result)
+    await db.add_game(user_id, "dice", bet, result, mult)
+
+async def settle_atomically(db, user_id, bet=100):
+    from games import dice
+    won, msg, mult = dice()
+    await db.settle_round(user_id, "dice", bet, mult)
+
+def bench_settle():
+    """Раунды в секунду: отдельные коммиты против settle_round"""
+    import bot  # импорт aiogram не должен попасть в замер
+    from database import DB
+
+    users, rounds = 20, 100
+    print(f"⚡ Расчёт раундов: {users} игроков × {rounds} раундов\n")
+    for name, settle in (("get_balance + 3 коммита", settle_separately), ("settle_round", settle_atomically)):
+        with tempfile.TemporaryDirectory() as tmp:
+            rate, _ = asyncio.run(run_rounds(DB(os.path.join(tmp, 'bench.db')), settle, users, rounds))
+        print(f"{name}: {rate:.0f} раундов/сек")
+
+# Прежние настройки: rollback-журнал, полный fsync, одно соединение на всё
+LEGACY_PROFILE = {
+    'journal_mode': 'DELETE',
+    'synchronous': 'FULL',
+    'cache_size_kb': 2000,
+    'mmap_size': 0,
+    'read_pool_size': 0
+}
+
+async def run_mixed(db, users=20, readers=4, duration=3.0, history=200000):
+    """Игроки рассчитывают раунды, админы параллельно читают /stats и рейтинг"""
+    await db.connect()
+    for user_id in range(1, users + 1):
+        await db.create_user(user_id, f"user{user_id}")
+        await db.update_balance(user_id, 10 ** 9)
+    fill_games(db.path, history)
+
+    write_latencies = []
+    reads = 0
+    deadline = time.perf_counter() + duration
+
+    async def player(user_id):
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await settle_atomically(db, user_id)
+            write_latencies.append(time.perf_counter() - start)
+
+    async def admin():
+        nonlocal reads
+        while time.perf_counter() < deadline:
+            await db.get_stats()
+            await db.get_top(10)
+            reads += 1
+
+    await asyncio.gather(*(player(user_id) for user_id in range(1, users + 1)),
+                         *(admin() for _ in range(readers)))
+    await db.close()
+    return write_latencies, reads
+
+def bench_mixed():
+    """Смешанная нагрузка: запись раундов и параллельное чтение статистики"""
+    import bot  # импорт aiogram не должен попасть в замер
+    from database import DB
+
+    users, readers, duration = 20, 4, 3.0
+    print(f"⚡ Смешанная нагрузка: {users} игроков, {readers} читателя /stats, {duration:.0f} сек\n")
+    for name, profile in (("rollback-журнал, одно соединение", LEGACY_PROFILE), ("WAL + пул читателей", None)):
+        with tempfile.TemporaryDirectory() as tmp:
+            db = DB(os.path.join(tmp, 'bench.db'), profile)
+            latencies, reads = asyncio.run(run_mixed(db, users, readers, duration))
+        print(f"{name}:")
+        print(f"  запись: {len(latencies) / duration:.0f} раундов/сек, "
+              f"p99 {percentile(latencies, 99) * 1000:.1f} мс")
+        print(f"  чтение: {reads / duration:.1f} запросов статистики/сек\n")
+
+def bench_history():
+    """Раунды в секунду с групповой записью истории игр и без неё"""
+    import bot  # импорт aiogram не должен попасть в замер
+    from database import DB
+
+    users, rounds = 20, 200
+    print(f"⚡ История игр: {users} игроков × {rounds} раундов\n")
+    for synchronous in ('FULL', 'NORMAL'):
+        for name, batch in (("транзакция на раунд", False), ("групповая запись", True)):
+            with tempfile.TemporaryDirectory() as tmp:
+                db = DB(os.path.join(tmp, 'bench.db'), {'synchronous': synchronous, 'history_batch': batch})
+                rate, m = asyncio.run(run_rounds(db, settle_atomically, users, rounds))
+            line = f"synchronous={synchronous}, {name}: {rate:.0f} раундов/сек"
+            if m:
+                line += (f" (пачек: {m['flushes']}, запись пачки: ср. {m['avg_flush_ms']:.1f} мс, "
+                         f"макс. {m['max_flush_ms']:.1f} мс, в очереди: {m['queue_depth']})")
+            print(line)
+
+def bench_leaderboard():
+    """Рейтинг на 1M игроков: структура в памяти против ORDER BY по users"""
+    import random
+    from leaderboard import Leaderboard
+
+    users = 1000000
+    balances = [(user_id, random.randint(0, 10 ** 6)) for user_id in range(1, users + 1)]
+    print(f"⚡ Рейтинг: {users} игроков\n")
+
+    board = Leaderboard()
+    start = time.perf_counter()
+    board.load(balances)
+    print(f"Построение: {time.perf_counter() - start:.2f} сек")
+
+    def measure(name, fn, count):
+        start = time.perf_counter()
+        for i in range(count):
+            fn(i)
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {count / elapsed:.0f} оп/сек ({elapsed / count * 1e6:.1f} мкс)")
+
+    measure("Обновление баланса", lambda i: board.update(random.randint(1, users), random.randint(0, 10 ** 6)), 100000)
+    measure("Место игрока", lambda i: board.rank(random.randint(1, users)), 100000)
+    measure("Страница ТОП-10", lambda i: board.page(0, 10), 100000)
+    measure("Страница в глубине", lambda i: board.page(random.randrange(users - 10), 10), 100000)
+
+    print("\nSQLite без индекса:")
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        conn.execute('CREATE TABLE users (user_id INTEGER PRIMARY KEY, username TEXT, balance INTEGER)')
+        conn.executemany('INSERT INTO users VALUES (?, NULL, ?)', balances)
+        conn.commit()
+        measure("Страница ТОП-10", lambda i: conn.execute(
+            'SELECT user_id, balance FROM users ORDER BY balance DESC LIMIT 10').fetchall(), 10)
+        measure("Страница в глубине", lambda i: conn.execute(
+            'SELECT user_id, balance FROM users ORDER BY balance DESC LIMIT 10 OFFSET ?',
+            (random.randrange(users - 10),)).fetchall(), 10)
+        measure("Место игрока", lambda i: conn.execute(
+            'SELECT COUNT(*) FROM users WHERE balance > (SELECT balance FROM users WHERE user_id = ?)',
+            (random.randint(1, users),)).fetchone(), 10)
+        conn.close()
+
+async def run_rating(db, cached, users=10000, rounds=300, games=20, taps=20):
+    """Игры и нажатия на рейтинг вперемешку: за раунд games ставок случайных игроков
+    и taps одновременных нажатий. Возвращает задержки нажатий и метрики снимка"""
+    import random
+    import bot
+
+    bot.db = bot.storage.db = db
+    await db.connect()
+    # Десятка лидеров далеко впереди, остальные играют у стартового баланса
+    await db.conn.executemany('INSERT INTO users (user_id, username, balance) VALUES (?, ?, ?)',
+                              [(user_id, f"user_{user_id}", 10 ** 7 - user_id if user_id <= 10 else 10 ** 6)
+                               for user_id in range(1, users + 1)])
+    await db.conn.commit()
+    await db.refresh_leaderboard()
+
+    async def tap(user_id):
+        callback = FakeCallback(user_id, "rating")
+        start = time.perf_counter()
+        if cached:
+            await bot.rating(callback)
+        else:
+            # Прежний обработчик: страница собирается на каждое нажатие
+            top, text = await bot.rating_page(0)
+            rank, total = db.get_rank(user_id)
+            text += bot.render('rating_rank', rank=rank, total=total)
+            await callback.message.edit_text(text, reply_markup=bot.rating_kb(0, total > bot.RATING_PAGE))
+        latencies.append(time.perf_counter() - start)
+
+    latencies = []
+    rng = random.Random(1)
+    for _ in range(rounds):
+        for _ in range(games):
+            await db.settle_round(rng.randint(1, users), 'dice', 100, rng.choice((0.0, 2.0)))
+        await asyncio.gather(*(tap(rng.randint(1, users)) for _ in range(taps)))
+    m = db.top.metrics()
+    await db.close()
+    return latencies, m
+
+def bench_rating():
+    """Нажатия на рейтинг при постоянных играх: снимок первой страницы против сборки на каждое нажатие"""
+    from database import DB
+    import bot  # импорт aiogram не должен попасть в замер
+
+    users, rounds, games, taps = 10000, 300, 20, 20
+    print(f"🏆 Рейтинг: {users} игроков, {rounds} раундов по {games} ставок и {taps} нажатий на ТОП-10\n")
+    for name, cached in (("без снимка", False), ("со снимком", True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            latencies, m = asyncio.run(run_rating(DB(os.path.join(tmp, 'bench.db')), cached, users, rounds, games, taps))
+        print(f"{name}: p50 {percentile(latencies, 50) * 1e6:.0f} мкс, p99 {percentile(latencies, 99) * 1e6:.0f} мкс, "
+              f"всего {sum(latencies):.2f} сек")
+        if cached:
+            print(f"  попаданий {m['hit_rate'] * 100:.1f}% (прежний снимок во время пересборки: {m['previous']}), "
+                  f"пересборок {m['rebuilds']}, сбросов {m['invalidations']}")
+
+# Прежние запросы статистики по всей истории games
+LEGACY_STATS_QUERIES = {
+    '/stats': 'SELECT COUNT(*), SUM(bet), SUM(result) FROM games',
+    'daily_revenue': """SELECT DATE(created_at), SUM(bet), SUM(result), SUM(bet) - SUM(result) FROM games
+                        WHERE created_at >= datetime('now', '-30 days') GROUP BY DATE(created_at)""",
+    'popular_games': 'SELECT game_type, COUNT(*), AVG(bet), SUM(bet), SUM(result) FROM games GROUP BY game_type',
+    'top_winners': """SELECT u.username, SUM(g.result - g.bet) as profit FROM users u
+                      JOIN games g ON u.user_id = g.user_id GROUP BY u.user_id ORDER BY profit DESC LIMIT 5""",
+}
+
+def bench_rollups():
+    """Админская статистика: агрегаты по всей истории против сводных таблиц"""
+    import random
+    from config import ADMIN_STATS_QUERIES
+    from database import DB
+
+    games, users, days = 1000000, 10000, 90
+    print(f"⚡ Статистика: {games} игр, {users} игроков, {days} дней\n")
+
+    rollup_queries = {
+        '/stats': 'SELECT SUM(games), SUM(bets), SUM(payouts) FROM stats_daily',
+        'daily_revenue': ADMIN_STATS_QUERIES['daily_revenue'],
+        'popular_games': ADMIN_STATS_QUERIES['popular_games'],
+        'top_winners': """SELECT u.username, s.payouts - s.bets as profit FROM stats_users s
+                          JOIN users u ON u.user_id = s.user_id ORDER BY s.payouts - s.bets DESC LIMIT 5""",
+    }
+
+    async def prepare(path):
+        db = await DB(path).connect()
+        await db.close()
+        # История старой базы: строки без триггеров, затем пересчёт
+        conn = sqlite3.connect(path)
+        conn.execute('DROP TRIGGER games_rollup_insert')
+        conn.executemany('INSERT INTO users (user_id, username) VALUES (?, ?)',
+                         ((i, f"user{i}") for i in range(users)))
+        conn.executemany('INSERT INTO games (user_id, game_type, bet, result, multiplier, created_at) '
+                         "VALUES (?, ?, ?, ?, ?, datetime('now', ?))",
+                         ((random.randrange(users), random.choice(('dice', 'slots', 'coinflip', 'roulette')),
+                           100, random.choice((0, 0, 200, 500)), 2.0, f"-{random.randrange(days * 24)} hours")
+                          for _ in range(games)))
+        conn.commit()
+        conn.close()
+        db = await DB(path).connect()
+        start = time.perf_counter()
+        await db.backfill_rollups()
+        print(f"Пересчёт сводных таблиц (run.py backfill): {time.perf_counter() - start:.2f} сек\n")
+        await db.close()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        asyncio.run(prepare(path))
+        conn = sqlite3.connect(path)
+        for name in LEGACY_STATS_QUERIES:
+            timings = []
+            for sql in (LEGACY_STATS_QUERIES[name], rollup_queries[name]):
+                start = time.perf_counter()
+                for _ in range(3):
+                    conn.execute(sql).fetchall()
+                timings.append((time.perf_counter() - start) / 3 * 1000)
+            print(f"{name}: {timings[0]:.1f} мс -> {timings[1]:.2f} мс")
+        conn.close()
+
+async def run_webhook(db, concurrency, users=50, updates=2000, connections=40, latency=0.02):
+    """Апдейты идут POST-запросами в настоящий aiohttp-сервер вебхука по connections
+    параллельным соединениям (как у Telegram), ответы бота - в заглушку Bot API.
+    Возвращает апдейтов в секунду до завершения последнего обработчика"""
+    import bot
+    from aiohttp import ClientSession
+    from aiohttp.test_utils import TestServer
+    from webhook import SECRET_HEADER, make_app
+
+    bot.db = bot.storage.db = db
+    await db.connect()
+    for user_id in range(1, users + 1):
+        await db.create_user(user_id, f"user{user_id}")
+
+    api = await StubBotAPI(latency).start()
+    tg = api.bot()
+    app = make_app(bot.dp, tg, "bench-secret", max_concurrency=concurrency)
+    server = TestServer(app)
+    await server.start_server()
+    url = server.make_url("/webhook")
+
+    pending = iter(range(1, updates + 1))
+
+    async def connection(session):
+        for i in pending:
+            user_id = i % users + 1
+            update = make_update(i, user_id, data="main") if i % 2 else make_update(i, user_id, "/start")
+            async with session.post(url, json=update, headers={SECRET_HEADER: "bench-secret"}) as resp:
+                assert resp.status == 200
+
+    start = time.perf_counter()
+    async with ClientSession() as session:
+        await asyncio.gather(*(connection(session) for _ in range(connections)))
+    await app['webhook'].drain()
+    elapsed = time.perf_counter() - start
+
+    await server.close()
+    await tg.session.close()
+    await api.close()
+    await db.close()
+    return updates / elapsed
+
+def bench_webhook():
+    """Пропускная способность вебхука при разном лимите параллельных обработчиков"""
+    from database import DB
+    import bot  # импорт aiogram не должен попасть в замер
+
+    updates, latency = 2000, 0.02
+    print(f"🌐 Вебхук: {updates} апдейтов по 40 соединениям, "
+          f"задержка Bot API {latency * 1000:.0f} мс\n")
+    for concurrency in (1, 8, 64):
+        with tempfile.TemporaryDirectory() as tmp:
+            # Апдейт на игрока: замеряется вебхук, а не лимит апдейтов игрока
+            rate = asyncio.run(run_webhook(DB(os.path.join(tmp, 'bench.db')), concurrency,
+                                           users=updates, updates=updates, latency=latency))
+        print(f"лимит {concurrency}: {rate:.0f} апдейтов/сек")
+
+async def run_slots(db, frames, users=100):
+    """Время обработчика ставки в слоты при анимации из frames кадров"""
+    import bot
+    from aiogram.fsm.storage.memory import MemoryStorage
+    from animations import Animator
+
+    bot.db = db
+    bot.animator = Animator()
+    await db.connect()
+    for user_id in range(1, users + 1):
+        await db.create_user(user_id, f"user{user_id}")
+        await db.update_balance(user_id, 10 ** 9)
+
+    latencies = []
+
+    async def bet(user_id):
+        state = make_state(MemoryStorage(), user_id)
+        await state.set_state(bot.GameStates.waiting_bet)
+        await state.update_data(game="slots")
+        start = time.perf_counter()
+        await bot.handle_bet(FakeMessage(user_id, "100"), state)
+        latencies.append(time.perf_counter() - start)
+
+    bot.GAMES['slots'].frames = ["🎰"] * frames
+    start = time.perf_counter()
+    await asyncio.gather(*(bet(user_id) for user_id in range(1, users + 1)))
+    await bot.animator.drain()
+    elapsed = time.perf_counter() - start
+    await db.close()
+    return latencies, elapsed
+
+def bench_slots():
+    """Обработчик слотов не зависит от длины анимации"""
+    from database import DB
+    import bot  # импорт aiogram не должен попасть в замер
+
+    print("🎰 Слоты: 100 одновременных ставок\n")
+    for frames in (3, 10):
+        with tempfile.TemporaryDirectory() as tmp:
+            latencies, elapsed = asyncio.run(run_slots(DB(os.path.join(tmp, 'bench.db')), frames))
+        print(f"{frames} кадров: обработчик p50 {percentile(latencies, 50) * 1000:.1f} мс, "
+              f"p99 {percentile(latencies, 99) * 1000:.1f} мс; анимации закончились за {elapsed:.1f} сек")
+
+async def run_outbox(queued, chats=50, per_chat=6):
+    """Всплеск ответов в заглушку с лимитами Telegram: 3 в секунду на чат, 30 на бота"""
+    from outbox import SendQueue
+
+    api = await StubBotAPI(latency=0.02, chat_limit=3, global_limit=30).start()
+    outbox = SendQueue() if queued else None
+    tg = api.bot(outbox)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(tg.send_message(chat_id, f"m{i}")
+                                     for i in range(per_chat) for chat_id in range(1, chats + 1)),
+                                   return_exceptions=True)
+    elapsed = time.perf_counter() - start
+    failed = sum(isinstance(r, Exception) for r in results)
+    floods = api.floods
+    if outbox is not None:
+        await outbox.close()
+    await tg.session.close()
+    await api.close()
+    return len(results) - failed, failed, floods, elapsed
+
+def bench_outbox():
+    """Доставка всплеска сообщений напрямую и через очередь отправки"""
+    import bot  # импорт aiogram не должен попасть в замер
+
+    print("📤 Отправка: 50 чатов по 6 сообщений, лимит заглушки 3/сек на чат и 30/сек на бота\n")
+    for name, queued in (("напрямую", False), ("через очередь", True)):
+        delivered, failed, floods, elapsed = asyncio.run(run_outbox(queued))
+        print(f"{name}: доставлено {delivered}, ошибок {failed}, ответов 429 {floods}, {elapsed:.1f} сек")
+
+def bench_rng():
+    """Раундов в секунду: secrets на каждое число, буферизованный генератор и пакет numpy"""
+    import secrets
+    from config import SLOT_SYMBOLS
+    from games import dice, slots, slots_batch
+
+    def legacy_slots():
+        return [secrets.choice(SLOT_SYMBOLS) for _ in range(3)]
+
+    def legacy_dice():
+        return secrets.randbelow(6) + 1
+
+    rounds = 200000
+    print(f"🎲 Генератор: {rounds} раундов\n")
+    for name, game in (("слоты, secrets", legacy_slots), ("слоты, буфер", slots),
+                       ("кости, secrets", legacy_dice), ("кости, буфер", dice)):
+        start = time.perf_counter()
+        for _ in range(rounds):
+            game()
+        print(f"{name}: {rounds / (time.perf_counter() - start):,.0f} раундов/сек")
+
+    start = time.perf_counter()
+    slots_batch(rounds * 10)
+    print(f"слоты, slots_batch: {rounds * 10 / (time.perf_counter() - start):,.0f} раундов/сек")
+
+def bench_ui():
+    """Цена ответа на нажатие кнопки: сборка клавиатуры и текста, память и сериализация"""
+    import tracemalloc
+    from aiogram import Bot
+    from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+    from games import GAMES
+    from ui import GAMES_KB, MAIN_KB, TEXTS, md, render
+
+    # Прежние обработчики: клавиатура и текст собираются на каждое нажатие
+    def legacy_main(balance):
+        kb = InlineKeyboardMarkup(inline_keyboard=[
+            [InlineKeyboardButton(text="🎮 Игры", callback_data="games")],
+            [InlineKeyboardButton(text="👤 Профиль", callback_data="profile"),
+             InlineKeyboardButton(text="🎁 Бонус", callback_data="bonus")],
+            [InlineKeyboardButton(text="🏆 Рейтинг", callback_data="rating"),
+             InlineKeyboardButton(text="🏷 Промокод", callback_data="promo")],
+            [InlineKeyboardButton(text="ℹ️ Помощь", callback_data="help")]
+        ])
+        return f"🎰 *Главное меню*\n💰 Баланс: *{balance}* очков", kb
+
+    def legacy_games(balance):
+        buttons = [InlineKeyboardButton(text=game.title, callback_data=f"game_{name}") for name, game in GAMES.items()]
+        rows = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+        kb = InlineKeyboardMarkup(inline_keyboard=rows + [[InlineKeyboardButton(text="🔙 Назад", callback_data="main")]])
+        text = "🎮 *Игры:*\n\n" + "\n".join(f"*{md(game.title)}* \\- {md(game.summary)}" for game in GAMES.values())
+        return text, kb
+
+    def prebuilt_main(balance):
+        return render('main_menu', balance=balance), MAIN_KB
+
+    def prebuilt_games(balance):
+        return TEXTS['games_menu'], GAMES_KB
+
+    bot = Bot(token="123456:bench")
+    callbacks = 20000
+    print(f"🧱 Ответ на нажатие: {callbacks} нажатий на экран\n")
+    for screen, variants in (("главное меню", (("сборка", legacy_main), ("готовое", prebuilt_main))),
+                             ("меню игр", (("сборка", legacy_games), ("готовое", prebuilt_games)))):
+        for name, build in variants:
+            start = time.perf_counter()
+            for i in range(callbacks):
+                build(i)
+            built = (time.perf_counter() - start) / callbacks
+
+            # Пик памяти одного нажатия сверх уже занятой
+            tracemalloc.start()
+            allocated = 0
+            for i in range(100):
+                current = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                build(i)
+                allocated += tracemalloc.get_traced_memory()[1] - current
+            allocated /= 100
+            tracemalloc.stop()
+
+            # aiogram сериализует reply_markup при каждой отправке - одинаково для обоих вариантов
+            text, kb = build(0)
+            start = time.perf_counter()
+            for _ in range(callbacks // 10):
+                bot.session.prepare_value(kb, bot, {})
+            dumped = (time.perf_counter() - start) / (callbacks // 10)
+            print(f"{screen}, {name}: {built * 1e6:.1f} мкс, память {allocated:.0f} Б на нажатие, "
+                  f"сериализация {dumped * 1e6:.1f} мкс")
+
+def bench_markup():
+    """Страница рейтинга в MarkdownV2: f-строки с re.sub, шаблон и кэш строк"""
+    import re
+    from markup import SPECIAL, Template
+
+    def naive_md(value):
+        return re.sub(r"([\\_*\[\]()~`>#+\-=|{}.!])", r"\\\1", str(value))
+
+    def loop_md(text):
+        for char in SPECIAL:
+            text = text.replace(char, "\\" + char)
+        return text
+
+    players = [(f"player_{i}.{i % 7}", 1000000 - i * 137, i * 3 + 10, i) for i in range(10)]
+    rows = [(f"{i + 1}.", name, balance, wins / games * 100) for i, (name, balance, games, wins) in enumerate(players)]
+    line = Template("{medal} *{username}* \\- {balance} \\({rate:.0f}%\\)\n")
+
+    def page_naive():
+        return "".join(f"{naive_md(medal)} *{naive_md(name)}* \\- {naive_md(balance)} \\({naive_md(f'{rate:.0f}')}%\\)\n"
+                       for medal, name, balance, rate in rows)
+
+    def page_loop():
+        return "".join(f"{loop_md(medal)} *{loop_md(name)}* \\- {loop_md(str(balance))} \\({loop_md(f'{rate:.0f}')}%\\)\n"
+                       for medal, name, balance, rate in rows)
+
+    def page_template():
+        return "".join(line.render(medal=medal, username=name, balance=balance, rate=rate)
+                       for medal, name, balance, rate in rows)
+
+    def page_cached():
+        return "".join(line.cached(medal=medal, username=name, balance=balance, rate=rate)
+                       for medal, name, balance, rate in rows)
+
+    if not page_naive() == page_loop() == page_template() == page_cached():
+        raise RuntimeError("Варианты дают разный текст")
+    pages = 20000
+    print(f"📝 Рейтинг: {pages} страниц по {len(rows)} строк\n")
+    for name, build in (("f-строка + re.sub", page_naive), ("f-строка + replace", page_loop),
+                        ("шаблон", page_template), ("шаблон + кэш строк", page_cached)):
+        start = time.perf_counter()
+        for _ in range(pages):
+            build()
+        elapsed = time.perf_counter() - start
+        print(f"{name}: {pages / elapsed:,.0f} страниц/сек ({elapsed / pages * 1e6:.1f} мкс)")
+    print(f"кэш строк: {line.metrics()['hit_rate'] * 100:.1f}% попаданий")
+
+async def run_crash(db, players, crash_at=3.0):
+    """Один раунд Crash на players игроков: половина с автовыводом ×1.5-2.4, остальные
+    выводят вручную на ×1.1-3.5 (часть не успевает). Ответы - через очередь отправки
+    с лимитами Telegram в заглушку Bot API"""
+    from crash import RUNNING, CrashEngine
+    from outbox import SendQueue
+
+    await db.connect()
+    await db.conn.executemany('INSERT INTO users (user_id, username) VALUES (?, ?)',
+                              [(user_id, f"user{user_id}") for user_id in range(1, players + 1)])
+    await db.conn.commit()
+
+    api = await StubBotAPI(latency=0.02).start()
+    outbox = SendQueue()
+    tg = api.bot(outbox)
+    engine = CrashEngine(db, tg, {'betting_time': 1.0, 'growth': 0.2, 'pause': 0.0}, draw=lambda: crash_at)
+
+    manual = sorted((1.1 + (user_id % 25) / 10, user_id) for user_id in range(2, players + 1, 2))
+    cashout_time = 0.0
+
+    async def driver():
+        # Нажатия «Забрать»: как только множитель дошёл до цели игрока
+        nonlocal cashout_time
+        i = 0
+        while engine.phase != RUNNING:
+            await asyncio.sleep(0.01)
+        while engine.phase == RUNNING and i < len(manual):
+            start = time.perf_counter()
+            while i < len(manual) and manual[i][0] <= engine.multiplier:
+                engine.cashout(manual[i][1])
+                i += 1
+            cashout_time += time.perf_counter() - start
+            await asyncio.sleep(0.01)
+        return i
+
+    start = time.perf_counter()
+    driving = asyncio.create_task(driver())
+    joins = await asyncio.gather(*(engine.join(user_id, user_id, 100, 1.5 + (user_id % 10) / 10 if user_id % 2 else None)
+                                   for user_id in range(1, players + 1)))
+    while engine.settled < players:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+    cashed = await driving
+
+    balance, games = await db.fetchone('SELECT SUM(balance), (SELECT COUNT(*) FROM games) FROM users')
+    payouts = (await db.fetchone('SELECT SUM(result) FROM games'))[0]
+    consistent = balance == players * 1000 - players * 100 + payouts and games == players
+    metrics = dict(engine.metrics(), joined=sum(joined for joined, _ in joins), cashed=cashed,
+                   cashout_us=cashout_time / max(cashed, 1) * 1e6, lags=list(engine.lags),
+                   delivered=sum(api.calls.values()), queued=outbox.metrics()['queued'], consistent=consistent)
+
+    await engine.stop()
+    await outbox.close()
+    await tg.session.close()
+    await api.close()
+    await db.close()
+    return metrics, elapsed
+
+def bench_crash():
+    """Нагрузочный тест Crash: 10 000 игроков в одном раунде"""
+    from database import DB
+    import bot  # импорт aiogram не должен попасть в замер
+
+    players = 10000
+    print(f"📈 Crash: {players} игроков в одном раунде, тик {bot.crash_engine.tick * 1000:.0f} мс\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        m, elapsed = asyncio.run(run_crash(DB(os.path.join(tmp, 'bench.db')), players))
+    lags = m['lags']
+    print(f"ставок принято: {m['joined']}, рассчитано: {m['settled']}, раунд {elapsed:.1f} сек")
+    print(f"тиков: {m['ticks']}, отставание p50 {percentile(lags, 50) * 1000:.1f} мс, "
+          f"p99 {percentile(lags, 99) * 1000:.1f} мс, макс {max(lags) * 1000:.0f} мс, опоздавших {m['late_ticks']}")
+    print(f"ручных выводов: {m['cashed']}, {m['cashout_us']:.1f} мкс на вывод")
+    print(f"транзакций: {m['transactions']}, самая долгая {m['max_settle_ms']:.0f} мс")
+    print(f"Bot API: доставлено {m['delivered']}, в очереди отправки {m['queued']}, "
+          f"ждут бюджета сообщений {m['pending']} игроков")
+    print(f"балансы сходятся с историей: {'да' if m['consistent'] else 'НЕТ'}")
+
+async def run_jackpot(db, entries, draws=1000, bets=2000):
+    import rng
+    from jackpot import JackpotManager
+
+    m = {}
+    await db.connect()
+    try:
+        users = 1000
+        await db.conn.executemany('INSERT INTO users (user_id, balance) VALUES (?, ?)',
+                                  [(user_id, 10 ** 9) for user_id in range(1, users + 1)])
+        await db.conn.executemany('INSERT INTO jackpot_entries (user_id, bet) VALUES (?, ?)',
+                                  [(i % users + 1, 500 + i % 1000) for i in range(entries)])
+        await db.conn.commit()
+        settings = {'auto_draw_threshold': users + 1}
+
+        start = time.perf_counter()
+        jackpot = await JackpotManager(db, settings).load()
+        m['load_ms'] = (time.perf_counter() - start) * 1000
+
+        # Прежний выбор: линейный проход по списку ставок
+        pairs = list(zip(jackpot.users, jackpot.cumulative))
+        points = [rng.randbelow(jackpot.pot) for _ in range(draws)]
+        start = time.perf_counter()
+        for point in points:
+            for user_id, total in pairs:
+                if point < total:
+                    break
+        m['linear_us'] = (time.perf_counter() - start) / draws * 1e6
+        start = time.perf_counter()
+        for _ in range(draws):
+            jackpot.pick()
+        m['bisect_us'] = (time.perf_counter() - start) / draws * 1e6
+
+        start = time.perf_counter()
+        for i in range(bets):
+            await jackpot.add_entry(i % users + 1, 500)
+        m['bets_per_sec'] = bets / (time.perf_counter() - start)
+
+        pot = jackpot.pot
+        start = time.perf_counter()
+        winner, prize = await jackpot.draw_winner()
+        m['draw_ms'] = (time.perf_counter() - start) * 1000
+        total = (await db.fetchone('SELECT SUM(balance) FROM users'))[0]
+        m['consistent'] = total == users * 10 ** 9 - bets * 500 + prize and prize < pot
+    finally:
+        await db.close()
+    return m
+
+def bench_jackpot():
+    """Джекпот на 100 000 ставок: восстановление, выбор победителя, ставки и розыгрыш"""
+    from database import DB
+
+    entries = 100000
+    print(f"💎 Джекпот: {entries} ставок в текущем розыгрыше\n")
+    with tempfile.TemporaryDirectory() as tmp:
+        m = asyncio.run(run_jackpot(DB(os.path.join(tmp, 'bench.db')), entries))
+    print(f"восстановление из базы: {m['load_ms']:.0f} мс")
+    print(f"выбор победителя: линейный проход {m['linear_us']:.0f} мкс, "
+          f"бинарный поиск {m['bisect_us']:.1f} мкс")
+    print(f"ставок с записью в базу: {m['bets_per_sec']:.0f}/сек")
+    print(f"розыгрыш с выплатой и очисткой: {m['draw_ms']:.0f} мс")
+    print(f"балансы сходятся: {'да' if m['consistent'] else 'НЕТ'}")
+
+def bench_anticheat():
+    """Анти-чит: 10 млн игровых событий через потоковый детектор против COUNT(*) по истории"""
+    import random
+    from anticheat import CheatDetector
+    from database import DB
+
+    events, users, chunk = 10_000_000, 100_000, 1_000_000
+    print(f"🕵 Анти-чит: {events:,} событий, {users:,} игроков\n")
+    detector = CheatDetector()
+    # Исходы генерируются заранее, в замер попадает только observe
+    r = random.Random(1)
+    ids = [r.randrange(users) for _ in range(chunk)]
+    bets = [r.choice((10, 50, 100, 500)) for _ in range(chunk)]
+    results = [bet * r.choice((0, 0, 2)) for bet in bets]
+    observe = detector.observe
+    now, step = 1_000_000_000.0, 3600 / chunk   # миллион событий в час
+    elapsed = 0.0
+    for _ in range(events // chunk):
+        times = [now + i * step for i in range(chunk)]
+        start = time.perf_counter()
+        for user_id, bet, result, t in zip(ids, bets, results, times):
+            observe(user_id, bet, result, t)
+        elapsed += time.perf_counter() - start
+        now += 3600
+    m = detector.metrics()
+    print(f"потоковый детектор: {events / elapsed:,.0f} событий/сек, {elapsed / events * 1e9:.0f} нс на событие")
+    print(f"флагов: {m['raised']}, игроков под подозрением: {m['flagged']}")
+
+    async def run(path):
+        db = await DB(path, {'read_pool_size': 0}).connect()
+        try:
+            start = time.perf_counter()
+            saved = await detector.checkpoint(db)
+            checkpoint = time.perf_counter() - start
+            start = time.perf_counter()
+            rows = await db.conn.execute_fetchall('SELECT user_id, state FROM anticheat_state')
+            CheatDetector().load(rows)
+            load = time.perf_counter() - start
+        finally:
+            await db.close()
+        return saved, checkpoint, load
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        saved, checkpoint, load = asyncio.run(run(path))
+        print(f"сохранение {saved:,} игроков: {checkpoint * 1000:.0f} мс, восстановление: {load * 1000:.0f} мс")
+
+        # Прежняя проверка: COUNT(*) по истории игрока на каждое событие
+        history, checks = 1_000_000, 2000
+        fill_games(path, history)
+        conn = sqlite3.connect(path)
+        # Прежняя схема: индекс games(user_id, created_at) для этой проверки (снят миграцией 5)
+        conn.execute('CREATE INDEX idx_games_user_created ON games (user_id, created_at)')
+        start = time.perf_counter()
+        for i in range(checks):
+            conn.execute('''SELECT COUNT(*) FROM games
+                            WHERE user_id = ? AND created_at >= datetime('now', '-5 minutes')''',
+                         (i % 1000,)).fetchone()
+        legacy = (time.perf_counter() - start) / checks
+        conn.close()
+    print(f"COUNT(*) по истории из {history:,} игр: {1 / legacy:,.0f} проверок/сек, "
+          f"{legacy * 1e6:.0f} мкс на проверку")
+
+class CountingConnection(sqlite3.Connection):
+    """Соединение, считающее выполненные SQL-запросы"""
+    statements = 0
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(self.count)
+
+    @classmethod
+    def count(cls, sql):
+        cls.statements += 1
+
+async def run_flood(db, limited, spammers=20, players=50, rate=400, duration=6.0):
+    """Настоящий диспетчер под флудом: spammers без пауз чередуют выбор игры и ставку,
+    players играют раз в 6 секунд (в пределах max_games_per_minute).
+    Возвращает SQL-запросы, игры, задержки честных игроков и метрики лимита"""
+    import bot
+
+    bot.db = bot.storage.db = db
+    db.connection_factory = CountingConnection
+    await db.connect()
+    for user_id in range(1, spammers + players + 1):
+        await db.create_user(user_id, f"user{user_id}")
+        await db.update_balance(user_id, 10 ** 9)
+    api = await StubBotAPI().start()
+    tg = api.bot()
+    if not limited:
+        bot.dp.update.outer_middleware.unregister(bot.throttle)
+    bot.throttle.__init__()
+
+    latencies = []
+
+    async def feed(update, arrived, honest):
+        await bot.dp.feed_update(tg, bot.types.Update.model_validate(update, context={"bot": tg}))
+        if honest:
+            latencies.append(time.perf_counter() - arrived)
+
+    before = CountingConnection.statements
+    tasks = []
+    total = int(rate * duration)
+    start = time.perf_counter()
+    for i in range(total):
+        arrival = start + i / rate
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        second, slot = divmod(i, rate)
+        if slot < players and second % 6 < 2:
+            # Честный игрок: выбор игры, через секунду ставка
+            honest, user_id = True, spammers + slot + 1
+            turn = second % 6
+        else:
+            honest, user_id = False, i % spammers + 1
+            turn = i // spammers % 2
+        update = make_update(i, user_id, data="game_dice") if turn == 0 else make_update(i, user_id, "100")
+        tasks.append(asyncio.create_task(feed(update, arrival, honest)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - start
+    statements = CountingConnection.statements - before
+    games = (await db.fetchone('SELECT COUNT(*) FROM games'))[0]
+    honest_games = (await db.fetchone('SELECT COUNT(*) FROM games WHERE user_id > ?', (spammers,)))[0]
+    m = bot.throttle.metrics()
+    if not limited:
+        bot.dp.update.outer_middleware.unregister(bot.dp.fsm)
+        bot.dp.update.outer_middleware(bot.throttle)
+        bot.dp.update.outer_middleware(bot.dp.fsm)
+    await tg.session.close()
+    await api.close()
+    await db.close()
+    return {'statements': statements, 'games': games, 'honest_games': honest_games,
+            'latencies': latencies, 'throttle': m, 'speed': total / elapsed}
+
+def bench_throttle():
+    """Сколько запросов к базе снимает лимит апдейтов при флуде ставками"""
+    from database import DB
+    import bot  # импорт aiogram не должен попасть в замер
+
+    spammers, players, rate, duration = 20, 50, 400, 6.0
+    print(f"🚦 Флуд: {spammers} игроков без пауз чередуют выбор игры и ставку, {players} играют честно, "
+          f"{rate} апдейтов/сек, {duration:.0f} сек\n")
+    for name, limited in (("без лимита", False), ("с лимитом", True)):
+        with tempfile.TemporaryDirectory() as tmp:
+            r = asyncio.run(run_flood(DB(os.path.join(tmp, 'bench.db')), limited, spammers, players, rate, duration))
+        latencies = r['latencies']
+        print(f"{name}: SQL-запросов {r['statements']}, игр {r['games']} (честных {r['honest_games']}), "
+              f"апдейтов {r['speed']:.0f}/сек")
+        print(f"  честные игроки: p50 {percentile(latencies, 50) * 1000:.1f} мс, "
+              f"p99 {percentile(latencies, 99) * 1000:.1f} мс")
+        if limited:
+            m = r['throttle']
+            print(f"  отброшено апдейтов: {m['dropped']}, нажатий на игры: {m['dropped_games']}")
+
+async def run_workers(path, workers, users=400):
+    """Супервизор с workers процессами бота на общей базе path: каждый игрок выбирает
+    кости и ставит 100. Возвращает ставок в секунду до записи последней игры"""
+    from database import DB
+    from supervisor import Supervisor
+
+    api = await StubBotAPI().start()
+    env = {'DB_PATH': path, 'BOT_TOKEN': '123456:bench',
+           'BOT_API_URL': str(api.server.make_url("")).rstrip("/")}
+    supervisor = await Supervisor(workers, {'base_port': 18100}, env).start()
+    db = await DB(path).connect()
+
+    async def wait(sql, count):
+        while (await db.fetchone(sql))[0] < count:
+            await asyncio.sleep(0.01)
+
+    for user_id in range(1, users + 1):
+        supervisor.dispatch(make_update(user_id, user_id, data="game_dice"))
+    await wait("SELECT COUNT(*) FROM fsm_states WHERE state = 'GameStates:waiting_bet'", users)
+    start = time.perf_counter()
+    for user_id in range(1, users + 1):
+        supervisor.dispatch(make_update(users + user_id, user_id, "100"))
+    await wait("SELECT COUNT(*) FROM games", users)
+    elapsed = time.perf_counter() - start
+
+    await db.close()
+    await supervisor.stop()
+    await api.close()
+    return users / elapsed
+
+def bench_workers():
+    """Ставки в секунду при разном числе процессов бота за супервизором"""
+    from database import DB
+
+    users = 400
+    print(f"🧩 Супервизор: {users} игроков ставят одновременно, ядер процессора: {os.cpu_count()}\n")
+    for workers in (1, 2, 4):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'bench.db')
+
+            async def prepare():
+                db = await DB(path).connect()
+                for user_id in range(1, users + 1):
+                    await db.create_user(user_id, f"user{user_id}")
+                await db.close()
+
+            asyncio.run(prepare())
+            rate = asyncio.run(run_workers(path, workers, users))
+        print(f"воркеров {workers}: {rate:.0f} ставок/сек")
+
+BENCHMARKS = {
+    'handlers': bench_handlers,
+    'settle': bench_settle,
+    'mixed': bench_mixed,
+    'history': bench_history,
+    'leaderboard': bench_leaderboard,
+    'rollups': bench_rollups,
+    'webhook': bench_webhook,
+    'slots': bench_slots,
+    'outbox': bench_outbox,
+    'rng': bench_rng,
+    'crash': bench_crash,
+    'jackpot': bench_jackpot,
+    'anticheat': bench_anticheat,
+    'throttle': bench_throttle,
+    'workers': bench_workers,
+    'ui': bench_ui,
+    'markup': bench_markup,
+    'rating': bench_rating,
+}
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print("Бенчмарки: " + ", ".join(BENCHMARKS))
+        print("Пример: python bench.py handlers")
+        return
+    BENCHMARKS[sys.argv[1]]()
+
+if __name__ == "__main__":
+    main()
@@ -1,429 +1,378 @@
-import asyncio
-import sqlite3
-import logging
-import secrets
-from datetime import datetime
-import os
-from dotenv import load_dotenv
-
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, Message
-from aiogram.filters import Command
-from aiogram.fsm.context import FSMContext
-from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
-
-load_dotenv()
-BOT_TOKEN = os.getenv("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
-ADMIN_ID = int(os.getenv("ADMIN_ID", "123456789"))
-
-logging.basicConfig(level=logging.INFO)
-bot = Bot(token=BOT_TOKEN, parse_mode="MarkdownV2")
-dp = Dispatcher(storage=MemoryStorage())
-
-class GameStates(StatesGroup):
-    waiting_bet = State()
-    waiting_choice = State()
-    promo_input = State()
-
-# База данных
-class DB:
-    def __init__(self):
-        self.conn = sqlite3.connect('casino.db', check_same_thread=False)
-        self.init()
-
-    def init(self):
-        c = self.conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY, username TEXT, balance INTEGER DEFAULT 1000,
-            last_bonus DATE, total_games INTEGER DEFAULT 0, total_wins INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS games (
-            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, game_type TEXT,
-            bet INTEGER, result INTEGER, multiplier REAL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS promo_codes (
-            code TEXT PRIMARY KEY, reward INTEGER, max_uses INTEGER,
-            current_uses INTEGER DEFAULT 0)''')
-        c.execute('''CREATE TABLE IF NOT EXISTS used_promos (
-            user_id INTEGER, promo_code TEXT, PRIMARY KEY (user_id, promo_code))''')
-        self.conn.commit()
-
-    def get_user(self, user_id):
-        return self.conn.cursor().execute('SELECT * FROM users WHERE user_id = ?', (user_id,)).fetchone()
-
-    def create_user(self, user_id, username=None):
-        self.conn.cursor().execute('INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?)', (user_id, username))
-        self.conn.commit()
-
-    def get_balance(self, user_id):
-        user = self.get_user(user_id)
-        return user[2] if user else 0
-
-    def update_balance(self, user_id, amount):
-        self.conn.cursor().execute('UPDATE users SET balance = balance + ? WHERE user_id = ?', (amount, user_id))
-        self.conn.commit()
-
-    def can_bonus(self, user_id):
-        user = self.get_user(user_id)
-        if not user or not user[3]: return True
-        return datetime.now().date() > datetime.strptime(user[3], '%Y-%m-%d').date()
-
-    def claim_bonus(self, user_id):
-        c = self.conn.cursor()
-        c.execute('UPDATE users SET balance = balance + 500, last_bonus = ? WHERE user_id = ?',
-                 (datetime.now().date().isoformat(), user_id))
-        self.conn.commit()
-
-    def add_game(self, user_id, game_type, bet, result, multiplier):
-        c = self.conn.cursor()
-        c.execute('INSERT INTO games VALUES (NULL, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)',
-                 (user_id, game_type, bet, result, multiplier))
-        won = 1 if result > 0 else 0
-        c.execute('UPDATE users SET total_games = total_games + 1, total_wins = total_wins + ? WHERE user_id = ?',
-                 (won, user_id))
-        self.conn.commit()
-
-    def get_top(self, limit=10):
-        return self.conn.cursor().execute('''SELECT username, balance, total_games, total_wins
-                                           FROM users ORDER BY balance DESC LIMIT ?''', (limit,)).fetchall()
-
-    def create_promo(self, code, reward, max_uses=1):
-        self.conn.cursor().execute('INSERT OR REPLACE INTO promo_codes VALUES (?, ?, ?, 0)',
-                                  (code, reward, max_uses))
-        self.conn.commit()
-
-    def use_promo(self, user_id, code):
-        c = self.conn.cursor()
-        promo = c.execute('SELECT * FROM promo_codes WHERE code = ?', (code,)).fetchone()
-        if not promo: return False, "Промокод не найден"
-
-        used = c.execute('SELECT * FROM used_promos WHERE user_id = ? AND promo_code = ?',
-                        (user_id, code)).fetchone()
-        if used: return False, "Уже использован"
-
-        if promo[3] >= promo[2]: return False, "Промокод исчерпан"
-
-        c.execute('INSERT INTO used_promos VALUES (?, ?)', (user_id, code))
-        c.execute('UPDATE promo_codes SET current_uses = current_uses + 1 WHERE code = ?', (code,))
-        c.execute('UPDATE users SET balance = balance + ? WHERE user_id = ?', (promo[1], user_id))
-        self.conn.commit()
-        return True, f"Получено {promo[1]} очков"
-
-db = DB()
-
-# Клавиатуры
-def main_kb():
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🎮 Игры", callback_data="games")],
-        [InlineKeyboardButton(text="👤 Профиль", callback_data="profile"),
-         InlineKeyboardButton(text="🎁 Бонус", callback_data="bonus")],
-        [InlineKeyboardButton(text="🏆 Рейтинг", callback_data="rating"),
-         InlineKeyboardButton(text="🏷 Промокод", callback_data="promo")],
-        [InlineKeyboardButton(text="ℹ️ Помощь", callback_data="help")]
-    ])
-
-def games_kb():
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🪙 Монетка", callback_data="game_coinflip"),
-         InlineKeyboardButton(text="🎲 Кости", callback_data="game_dice")],
-        [InlineKeyboardButton(text="🎰 Слоты", callback_data="game_slots"),
-         InlineKeyboardButton(text="🎯 Рулетка", callback_data="game_roulette")],
-        [InlineKeyboardButton(text="🔙 Назад", callback_data="main")]
-    ])
-
-def back_kb():
-    return InlineKeyboardMarkup(inline_keyboard=[
-        [InlineKeyboardButton(text="🔙 Назад", callback_data="main")]
-    ])
-
-# Игры
-def coinflip(choice):
-    result = secrets.choice(['heads', 'tails'])
-    won = choice == result
-    msg = f"🪙 Выпал {'орёл' if result == 'heads' else 'решка'}!"
-    return won, msg, 2.0 if won else 0.0
-
-def dice():
-    result = secrets.randbelow(6) + 1
-    msg = f"🎲 Выпало: {result}"
-    if result == 6: return True, msg + " 🎉", 5.0
-    elif result in [4, 5]: return True, msg + " ✨", 2.0
-    else: return False, msg + " 😔", 0.0
-
-def slots():
-    symbols = ['🍎', '🍊', '🍇', '🍋', '🍒', '⭐']
-    result = [secrets.choice(symbols) for _ in range(3)]
-    msg = f"🎰 {''.join(result)}"
-    if result[0] == result[1] == result[2]: return True, msg + "\n🎉 ТРИ!", 10.0
-    elif result[0] == result[1] or result[1] == result[2] or result[0] == result[2]:
-        return True, msg + "\n✨ Пара!", 3.0
-    else: return False, msg + "\n😔", 0.0
-
-def roulette(bet_type, bet_value=None):
-    number = secrets.randbelow(37)
-    color = 'green' if number == 0 else ('red' if number % 2 == 1 else 'black')
-    msg = f"🎯 {number} ({'🟢' if color == 'green' else '🔴' if color == 'red' else '⚫'})"
-
-    if bet_type == 'number' and bet_value and int(bet_value) == number:
-        return True, msg + "\n🎉 ТОЧНО!", 36.0
-    elif bet_type == 'color' and bet_value == color and color != 'green':
-        return True, msg + "\n✨ Цвет!", 2.0
-    elif bet_type == 'even' and number != 0 and number % 2 == 0:
-        return True, msg + "\n✨ Чёт!", 2.0
-    elif bet_type == 'odd' and number != 0 and number % 2 == 1:
-        return True, msg + "\n✨ Нечёт!", 2.0
-    return False, msg + "\n😔", 0.0
-
-# Обработчики
-@dp.message(Command("start"))
-async def start(message: Message):
-    user_id = message.from_user.id
-    username = message.from_user.username or message.from_user.first_name
-    db.create_user(user_id, username)
-    balance = db.get_balance(user_id)
-
-    text = f"""🎰 *Казино\\-Бот* 🎰
-
-💰 Баланс: *{balance}* очков
-🎮 7 захватывающих игр
-🎁 Ежедневные бонусы\\!"""
-
-    await message.answer(text, reply_markup=main_kb())
-
-@dp.callback_query(F.data == "main")
-async def main_menu(callback: types.CallbackQuery):
-    balance = db.get_balance(callback.from_user.id)
-    text = f"🎰 *Главное меню*\n💰 Баланс: *{balance}* очков"
-    await callback.message.edit_text(text, reply_markup=main_kb())
-
-@dp.callback_query(F.data == "games")
-async def games_menu(callback: types.CallbackQuery):
-    text = """🎮 *Игры:*
-
-🪙 *Монетка* \\- ×2
-🎲 *Кости* \\- ×2 или ×5
-🎰 *Слоты* \\- ×3 или ×10
-🎯 *Рулетка* \\- ×2 или ×36"""
-    await callback.message.edit_text(text, reply_markup=games_kb())
-
-@dp.callback_query(F.data == "profile")
-async def profile(callback: types.CallbackQuery):
-    user = db.get_user(callback.from_user.id)
-    if user:
-        rate = (user[5] / user[4] * 100) if user[4] > 0 else 0
-        text = f"""👤 *Профиль*
-
-🆔 @{user[1] or 'Аноним'}
-💰 {user[2]} очков
-🎮 Игр: {user[4]}
-🏆 Побед: {user[5]}
-📊 Винрейт: {rate:.1f}%"""
-    else: text = "Ошибка"
-    await callback.message.edit_text(text, reply_markup=back_kb())
-
-@dp.callback_query(F.data == "bonus")
-async def bonus(callback: types.CallbackQuery):
-    user_id = callback.from_user.id
-    if db.can_bonus(user_id):
-        db.claim_bonus(user_id)
-        text = "🎁 *Бонус получен\\!*\n💰 \\+500 очков"
-    else:
-        text = "🎁 *Бонус*\n❌ Уже получен сегодня"
-    await callback.message.edit_text(text, reply_markup=back_kb())
-
-@dp.callback_query(F.data == "rating")
-async def rating(callback: types.CallbackQuery):
-    top = db.get_top(10)
-    text = "🏆 *ТОП\\-10*\n\n"
-    medals = ["🥇", "🥈", "🥉"]
-
-    for i, player in enumerate(top):
-        medal = medals[i] if i < 3 else f"{i+1}\\."
-        username = player[0] or "Аноним"
-        rate = (player[3] / player[2] * 100) if player[2] > 0 else 0
-        text += f"{medal} *{username}* \\- {player[1]} \\({rate:.0f}%\\)\n"
-
-    await callback.message.edit_text(text, reply_markup=back_kb())
-
-@dp.callback_query(F.data == "promo")
-async def promo(callback: types.CallbackQuery, state: FSMContext):
-    text = "🏷 *Введите промокод:*"
-    await callback.message.edit_text(text, reply_markup=back_kb())
-    await state.set_state(GameStates.promo_input)
-
-@dp.callback_query(F.data == "help")
-async def help_menu(callback: types.CallbackQuery):
-    text = """ℹ️ *Помощь*
-
-💰 Старт: 1000 очков
-🎁 Бонус: 500 очков/день
-🎮 Мин\\. ставка: 100 очков
-
-🎯 *Выплаты:*
-• Монетка: ×2
-• Кости: ×2/×5
-• Слоты: ×3/×10
-• Рулетка: ×2/×36"""
-    await callback.message.edit_text(text, reply_markup=back_kb())
-
-@dp.callback_query(F.data.startswith("game_"))
-async def game_start(callback: types.CallbackQuery, state: FSMContext):
-    game = callback.data.split("_")[1]
-    await state.update_data(game=game)
-    text = f"🎮 *{game.upper()}*\n💰 Введите ставку \\(мин\\. 100\\):"
-    await callback.message.edit_text(text, reply_markup=back_kb())
-    await state.set_state(GameStates.waiting_bet)
-
-@dp.message(GameStates.waiting_bet)
-async def handle_bet(message: Message, state: FSMContext):
-    try:
-        bet = int(message.text)
-        user_id = message.from_user.id
-        balance = db.get_balance(user_id)
-
-        if bet < 100:
-            await message.answer("❌ Минимум 100 очков!")
-            return
-        if bet > balance:
-            await message.answer("❌ Недостаточно средств!")
-            return
-
-        data = await state.get_data()
-        game = data['game']
-        db.update_balance(user_id, -bet)
-
-        if game == "coinflip":
-            kb = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🪙 Орёл", callback_data="choice_heads"),
-                 InlineKeyboardButton(text="🪙 Решка", callback_data="choice_tails")]
-            ])
-            await message.answer("🪙 Выберите:", reply_markup=kb)
-            await state.update_data(bet=bet)
-            await state.set_state(GameStates.waiting_choice)
-            return
-
-        elif game == "dice":
-            won, msg, mult = dice()
-        elif game == "slots":
-            anim = await message.answer("🎰 🎲 🎲")
-            await asyncio.sleep(0.5)
-            await anim.edit_text("🎰 🎰 🎲")
-            await asyncio.sleep(0.5)
-            await anim.edit_text("🎰 🎰 🎰")
-            await asyncio.sleep(0.5)
-            won, msg, mult = slots()
-            await anim.delete()
-        elif game == "roulette":
-            kb = InlineKeyboardMarkup(inline_keyboard=[
-                [InlineKeyboardButton(text="🔴 Красное", callback_data="roul_color_red"),
-                 InlineKeyboardButton(text="⚫ Чёрное", callback_data="roul_color_black")],
-                [InlineKeyboardButton(text="📈 Чёт", callback_data="roul_even"),
-                 InlineKeyboardButton(text="📉 Нечёт", callback_data="roul_odd")]
-            ])
-            await message.answer("🎯 Выберите:", reply_markup=kb)
-            await state.update_data(bet=bet)
-            await state.set_state(GameStates.waiting_choice)
-            return
-
-        result = int(bet * mult) if won else 0
-        if won: db.update_balance(user_id, result)
-        db.add_game(user_id, game, bet, result, mult)
-
-        final = f"{msg}\n\n"
-        final += f"🎉 Выигрыш: {result} очков!" if won else "😔 Проигрыш!"
-        await message.answer(final, reply_markup=back_kb())
-        await state.clear()
-
-    except ValueError:
-        await message.answer("❌ Введите число!")
-
-@dp.callback_query(F.data.startswith("choice_"))
-async def handle_choice(callback: types.CallbackQuery, state: FSMContext):
-    choice = callback.data.split("_")[1]
-    data = await state.get_data()
-    bet, game = data['bet'], data['game']
-    user_id = callback.from_user.id
-
-    won, msg, mult = coinflip(choice)
-    result = int(bet * mult) if won else 0
-    if won: db.update_balance(user_id, result)
-    db.add_game(user_id, game, bet, result, mult)
-
-    final = f"{msg}\n\n"
-    final += f"🎉 Выигрыш: {result} очков!" if won else "😔 Проигрыш!"
-    await callback.message.edit_text(final, reply_markup=back_kb())
-    await state.clear()
-
-@dp.callback_query(F.data.startswith("roul_"))
-async def handle_roulette(callback: types.CallbackQuery, state: FSMContext):
-    parts = callback.data.split("_")[1:]
-    data = await state.get_data()
-    bet = data['bet']
-    user_id = callback.from_user.id
-
-    bet_type = parts[0]
-    bet_value = parts[1] if len(parts) > 1 else None
-
-    won, msg, mult = roulette(bet_type, bet_value)
-    result = int(bet * mult) if won else 0
-    if won: db.update_balance(user_id, result)
-    db.add_game(user_id, "roulette", bet, result, mult)
-
-    final = f"{msg}\n\n"
-    final += f"🎉 Выигрыш: {result} очков!" if won else "😔 Проигрыш!"
-    await callback.message.edit_text(final, reply_markup=back_kb())
-    await state.clear()
-
-@dp.message(GameStates.promo_input)
-async def handle_promo(message: Message, state: FSMContext):
-    user_id = message.from_user.id
-    code = message.text.strip().upper()
-    success, msg = db.use_promo(user_id, code)
-    text = f"{'✅' if success else '❌'} {msg}"
-    await message.answer(text, reply_markup=back_kb())
-    await state.clear()
-
-# Админ команды
-@dp.message(Command("admin"))
-async def admin(message: Message):
-    if message.from_user.id != ADMIN_ID: return
-    await message.answer("👑 *Админ*\n\n/createpromo CODE REWARD\n/stats")
-
-@dp.message(Command("createpromo"))
-async def create_promo(message: Message):
-    if message.from_user.id != ADMIN_ID: return
-    try:
-        parts = message.text.split()
-        code, reward = parts[1].upper(), int(parts[2])
-        db.create_promo(code, reward, 999)
-        await message.answer(f"✅ Промокод {code} создан!")
-    except: await message.answer("❌ Формат: /createpromo CODE REWARD")
-
-@dp.message(Command("stats"))
-async def stats(message: Message):
-    if message.from_user.id != ADMIN_ID: return
-    c = db.conn.cursor()
-    users = c.execute('SELECT COUNT(*) FROM users').fetchone()[0]
-    games = c.execute('SELECT COUNT(*) FROM games').fetchone()[0]
-    bets = c.execute('SELECT SUM(bet) FROM games').fetchone()[0] or 0
-    wins = c.execute('SELECT SUM(result) FROM games').fetchone()[0] or 0
-
-    text = f"""📊 *Статистика*
-
-👥 Пользователей: {users}
-🎮 Игр: {games}
-💸 Ставок: {bets}
-🏆 Выплат: {wins}
-💰 Прибыль: {bets - wins}"""
-    await message.answer(text)
-
-async def main():
-    try:
-        print("🎰 Казино-бот запущен!")
-        await dp.start_polling(bot)
-    except Exception as e:
-        print(f"Ошибка: {e}")
-
-if __name__ == "__main__":
-    asyncio.run(main())
+import asyncio
+import logging
+import os
+import sys
+from dotenv import load_dotenv
+
+from aiogram import Bot, Dispatcher, types, F
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import Message
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+
+from animations import Animator
+from config import GAME_SETTINGS, OUTBOUND_SETTINGS, RATING_SETTINGS, SUPERVISOR_SETTINGS, WEBHOOK_SETTINGS
+from crash import CrashEngine
+from database import DB
+from fsm_storage import SQLiteStorage
+from locks import UserLocks
+from outbox import SendQueue
+from throttle import Throttle
+from markup import Markdown, md
+from ui import BACK_KB, BET_PROMPTS, CHOICE_KBS, GAMES_KB, MAIN_KB, TEXTS, fragment, rating_kb, render
+import rtp
+from games import GAMES
+
+load_dotenv()
+BOT_TOKEN = os.getenv("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
+ADMIN_ID = int(os.getenv("ADMIN_ID", "123456789"))
+# Вебхук вместо long polling: флаг --webhook или BOT_MODE=webhook
+WEBHOOK_MODE = "--webhook" in sys.argv or os.getenv("BOT_MODE") == "webhook"
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+# Воркер супервизора (python run.py run --workers N): апдейты своих игроков приходят
+# от супервизора на локальный вебхук, общая для всех воркеров - только база
+WORKER_MODE = "--worker" in sys.argv
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "1"))
+BOT_API_URL = os.getenv("BOT_API_URL")  # свой сервер Bot API вместо api.telegram.org
+
+logging.basicConfig(level=logging.INFO)
+session = AiohttpSession(api=TelegramAPIServer.from_base(BOT_API_URL)) if BOT_API_URL else None
+bot = Bot(token=BOT_TOKEN, session=session, parse_mode="MarkdownV2")
+# Все ответы бота идут через очередь с лимитами Telegram, лимит на бота делится между воркерами
+outbox = SendQueue({'global_rate': OUTBOUND_SETTINGS['global_rate'] / WORKER_COUNT,
+                    'global_burst': max(1, OUTBOUND_SETTINGS['global_burst'] // WORKER_COUNT)})
+bot.session.middleware(outbox)
+# База данных
+db = DB(os.getenv("DB_PATH", "casino.db"))
+# Состояния диалогов - в той же базе: переживают перезапуск и общие для всех процессов.
+# Брошенные ставки каждый воркер возвращает только своим игрокам
+storage = SQLiteStorage(db, {'partition': (WORKER_INDEX, WORKER_COUNT) if WORKER_COUNT > 1 else None})
+dp = Dispatcher(storage=storage)
+# Лимиты на игрока стоят до FSM: отброшенный апдейт не читает состояние и не доходит до базы
+throttle = Throttle()
+dp.update.outer_middleware.unregister(dp.fsm)
+dp.update.outer_middleware(throttle)
+dp.update.outer_middleware(dp.fsm)
+
+class GameStates(StatesGroup):
+    waiting_bet = State()
+    waiting_choice = State()
+    promo_input = State()
+
+user_locks = UserLocks()
+animator = Animator()
+# Игры с общим раундом в реальном времени: ставка уходит в движок, а не в game.play()
+crash_engine = CrashEngine(db, bot)
+live_games = {'crash': crash_engine}
+
+RATING_PAGE = RATING_SETTINGS['page_size']  # игроков на странице рейтинга
+
+async def pop_data(state):
+    """Забрать данные состояния и очистить его (в SQLiteStorage - одним запросом)"""
+    if isinstance(state.storage, SQLiteStorage):
+        return await state.storage.pop(state.key)
+    data = await state.get_data()
+    await state.clear()
+    return data
+
+async def stake(state, bet, data):
+    """Списать ставку и ждать выбора: списание и состояние со ставкой - одной транзакцией"""
+    if isinstance(state.storage, SQLiteStorage):
+        return await state.storage.stake(state.key, bet, GameStates.waiting_choice, data)
+    if not await db.place_bet(state.key.user_id, bet):
+        return False
+    await state.set_data(dict(data, bet=bet))
+    await state.set_state(GameStates.waiting_choice)
+    return True
+
+async def refund_data(state):
+    """Игрок ушёл из игры, не сделав выбор: очистить состояние и вернуть списанную ставку"""
+    if isinstance(state.storage, SQLiteStorage):
+        return await state.storage.refund(state.key)
+    bet = (await pop_data(state)).get('bet', 0)
+    if bet:
+        await db.update_balance(state.key.user_id, bet)
+    return bet
+
+# Обработчики
+@dp.message(Command("start"))
+async def start(message: Message):
+    user_id = message.from_user.id
+    username = message.from_user.username or message.from_user.first_name
+    await db.create_user(user_id, username)
+    balance = await db.get_balance(user_id)
+
+    await message.answer(render('start', balance=balance), reply_markup=MAIN_KB)
+
+@dp.callback_query(F.data == "main")
+async def main_menu(callback: types.CallbackQuery):
+    balance = await db.get_balance(callback.from_user.id)
+    await callback.message.edit_text(render('main_menu', balance=balance), reply_markup=MAIN_KB)
+
+@dp.callback_query(F.data == "games")
+async def games_menu(callback: types.CallbackQuery):
+    await callback.message.edit_text(TEXTS['games_menu'], reply_markup=GAMES_KB)
+
+@dp.callback_query(F.data == "profile")
+async def profile(callback: types.CallbackQuery):
+    user = await db.get_user(callback.from_user.id)
+    if user:
+        rate = (user[5] / user[4] * 100) if user[4] > 0 else 0
+        text = render('profile', username=user[1] or 'Аноним', balance=user[2], games=user[4], wins=user[5], rate=rate)
+    else: text = TEXTS['profile_error']
+    await callback.message.edit_text(text, reply_markup=BACK_KB)
+
+@dp.callback_query(F.data == "bonus")
+async def bonus(callback: types.CallbackQuery):
+    user_id = callback.from_user.id
+    if await db.can_bonus(user_id):
+        await db.claim_bonus(user_id)
+        text = TEXTS['bonus_received']
+    else:
+        text = TEXTS['bonus_denied']
+    await callback.message.edit_text(text, reply_markup=BACK_KB)
+
+async def rating_page(page):
+    """Страница рейтинга: (строки get_top, текст без места игрока)"""
+    offset = page * RATING_PAGE
+    top = await db.get_top(RATING_PAGE, offset)
+    if page == 0:
+        text = TEXTS['rating_top']
+    else:
+        text = render('rating_page', first=offset + 1, last=offset + RATING_PAGE)
+    medals = ["🥇", "🥈", "🥉"]
+
+    for i, player in enumerate(top, offset):
+        medal = medals[i] if i < 3 else f"{i+1}."
+        username = player[0] or "Аноним"
+        rate = (player[3] / player[2] * 100) if player[2] > 0 else 0
+        text += fragment('rating_line', medal=medal, username=username, balance=player[1], rate=rate)
+    return top, text
+
+@dp.callback_query(F.data.startswith("rating"))
+async def rating(callback: types.CallbackQuery):
+    page = int(callback.data.split("_")[1]) if "_" in callback.data else 0
+    # Первая страница - из снимка: пересобирается, только когда её могли задеть изменения
+    top, text = await db.top.get(lambda: rating_page(0)) if page == 0 else await rating_page(page)
+
+    rank, total = db.get_rank(callback.from_user.id)
+    if rank:
+        text += render('rating_rank', rank=rank, total=total)
+
+    await callback.message.edit_text(text, reply_markup=rating_kb(page, (page + 1) * RATING_PAGE < total))
+
+@dp.callback_query(F.data == "promo")
+async def promo(callback: types.CallbackQuery, state: FSMContext):
+    async with user_locks(callback.from_user.id):
+        await refund_data(state)
+        await state.set_state(GameStates.promo_input)
+    await callback.message.edit_text(TEXTS['promo_input'], reply_markup=BACK_KB)
+
+@dp.callback_query(F.data == "help")
+async def help_menu(callback: types.CallbackQuery):
+    await callback.message.edit_text(TEXTS['help'], reply_markup=BACK_KB)
+
+@dp.callback_query(F.data.startswith("game_"))
+async def game_start(callback: types.CallbackQuery, state: FSMContext):
+    game = callback.data.split("_", 1)[1]
+    if game not in GAMES: return
+    async with user_locks(callback.from_user.id):
+        # Ставка прежней игры, по которой не сделан выбор, возвращается
+        await refund_data(state)
+        await state.set_data({'game': game})
+        await state.set_state(GameStates.waiting_bet)
+    await callback.message.edit_text(BET_PROMPTS[game], reply_markup=BACK_KB)
+
+@dp.message(GameStates.waiting_bet)
+async def handle_bet(message: Message, state: FSMContext):
+    try:
+        bet = int(message.text)
+        user_id = message.from_user.id
+
+        if bet < GAME_SETTINGS['min_bet']:
+            await message.answer(TEXTS['min_bet_error'])
+            return
+        # Сверху ставку ограничивает и INTEGER в SQLite: больше не поместится в баланс
+        if bet > GAME_SETTINGS['max_bet']:
+            await message.answer(TEXTS['max_bet_error'])
+            return
+
+        # Проверка, списание и расчёт - строго по очереди для одного игрока
+        async with user_locks(user_id):
+            # Пока ждали блокировку, предыдущая ставка могла уже закрыть игру
+            if await state.get_state() != GameStates.waiting_bet:
+                return
+            data = await state.get_data()
+            game = GAMES.get(data.get('game'))
+            # Расчёт предыдущей ставки мог очистить данные между выбором игры и её состоянием
+            if game is None:
+                await state.clear()
+                return
+
+            engine = live_games.get(game.name)
+            if engine is not None:
+                # Табло и итог раунда присылает движок
+                joined, text = await engine.join(user_id, message.chat.id, bet)
+                if not joined:
+                    await message.answer(md(text))
+                    return
+                await state.clear()
+                return
+
+            if game.choices:
+                # Ставка списывается сразу, расчёт - после выбора
+                if not await stake(state, bet, data):
+                    await message.answer(TEXTS['no_funds'])
+                    return
+                await message.answer(game.prompt, reply_markup=CHOICE_KBS[game.name])
+                return
+
+            won, msg, mult = game.play()
+            result = await db.settle_round(user_id, game.name, bet, mult)
+            if result is None:
+                await message.answer(TEXTS['no_funds'])
+                return
+            await state.clear()
+
+        final = render('round_win', result=msg, amount=result) if won else render('round_lose', result=msg)
+        if game.frames:
+            # Раунд уже рассчитан: анимация идёт в фоне и сменяется итогом
+            animator.play(message, game.frames, final, reply_markup=BACK_KB)
+            return
+        await message.answer(final, reply_markup=BACK_KB)
+
+    except ValueError:
+        await message.answer(TEXTS['not_number'])
+
+@dp.callback_query(F.data.startswith("pick_"))
+async def handle_pick(callback: types.CallbackQuery, state: FSMContext):
+    choice = callback.data[len("pick_"):]
+    user_id = callback.from_user.id
+
+    async with user_locks(user_id):
+        # Старая или повторная кнопка выбора не должна стирать состояние другой игры
+        if await state.get_state() != GameStates.waiting_choice:
+            return
+        # Ставка забирается из состояния сразу: второй раз её не рассчитают
+        # ни повторное нажатие, ни возврат брошенных ставок
+        data = await pop_data(state)
+        game = GAMES.get(data.get('game'))
+        # Повторное нажатие после расчёта: ставки в состоянии уже нет
+        if game is None or 'bet' not in data:
+            return
+        if choice not in game.tables:
+            await state.set_data(data)
+            await state.set_state(GameStates.waiting_choice)
+            return
+        bet = data['bet']
+
+        won, msg, mult = game.play(choice)
+        result = await db.settle_round(user_id, game.name, bet, mult, prepaid=True)
+
+    final = render('round_win', result=msg, amount=result) if won else render('round_lose', result=msg)
+    await callback.message.edit_text(final, reply_markup=BACK_KB)
+
+@dp.callback_query(F.data == "crash_cashout")
+async def crash_cashout(callback: types.CallbackQuery):
+    # Вывод только отмечается, расчёт и итог - на ближайшем тике
+    mult = crash_engine.cashout(callback.from_user.id)
+    await callback.answer(f"💰 Вывод на ×{mult:.2f}" if mult else "Выводить нечего")
+
+@dp.message(GameStates.promo_input)
+async def handle_promo(message: Message, state: FSMContext):
+    user_id = message.from_user.id
+    code = message.text.strip().upper()
+    success, msg = await db.use_promo(user_id, code)
+    await message.answer(render('promo_result', mark='✅' if success else '❌', text=msg), reply_markup=BACK_KB)
+    await state.clear()
+
+# Админ команды
+@dp.message(Command("admin"))
+async def admin(message: Message):
+    if message.from_user.id != ADMIN_ID: return
+    await message.answer(TEXTS['admin'])
+
+@dp.message(Command("createpromo"))
+async def create_promo(message: Message):
+    if message.from_user.id != ADMIN_ID: return
+    try:
+        parts = message.text.split()
+        code, reward = parts[1].upper(), int(parts[2])
+        await db.create_promo(code, reward, 999)
+        await message.answer(render('promo_created', code=code))
+    except: await message.answer("❌ Формат: /createpromo CODE REWARD")
+
+@dp.message(Command("stats"))
+async def stats(message: Message):
+    if message.from_user.id != ADMIN_ID: return
+    users, games, bets, wins = await db.get_stats()
+
+    cache, out, anim = db.users.metrics(), outbox.metrics(), animator.metrics()
+    crash, limits, fsm = crash_engine.metrics(), throttle.metrics(), storage.metrics()
+    top, cheat = db.top.metrics(), db.anticheat.metrics()
+    history = render('stats_history', **db.history.metrics()) if db.history is not None else ""
+    # Выплаты могут превышать ставки: отрицательная прибыль экранируется шаблоном
+    text = render('stats', users=users, games=games, bets=bets, wins=wins, profit=bets - wins,
+                  cache_rate=cache['hit_rate'] * 100, cache_size=cache['size'], cache_capacity=cache['capacity'],
+                  history=history, queued=out['queued'], retried=out['retried'], merged=out['merged'],
+                  playing=anim['playing'], frames=anim['frames'], skipped=anim['dropped'],
+                  round=crash['round'], players=crash['players'], late_ticks=crash['late_ticks'], ticks=crash['ticks'],
+                  dropped=limits['dropped'], dropped_games=limits['dropped_games'],
+                  refunds=fsm['refunds'], refunded=fsm['refunded'],
+                  top_rate=top['hit_rate'] * 100, rebuilds=top['rebuilds'],
+                  flagged=cheat['flagged'], watched=cheat['users'], raised=cheat['raised'])
+    await message.answer(text)
+
+@dp.message(Command("rtp"))
+async def rtp_report(message: Message):
+    if message.from_user.id != ADMIN_ID: return
+    # Crash - по параметрам движка реального времени, остальные игры - перебором исходов PAYOUTS
+    lines = Markdown("\n".join(render('rtp_line', game=game, rtp=r['rtp'] * 100, edge=r['edge'] * 100)
+                               for game, r in rtp.report().items()))
+    await message.answer(render('rtp_report', lines=lines))
+
+async def refresh_leaderboard(interval):
+    # Воркер сам видит только балансы своих игроков, изменённые другими - дочитываются из базы
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await db.refresh_leaderboard()
+        except Exception as e:
+            logging.exception(f"Ошибка обновления рейтинга: {e}")
+
+async def main():
+    try:
+        await db.connect()
+        storage.start()
+        print("🎰 Казино-бот запущен!")
+        if WORKER_MODE:
+            from webhook import serve
+            if WORKER_COUNT > 1:
+                asyncio.create_task(refresh_leaderboard(SUPERVISOR_SETTINGS['leaderboard_refresh']))
+            settings = dict(WEBHOOK_SETTINGS, host='127.0.0.1', port=int(os.environ['WORKER_PORT']))
+            await serve(dp, bot, None, settings, os.environ['WORKER_SECRET'], register=False)
+        elif WEBHOOK_MODE:
+            from webhook import serve
+            settings = dict(WEBHOOK_SETTINGS,
+                            port=int(os.getenv("PORT", WEBHOOK_SETTINGS['port'])),
+                            max_concurrency=int(os.getenv("WEBHOOK_CONCURRENCY", WEBHOOK_SETTINGS['max_concurrency'])))
+            await serve(dp, bot, WEBHOOK_URL, settings, WEBHOOK_SECRET)
+        else:
+            await dp.start_polling(bot)
+    except Exception as e:
+        print(f"Ошибка: {e}")
+    finally:
+        await crash_engine.stop()
+        await storage.close()
+        await outbox.close()
+        await db.close()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass  # Ctrl+C до установки обработчиков сигналов
@@ -1,218 +1,377 @@
-# Дополнительные настройки казино-бота
-
-# Игровые настройки
-GAME_SETTINGS = {
-    'min_bet': 100,
-    'max_bet': 10000,
-    'daily_bonus': 500,
-    'start_balance': 1000,
-    'max_games_per_minute': 10,  # Анти-спам
-}
-
-# Коэффициенты выплат
-PAYOUTS = {
-    'coinflip': 2.0,
-    'dice': {
-        6: 5.0,
-        'high': 2.0,  # 4-5
-        'low': 0.0    # 1-3
-    },
-    'slots': {
-        'triple': 10.0,
-        'double': 3.0,
-        'nothing': 0.0
-    },
-    'roulette': {
-        'number': 36.0,
-        'color': 2.0,
-        'even_odd': 2.0
-    },
-    'blackjack': 2.0,
-    'crash_max': 100.0
-}
-
-# Символы для слотов
-SLOT_SYMBOLS = ['🍎', '🍊', '🍇', '🍋', '🍒', '⭐', '💎', '🔔']
-
-# Тексты сообщений
-MESSAGES = {
-    'welcome': """🎰 *Добро пожаловать в Казино\\-Бот\\!* 🎰
-
-💰 Стартовый баланс: {balance} очков
-🎮 7 захватывающих игр
-🎁 Ежедневные бонусы
-🏆 Соревнуйтесь в рейтинге\\!
-
-Удачи в игре\\! 🍀""",
-
-    'insufficient_funds': "❌ *Недостаточно средств\\!*\n💰 Ваш баланс: {balance} очков",
-    'min_bet_error': "❌ *Минимальная ставка {min_bet} очков\\!*",
-    'max_bet_error': "❌ *Максимальная ставка {max_bet} очков\\!*",
-
-    'bonus_claimed': """🎁 *Ежедневный бонус получен\\!* 🎁
-
-💰 \\+{bonus} очков к балансу\\!
-💳 Новый баланс: {balance} очков
-⏰ Следующий бонус через 24 часа""",
-
-    'bonus_already_claimed': """🎁 *Ежедневный бонус* 🎁
-
-❌ Бонус уже получен сегодня
-⏰ Возвращайтесь завтра за новым бонусом\\!
-💰 Текущий баланс: {balance} очков""",
-
-    'game_win': "🎉 *ВЫИГРЫШ\\!* 🎉\n💰 \\+{amount} очков",
-    'game_lose': "😔 *Неудача\\!*\n💸 \\-{amount} очков",
-
-    'promo_success': "✅ *Промокод активирован\\!*\n💰 \\+{reward} очков",
-    'promo_not_found': "❌ *Промокод не найден*",
-    'promo_used': "❌ *Промокод уже использован*",
-    'promo_expired': "❌ *Промокод исчерпан*"
-}
-
-# Эмодзи для рейтинга
-RATING_MEDALS = {
-    1: "🥇",
-    2: "🥈",
-    3: "🥉",
-    4: "🏅",
-    5: "🎖️"
-}
-
-# Настройки рулетки
-ROULETTE_COLORS = {
-    0: 'green',
-    # Красные числа
-    **{i: 'red' for i in [1,3,5,7,9,12,14,16,18,19,21,23,25,27,30,32,34,36]},
-    # Чёрные числа
-    **{i: 'black' for i in [2,4,6,8,10,11,13,15,17,20,22,24,26,28,29,31,33,35]}
-}
-
-# Настройки анти-чит системы
-ANTI_CHEAT = {
-    'max_games_per_hour': 200,
-    'max_win_rate': 0.85,  # 85% максимальный винрейт
-    'min_games_for_check': 20,
-    'suspicious_patterns': {
-        'same_bet_count': 50,  # одинаковая ставка 50 раз подряд
-        'rapid_fire': 5,       # 5 игр за 10 секунд
-    }
-}
-
-# Промокоды по умолчанию
-DEFAULT_PROMOS = {
-    'START2024': {'reward': 1000, 'max_uses': 1000},
-    'WELCOME': {'reward': 500, 'max_uses': 500},
-    'LUCKY777': {'reward': 777, 'max_uses': 77},
-    'BIGBONUS': {'reward': 2000, 'max_uses': 100},
-    'NEWBIE': {'reward': 1500, 'max_uses': 200},
-    'WEEKEND': {'reward': 800, 'max_uses': 300},
-    'SLOTS': {'reward': 600, 'max_uses': 150},
-    'ROULETTE': {'reward': 900, 'max_uses': 150},
-    'PREMIUM': {'reward': 5000, 'max_uses': 50}
-}
-
-# Настройки джекпота
-JACKPOT_SETTINGS = {
-    'min_participants': 3,
-    'min_bet': 500,
-    'auto_draw_threshold': 10,  # автоматический розыгрыш при 10 участниках
-    'commission': 0.05  # 5% комиссия казино
-}
-
-# Уровни VIP статуса (будущее расширение)
-VIP_LEVELS = {
-    0: {'name': 'Новичок', 'min_balance': 0, 'bonus_multiplier': 1.0},
-    1: {'name': 'Бронза', 'min_balance': 10000, 'bonus_multiplier': 1.2},
-    2: {'name': 'Серебро', 'min_balance': 50000, 'bonus_multiplier': 1.5},
-    3: {'name': 'Золото', 'min_balance': 100000, 'bonus_multiplier': 2.0},
-    4: {'name': 'Платина', 'min_balance': 500000, 'bonus_multiplier': 3.0},
-    5: {'name': 'Алмаз', 'min_balance': 1000000, 'bonus_multiplier': 5.0}
-}
-
-# Настройки логирования
-LOGGING_CONFIG = {
-    'level': 'INFO',
-    'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    'filename': 'casino_bot.log',
-    'max_bytes': 10*1024*1024,  # 10MB
-    'backup_count': 5
-}
-
-# Тайминги игр (в секундах)
-GAME_TIMINGS = {
-    'slots_animation': 0.5,
-    'roulette_spin': 2.0,
-    'crash_update': 0.1,
-    'blackjack_deal': 1.0
-}
-
-# Математические настройки
-PROBABILITY_SETTINGS = {
-    'dice': {
-        'six_chance': 1/6,
-        'high_chance': 2/6,  # 4-5
-        'low_chance': 3/6    # 1-3
-    },
-    'slots': {
-        'triple_chance': 0.02,   # 2%
-        'double_chance': 0.15,   # 15%
-        'nothing_chance': 0.83   # 83%
-    },
-    'crash': {
-        'min_multiplier': 1.01,
-        'max_multiplier': 100.0,
-        'crash_probability': 0.99  # 99% шанс краша
-    }
-}
-
-# Цвета для веб-интерфейса (если будет добавлен)
-UI_COLORS = {
-    'primary': '#FFD700',      # Золотой
-    'secondary': '#FF6B6B',    # Красный
-    'success': '#4ECDC4',      # Бирюзовый
-    'danger': '#FF4757',       # Красный
-    'warning': '#FFA726',      # Оранжевый
-    'info': '#5DADE2',         # Голубой
-    'dark': '#2F3542',         # Тёмный
-    'light': '#F1F2F6'         # Светлый
-}
-
-# Статистика для админа
-ADMIN_STATS_QUERIES = {
-    'daily_revenue': """
-        SELECT DATE(created_at) as date,
-               SUM(bet) as total_bets,
-               SUM(result) as total_payouts,
-               SUM(bet) - SUM(result) as profit
-        FROM games
-        WHERE created_at >= datetime('now', '-30 days')
-        GROUP BY DATE(created_at)
-        ORDER BY date DESC
-    """,
-
-    'popular_games': """
-        SELECT game_type,
-               COUNT(*) as games_count,
-               AVG(bet) as avg_bet,
-               SUM(bet) as total_bets,
-               SUM(result) as total_payouts
-        FROM games
-        GROUP BY game_type
-        ORDER BY games_count DESC
-    """,
-
-    'active_users': """
-        SELECT u.username,
-               u.balance,
-               COUNT(g.id) as games_played,
-               SUM(g.bet) as total_bet,
-               SUM(g.result) as total_won
-        FROM users u
-        LEFT JOIN games g ON u.user_id = g.user_id
-        WHERE g.created_at >= datetime('now', '-7 days')
-        GROUP BY u.user_id
-        ORDER BY games_played DESC
-        LIMIT 20
-    """
-}
+# Дополнительные настройки казино-бота
+
+# Игровые настройки
+GAME_SETTINGS = {
+    'min_bet': 100,
+    'max_bet': 10000,
+    'daily_bonus': 500,
+    'start_balance': 1000,
+    'max_games_per_minute': 10,  # Анти-спам
+}
+
+# Коэффициенты выплат
+PAYOUTS = {
+    'coinflip': 2.0,
+    'dice': {
+        6: 5.0,
+        'high': 2.0,  # 4-5
+        'low': 0.0    # 1-3
+    },
+    'slots': {
+        'triple': 10.0,
+        'double': 3.0,
+        'nothing': 0.0
+    },
+    'roulette': {
+        'number': 36.0,
+        'color': 2.0,
+        'even_odd': 2.0
+    },
+    'blackjack': 2.0,
+    'crash_max': 100.0
+}
+
+# Символы для слотов
+SLOT_SYMBOLS = ['🍎', '🍊', '🍇', '🍋', '🍒', '⭐', '💎', '🔔']
+
+# Тексты сообщений
+MESSAGES = {
+    'welcome': """🎰 *Добро пожаловать в Казино\\-Бот\\!* 🎰
+
+💰 Стартовый баланс: {balance} очков
+🎮 7 захватывающих игр
+🎁 Ежедневные бонусы
+🏆 Соревнуйтесь в рейтинге\\!
+
+Удачи в игре\\! 🍀""",
+
+    'insufficient_funds': "❌ *Недостаточно средств\\!*\n💰 Ваш баланс: {balance} очков",
+    'min_bet_error': "❌ *Минимальная ставка {min_bet} очков\\!*",
+    'max_bet_error': "❌ *Максимальная ставка {max_bet} очков\\!*",
+
+    'bonus_claimed': """🎁 *Ежедневный бонус получен\\!* 🎁
+
+💰 \\+{bonus} очков к балансу\\!
+💳 Новый баланс: {balance} очков
+⏰ Следующий бонус через 24 часа""",
+
+    'bonus_already_claimed': """🎁 *Ежедневный бонус* 🎁
+
+❌ Бонус уже получен сегодня
+⏰ Возвращайтесь завтра за новым бонусом\\!
+💰 Текущий баланс: {balance} очков""",
+
+    'game_win': "🎉 *ВЫИГРЫШ\\!* 🎉\n💰 \\+{amount} очков",
+    'game_lose': "😔 *Неудача\\!*\n💸 \\-{amount} очков",
+
+    'promo_success': "✅ *Промокод активирован\\!*\n💰 \\+{reward} очков",
+    'promo_not_found': "❌ *Промокод не найден*",
+    'promo_used': "❌ *Промокод уже использован*",
+    'promo_expired': "❌ *Промокод исчерпан*",
+
+    # Экраны бота: ui.py собирает их один раз при запуске.
+    # {count}, {games}, {title}, {min_bet}, {max_bet} и {page_size} подставляются тогда же, остальное - при ответе.
+    # Разметка шаблона пишется вручную, значения полей экранирует markup.Template
+    'start': """🎰 *Казино\\-Бот* 🎰
+
+💰 Баланс: *{balance}* очков
+🎮 {count} захватывающих игр
+🎁 Ежедневные бонусы\\!""",
+    'main_menu': "🎰 *Главное меню*\n💰 Баланс: *{balance}* очков",
+    'games_menu': "🎮 *Игры:*\n\n{games}",
+    'profile': """👤 *Профиль*
+
+🆔 @{username}
+💰 {balance} очков
+🎮 Игр: {games}
+🏆 Побед: {wins}
+📊 Винрейт: {rate:.1f}%""",
+    'profile_error': "Ошибка",
+    'bonus_received': "🎁 *Бонус получен\\!*\n💰 \\+500 очков",
+    'bonus_denied': "🎁 *Бонус*\n❌ Уже получен сегодня",
+    'rating_top': "🏆 *ТОП\\-{page_size}*\n\n",
+    'rating_page': "🏆 *Рейтинг: {first}\\-{last}*\n\n",
+    'rating_line': "{medal} *{username}* \\- {balance} \\({rate:.0f}%\\)\n",
+    'rating_rank': "\n📍 Ваше место: {rank} из {total}",
+    'promo_input': "🏷 *Введите промокод:*",
+    'promo_result': "{mark} {text}",
+    'promo_created': "✅ Промокод {code} создан\\!",
+    'help': """ℹ️ *Помощь*
+
+💰 Старт: 1000 очков
+🎁 Бонус: 500 очков/день
+🎮 Мин\\. ставка: {min_bet} очков
+
+🎯 *Выплаты:*
+{games}""",
+    'bet_prompt': "🎮 *{title}*\n💰 Введите ставку \\(мин\\. {min_bet}\\):",
+    'no_funds': "❌ Недостаточно средств\\!",
+    'not_number': "❌ Введите число\\!",
+    'round_win': "{result}\n\n🎉 Выигрыш: {amount} очков\\!",
+    'round_lose': "{result}\n\n😔 Проигрыш\\!",
+    'admin': "👑 *Админ*\n\n/createpromo CODE REWARD\n/stats",
+    'stats': """📊 *Статистика*
+
+👥 Пользователей: {users}
+🎮 Игр: {games}
+💸 Ставок: {bets}
+🏆 Выплат: {wins}
+💰 Прибыль: {profit}
+
+🧠 Кэш игроков: {cache_rate:.0f}% попаданий \\({cache_size}/{cache_capacity}\\){history}
+📤 Очередь отправки: {queued}, повторов после 429: {retried}, правок слито: {merged}
+🎞 Анимации: {playing} идёт, кадров {frames}, пропущено {skipped}
+📈 Crash: раунд {round}, игроков {players}, опоздавших тиков {late_ticks}/{ticks}
+🚦 Отброшено апдейтов: {dropped}, нажатий на игры: {dropped_games}
+↩️ Брошенных ставок возвращено: {refunds} на {refunded} очков
+🏆 Снимок рейтинга: {top_rate:.0f}% попаданий, пересборок {rebuilds}
+🕵 Анти\\-чит: под подозрением {flagged} из {watched}, флагов {raised}""",
+    'stats_history': "\n\n📝 Очередь истории: {queue_depth}\n⏱ Запись пачки: {avg_flush_ms:.0f}/{max_flush_ms:.0f} мс",
+    'rtp_report': "📐 *Точный RTP*\n\n{lines}",
+    'rtp_line': "{game}: {rtp:.2f}% \\(преимущество {edge:.2f}%\\)"
+}
+
+# Эмодзи для рейтинга
+RATING_MEDALS = {
+    1: "🥇",
+    2: "🥈",
+    3: "🥉",
+    4: "🏅",
+    5: "🎖️"
+}
+
+# Настройки рулетки
+ROULETTE_COLORS = {
+    0: 'green',
+    # Красные числа
+    **{i: 'red' for i in [1,3,5,7,9,12,14,16,18,19,21,23,25,27,30,32,34,36]},
+    # Чёрные числа
+    **{i: 'black' for i in [2,4,6,8,10,11,13,15,17,20,22,24,26,28,29,31,33,35]}
+}
+
+# Настройки анти-чит системы
+ANTI_CHEAT = {
+    'max_games_per_hour': 200,
+    'max_win_rate': 0.85,  # 85% максимальный винрейт
+    'min_games_for_check': 20,
+    'suspicious_patterns': {
+        'same_bet_count': 50,  # одинаковая ставка 50 раз подряд
+        'rapid_fire': 5,       # 5 игр за 10 секунд
+    },
+    'rapid_fire_seconds': 10,
+    'win_rate_window': 100,    # винрейт считается по последним 100 играм
+    'checkpoint_interval': 60, # сохранение состояния в базу, сек (0 - только при остановке)
+    'cache_size': 10000,       # игроков в памяти после сохранения, остальные - в anticheat_state
+    'idle_ttl': 3600           # не игравшие дольше, сек, выгружаются при сохранении
+}
+
+# Промокоды по умолчанию
+DEFAULT_PROMOS = {
+    'START2024': {'reward': 1000, 'max_uses': 1000},
+    'WELCOME': {'reward': 500, 'max_uses': 500},
+    'LUCKY777': {'reward': 777, 'max_uses': 77},
+    'BIGBONUS': {'reward': 2000, 'max_uses': 100},
+    'NEWBIE': {'reward': 1500, 'max_uses': 200},
+    'WEEKEND': {'reward': 800, 'max_uses': 300},
+    'SLOTS': {'reward': 600, 'max_uses': 150},
+    'ROULETTE': {'reward': 900, 'max_uses': 150},
+    'PREMIUM': {'reward': 5000, 'max_uses': 50}
+}
+
+# Настройки джекпота
+JACKPOT_SETTINGS = {
+    'min_participants': 3,
+    'min_bet': 500,
+    'auto_draw_threshold': 10,  # автоматический розыгрыш при 10 участниках
+    'commission': 0.05  # 5% комиссия казино
+}
+
+# Уровни VIP статуса (будущее расширение)
+VIP_LEVELS = {
+    0: {'name': 'Новичок', 'min_balance': 0, 'bonus_multiplier': 1.0},
+    1: {'name': 'Бронза', 'min_balance': 10000, 'bonus_multiplier': 1.2},
+    2: {'name': 'Серебро', 'min_balance': 50000, 'bonus_multiplier': 1.5},
+    3: {'name': 'Золото', 'min_balance': 100000, 'bonus_multiplier': 2.0},
+    4: {'name': 'Платина', 'min_balance': 500000, 'bonus_multiplier': 3.0},
+    5: {'name': 'Алмаз', 'min_balance': 1000000, 'bonus_multiplier': 5.0}
+}
+
+# Настройки логирования
+LOGGING_CONFIG = {
+    'level': 'INFO',
+    'format': '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    'filename': 'casino_bot.log',
+    'max_bytes': 10*1024*1024,  # 10MB
+    'backup_count': 5
+}
+
+# Профиль хранилища SQLite
+STORAGE_SETTINGS = {
+    'journal_mode': 'WAL',       # читатели не блокируют запись
+    'synchronous': 'NORMAL',     # в WAL fsync только на checkpoint
+    'cache_size_kb': 16384,      # кэш страниц на соединение
+    'mmap_size': 64*1024*1024,   # 64MB
+    'busy_timeout_ms': 5000,
+    'read_pool_size': 4,         # read-only соединения для статистики и рейтинга
+    'user_cache_size': 10000,    # LRU-кэш строк users (0 - выключен)
+    # Групповая запись истории игр (балансы всегда пишутся сразу)
+    'history_batch': False,
+    'history_batch_size': 200,   # сброс по количеству записей
+    'history_flush_ms': 100      # или по времени
+}
+
+# Состояния диалогов в базе (fsm_storage.py): общие для всех процессов бота
+FSM_SETTINGS = {
+    'ttl': 900,              # брошенное состояние удаляется через 15 минут без действий
+    'sweep_interval': 60,    # проверка истёкших состояний, сек
+    'partition': None        # (номер воркера, всего воркеров) - задаёт bot.py в режиме воркера
+}
+
+# Несколько процессов бота (python run.py run --workers N, supervisor.py)
+SUPERVISOR_SETTINGS = {
+    'workers': 2,
+    'base_port': 8100,          # воркер i слушает 127.0.0.1:base_port + i
+    'poll_timeout': 30,         # long polling супервизора, сек
+    'restart_delay': 1.0,       # пауза перед перезапуском упавшего воркера
+    'leaderboard_refresh': 10   # воркер дочитывает в рейтинг балансы, изменённые другими, сек
+}
+
+# Рейтинг
+RATING_SETTINGS = {
+    'page_size': 10,
+    'cache_ttl': 30   # снимок первой страницы обновляется не реже, сек
+}
+
+# Режим вебхука (python bot.py --webhook или BOT_MODE=webhook)
+WEBHOOK_SETTINGS = {
+    'host': '0.0.0.0',
+    'port': 8080,             # перекрывается переменной PORT
+    'path': '/webhook',
+    'max_concurrency': 64     # обработчиков одновременно (WEBHOOK_CONCURRENCY)
+}
+
+# Очередь исходящих сообщений (лимиты Telegram)
+OUTBOUND_SETTINGS = {
+    # За любую секунду уходит не больше rate + burst: 3 в чат и 30 на бота
+    'chat_rate': 1.0,      # сообщений в секунду в один чат
+    'chat_burst': 2,       # короткий всплеск в чат
+    'global_rate': 25.0,   # сообщений в секунду на бота
+    'global_burst': 5,
+    'max_retries': 3       # повторов после 429 (кадры анимации не повторяются)
+}
+
+# Входящие апдейты (throttle.py): лишнее отбрасывается до FSM и базы
+THROTTLE_SETTINGS = {
+    'update_rate': 2.0,       # апдейтов в секунду от игрока в среднем
+    'update_burst': 10,       # подряд без паузы
+    'games_per_minute': GAME_SETTINGS['max_games_per_minute'],  # нажатий на игру в меню
+    'game_burst': 3,
+    'notify': "⏳ Слишком часто, подождите"  # ответ на отброшенное нажатие кнопки ('' - молча)
+}
+
+# Тайминги игр (в секундах)
+GAME_TIMINGS = {
+    'slots_animation': 0.5,         # пауза между кадрами
+    'animation_min_interval': 0.3,  # кадр чаще этого в один чат пропускается
+    'roulette_spin': 2.0,
+    'crash_update': 0.1,
+    'blackjack_deal': 1.0
+}
+
+# Crash в реальном времени (crash.py): общий раунд, тик - GAME_TIMINGS['crash_update']
+CRASH_SETTINGS = {
+    'betting_time': 10.0,         # приём ставок после первой ставки раунда
+    'pause': 3.0,                 # пауза между раундами
+    'growth': 0.06,               # множитель = e^(growth * t): ×2 за 11.5 сек, ×100 за 77 сек
+    'house_edge': 0.01,           # P(краш >= m) = (1 - house_edge) / m при любом выводе
+    'max_multiplier': PAYOUTS['crash_max'],
+    'messages_per_second': 20.0,  # новых табло и правок на бота (итоги раундов - вне бюджета)
+    'edit_interval': 1.0          # правка табло одного игрока не чаще
+}
+
+# Математические настройки (фактические шансы игр из bot.py и extra_games.py)
+PROBABILITY_SETTINGS = {
+    'dice': {
+        'six_chance': 1/6,
+        'high_chance': 2/6,  # 4-5
+        'low_chance': 3/6    # 1-3
+    },
+    'slots': {
+        'triple_chance': 8/512,     # 1.6%: 8 символов SLOT_SYMBOLS, 3 барабана
+        'double_chance': 168/512,   # 32.8%
+        'nothing_chance': 336/512   # 65.6%
+    },
+    'crash': {
+        'min_multiplier': 1.0,
+        'max_multiplier': 5.99,     # точка краша 1.00-5.99 с шагом 0.01
+        'max_auto_cashout': 3.99    # автовывод 1.00-3.99
+    }
+}
+
+# Ожидаемое преимущество казино (1 - RTP) по играм и видам ставок.
+# Проверяется симуляцией: python simulate.py --check; отрицательное - игра в плюс игроку
+HOUSE_EDGE = {
+    'coinflip': 0.0,
+    'dice': -0.5,                # RTP 150%
+    'slots': -9/64,              # RTP 114.1%
+    'roulette_number': 1/37,
+    'roulette_color': 1/37,
+    'roulette_even': 1/37,
+    'roulette_odd': 1/37,
+    'blackjack': 0.0,            # ничья возвращает ставку, выигрыш и проигрыш симметричны
+    'crash': CRASH_SETTINGS['house_edge']  # Crash в реальном времени, RTP 99% (rtp.live_crash)
+}
+
+# Допустимое расхождение измеренного преимущества с HOUSE_EDGE
+RTP_TOLERANCE = 0.002
+
+# Цвета для веб-интерфейса (если будет добавлен)
+UI_COLORS = {
+    'primary': '#FFD700',      # Золотой
+    'secondary': '#FF6B6B',    # Красный
+    'success': '#4ECDC4',      # Бирюзовый
+    'danger': '#FF4757',       # Красный
+    'warning': '#FFA726',      # Оранжевый
+    'info': '#5DADE2',         # Голубой
+    'dark': '#2F3542',         # Тёмный
+    'light': '#F1F2F6'         # Светлый
+}
+
+# Статистика для админа (читается из сводных таблиц, а не из всей истории games)
+ADMIN_STATS_QUERIES = {
+    'daily_revenue': """
+        SELECT day as date,
+               SUM(bets) as total_bets,
+               SUM(payouts) as total_payouts,
+               SUM(bets) - SUM(payouts) as profit
+        FROM stats_daily
+        WHERE day >= DATE('now', '-30 days')
+        GROUP BY day
+        ORDER BY date DESC
+    """,
+
+    'popular_games': """
+        SELECT game_type,
+               SUM(games) as games_count,
+               SUM(bets) * 1.0 / SUM(games) as avg_bet,
+               SUM(bets) as total_bets,
+               SUM(payouts) as total_payouts
+        FROM stats_daily
+        GROUP BY game_type
+        ORDER BY games_count DESC
+    """,
+
+    'active_users': """
+        SELECT u.username,
+               u.balance,
+               SUM(s.games) as games_played,
+               SUM(s.bets) as total_bet,
+               SUM(s.payouts) as total_won
+        FROM stats_user_daily s
+        JOIN users u ON u.user_id = s.user_id
+        WHERE s.day >= DATE('now', '-7 days')
+        GROUP BY s.user_id
+        ORDER BY games_played DESC
+        LIMIT 20
+    """
+}
\ No newline at end of file
@@ -0,0 +1,388 @@
+# Crash в реальном времени
+# Один раунд на всех игроков: общий тикер раз в GAME_TIMINGS['crash_update'] секунд
+# поднимает множитель и рассчитывает выводы, отдельная задача обновляет табло игроков.
+# Вывод - отметка за O(1), расчёт - на ближайшем тике: все ставки и все выводы тика
+# проходят одной транзакцией, сообщения табло ограничены бюджетом под лимиты Telegram
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import time
+from collections import deque
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+import rng
+from config import CRASH_SETTINGS, GAME_SETTINGS, GAME_TIMINGS
+from outbox import LOW, NORMAL, priority
+
+IDLE, BETTING, RUNNING = 'idle', 'betting', 'running'
+WORD = 1 << 32
+
+CASHOUT_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [InlineKeyboardButton(text="💰 Забрать", callback_data="crash_cashout")]
+])
+
+def crash_point(house_edge, max_multiplier, randbelow=rng.randbelow):
+    """Точка краша с P(краш >= m) = (1 - house_edge) / m: RTP любого вывода - 1 - house_edge"""
+    u = randbelow(WORD)
+    cents = int((1 - house_edge) * 100 * WORD) // (WORD - u)
+    return min(max(cents, 100), round(max_multiplier * 100)) / 100
+
+class Player:
+    __slots__ = ('user_id', 'chat_id', 'bet', 'auto', 'message_id', 'opened', 'cashed', 'settled',
+                 'final', 'editing', 'shown')
+
+    def __init__(self, user_id, chat_id, bet, auto=None):
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.bet = bet
+        self.auto = auto
+        self.message_id = None  # табло, пока не отправлено - None
+        self.opened = False     # первое сообщение игроку уже отправляется
+        self.cashed = None      # множитель вывода
+        self.settled = False
+        self.final = None       # итог раунда
+        self.editing = False
+        self.shown = 0.0        # время последней правки табло
+
+class CrashEngine:
+    """Общий раунд Crash: приём ставок, тикер множителя, выводы и табло игроков"""
+    def __init__(self, db, bot, settings=None, tick=None, draw=None):
+        self.db = db
+        self.bot = bot
+        self.settings = dict(CRASH_SETTINGS, **(settings or {}))
+        self.tick = GAME_TIMINGS['crash_update'] if tick is None else tick
+        self.draw = draw or (lambda: crash_point(self.settings['house_edge'], self.settings['max_multiplier']))
+        self.phase = IDLE
+        self.round = 0
+        self.crash = None
+        self.closes = 0.0      # время конца приёма ставок (loop.time)
+        self.multiplier = 1.0
+        self.players = {}      # user_id -> Player текущего раунда
+        self.joins = []        # (Player, future): ставки до списания на ближайшем тике
+        self.joining = set()   # user_id из joins
+        self.cashouts = []     # ручные выводы до расчёта на ближайшем тике
+        self.autos = []        # куча (автовывод, seq, user_id)
+        self.pending = deque() # игроки, которым ещё не ушло первое сообщение (табло или итог)
+        self.board = deque()   # открытые табло в очереди на правку
+        self.seq = itertools.count()
+        self.tokens = 0.0
+        self.next_tick = 0.0
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.pump = None
+        self.tasks = set()
+        # Метрики
+        self.ticks = 0
+        self.late = 0
+        self.lags = deque(maxlen=1000)
+        self.transactions = 0
+        self.settled = 0
+        self.max_settle_ms = 0.0
+        self.messages = 0
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def join(self, user_id, chat_id, bet, auto=None):
+        """Ставка в ближайший раунд, списывается на ближайшем тике. Возвращает (принята, текст)"""
+        if self.phase == RUNNING:
+            return False, "⏳ Раунд уже идёт, дождитесь следующего"
+        if user_id in self.players or user_id in self.joining:
+            return False, "❌ Вы уже в этом раунде"
+        # Ставки раунда списываются одним запросом: недопустимая (вне INTEGER SQLite) сорвала бы всю пачку
+        if not GAME_SETTINGS['min_bet'] <= bet <= GAME_SETTINGS['max_bet']:
+            return False, f"❌ Ставка от {GAME_SETTINGS['min_bet']} до {GAME_SETTINGS['max_bet']} очков"
+        if auto is not None and not 1.01 <= auto <= self.settings['max_multiplier']:
+            return False, f"❌ Автовывод от ×1.01 до ×{self.settings['max_multiplier']:g}"
+        future = asyncio.get_running_loop().create_future()
+        self.joins.append((Player(user_id, chat_id, bet, auto), future))
+        self.joining.add(user_id)
+        self.start()
+        self.wakeup.set()
+        return await future
+
+    def cashout(self, user_id):
+        """Вывод по текущему множителю. Возвращает множитель или None, если выводить нечего"""
+        player = self.players.get(user_id) if self.phase == RUNNING else None
+        if player is None or player.cashed is not None:
+            return None
+        player.cashed = self.multiplier
+        self.cashouts.append(player)
+        return player.cashed
+
+    async def run(self):
+        while True:
+            # Ставки, сделанные во время раунда, отклонены - ждём новую
+            if not self.joins:
+                self.wakeup.clear()
+            await self.wakeup.wait()
+            try:
+                await self.play_round()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Ошибка раунда Crash")
+                await self.abort()
+            await asyncio.sleep(self.settings['pause'])
+
+    async def play_round(self):
+        loop = asyncio.get_running_loop()
+        self.round += 1
+        self.crash = self.draw()
+        self.multiplier = 1.0
+        self.phase = BETTING
+        self.next_tick = loop.time()
+        self.closes = self.next_tick + self.settings['betting_time']
+
+        # Приём ставок: списываются пачкой на каждом тике
+        while self.phase == BETTING:
+            await self.wait_tick()
+            if loop.time() >= self.closes:
+                # Фаза меняется до последнего списания: поздние ставки уже не примутся
+                self.phase = RUNNING
+            await self.flush_joins()
+        if not self.players:
+            self.phase = IDLE
+            return
+
+        started = self.next_tick = loop.time()
+        while self.phase == RUNNING:
+            await self.wait_tick()
+            await self.step(loop.time() - started)
+        self.players = {}
+        self.autos = []
+        self.board.clear()
+
+    async def wait_tick(self):
+        """Сон до следующего тика без накопления дрейфа; отставание больше тика не догоняется"""
+        loop = asyncio.get_running_loop()
+        self.next_tick += self.tick
+        delay = self.next_tick - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        lag = loop.time() - self.next_tick
+        self.ticks += 1
+        self.lags.append(lag)
+        if lag > self.tick:
+            self.late += 1
+            self.next_tick = loop.time()
+
+    async def flush_joins(self):
+        if not self.joins:
+            return
+        joins, self.joins = self.joins, []
+        self.joining.clear()
+        try:
+            accepted = await self.db.place_bets([(player.user_id, player.bet) for player, _ in joins])
+        except Exception:
+            for _, future in joins:
+                future.set_result((False, "❌ Ошибка, попробуйте ещё раз"))
+            raise
+        self.transactions += 1
+        for player, future in joins:
+            if player.user_id not in accepted:
+                future.set_result((False, "❌ Недостаточно средств!"))
+                continue
+            self.players[player.user_id] = player
+            if player.auto is not None:
+                heapq.heappush(self.autos, (player.auto, next(self.seq), player.user_id))
+            self.pending.append(player)
+            future.set_result((True, "✅ Ставка принята"))
+        self.start_pump()
+
+    async def step(self, elapsed):
+        """Тик полёта: новый множитель, автовыводы, краш и расчёт одной транзакцией"""
+        m = math.floor(100 * math.exp(self.settings['growth'] * elapsed)) / 100
+        crashed = m >= self.crash
+        if crashed:
+            m = self.crash
+            # До первого await: выводы после краша не принимаются
+            self.phase = IDLE
+        rows = [(player, player.cashed) for player in self.cashouts]
+        self.cashouts = []
+        # Автовывод срабатывает на своём множителе, если краш случился позже
+        while self.autos and (self.autos[0][0] < m if crashed else self.autos[0][0] <= m):
+            auto, _, user_id = heapq.heappop(self.autos)
+            player = self.players[user_id]
+            if player.cashed is None:
+                player.cashed = auto
+                rows.append((player, auto))
+        if crashed:
+            rows += [(player, 0.0) for player in self.players.values() if player.cashed is None]
+        else:
+            self.multiplier = m
+        await self.settle(rows)
+
+    async def settle(self, rows):
+        if not rows:
+            return
+        start = time.perf_counter()
+        results = await self.db.settle_rounds([(p.user_id, 'crash', p.bet, mult) for p, mult in rows])
+        self.max_settle_ms = max(self.max_settle_ms, (time.perf_counter() - start) * 1000)
+        self.transactions += 1
+        self.settled += len(rows)
+        for (player, mult), result in zip(rows, results):
+            player.settled = True
+            if player.final is not None:
+                pass  # текст задан заранее (возврат ставки)
+            elif mult == 0:
+                player.final = f"💥 Crash на ×{self.crash:.2f}\n😔 Проигрыш!"
+            else:
+                player.final = f"✅ Вывели на ×{mult:.2f}\n🎉 Выигрыш: {result} очков!"
+            # Без табло итог уйдёт первым сообщением из pending
+            if player.message_id is not None:
+                self.spawn(self.show(player, player.final))
+        self.start_pump()
+
+    async def abort(self):
+        """Вернуть ставки незавершённого раунда (ошибка или остановка бота)"""
+        self.phase = IDLE
+        for _, future in self.joins:
+            if not future.done():
+                future.set_result((False, "❌ Раунд прерван"))
+        self.joins = []
+        self.joining.clear()
+        rows = []
+        for player in self.players.values():
+            if not player.settled:
+                if player.cashed is None:
+                    player.cashed = 1.0
+                    player.final = f"↩️ Раунд прерван, ставка {player.bet} возвращена"
+                rows.append((player, player.cashed))
+        self.cashouts = []
+        try:
+            await self.settle(rows)
+        except Exception:
+            logging.exception("Не удалось вернуть ставки Crash")
+        self.players = {}
+        self.autos = []
+        self.board.clear()
+
+    def start_pump(self):
+        if self.pump is None or self.pump.done():
+            self.pump = self.spawn(self.deliver())
+
+    async def deliver(self):
+        """Сообщения табло раз в тик, пока идёт раунд или кому-то не ушёл итог.
+        Отдельная задача: отправка не задерживает тикер раунда"""
+        while self.pending or self.phase != IDLE:
+            await asyncio.sleep(self.tick)
+            self.broadcast()
+
+    def broadcast(self):
+        """Бюджет сообщений на тик: сначала первые сообщения игрокам (табло или итог),
+        затем правки открытых табло по кругу, не чаще edit_interval каждому"""
+        rate = self.settings['messages_per_second']
+        self.tokens = min(self.tokens + rate * self.tick, max(rate * self.tick, 1.0))
+        while self.pending and self.tokens >= 1:
+            player = self.pending.popleft()
+            player.opened = True
+            self.tokens -= 1
+            if player.final is not None:
+                self.spawn(self.open_board(player, player.final))
+            else:
+                self.board.append(player)
+                self.spawn(self.open_board(player, self.status_text(player), CASHOUT_KB))
+        if self.phase != RUNNING:
+            return
+        now = time.monotonic()
+        for _ in range(len(self.board)):
+            if self.tokens < 1:
+                break
+            player = self.board.popleft()
+            if player.cashed is not None:
+                continue  # выбывшие из очереди табло не возвращаются
+            self.board.append(player)
+            if player.message_id is None or player.editing or now - player.shown < self.settings['edit_interval']:
+                continue
+            self.tokens -= 1
+            self.spawn(self.show(player, self.status_text(player), live=True))
+
+    def status_text(self, player):
+        if self.phase == BETTING:
+            left = max(self.closes - asyncio.get_running_loop().time(), 0)
+            return f"💰 Ставка: {player.bet}\n⏳ Старт через {left:.0f} сек"
+        text = f"📈 ×{self.multiplier:.2f}\n💰 Ставка {player.bet} → {int(player.bet * self.multiplier)}"
+        if player.auto is not None:
+            text += f"\n🎯 Автовывод ×{player.auto:.2f}"
+        return text
+
+    async def open_board(self, player, text, reply_markup=None):
+        """Первое сообщение игроку: табло с кнопкой вывода или сразу итог"""
+        try:
+            message = await self.bot.send_message(player.chat_id, f"📈 Crash, раунд {self.round}\n{text}",
+                                                   reply_markup=reply_markup, parse_mode=None)
+            self.messages += 1
+        except Exception:
+            logging.exception("Не удалось отправить табло Crash")
+            return
+        player.message_id = message.message_id
+        player.shown = time.monotonic()
+        if reply_markup is not None and player.final is not None:
+            # Раунд рассчитан, пока табло было в пути
+            await self.show(player, player.final)
+
+    async def show(self, player, text, live=False):
+        """Правка табло: живые обновления - кадры LOW, итог - обычный приоритет"""
+        player.editing = True
+        player.shown = time.monotonic()
+        try:
+            with priority(LOW if live else NORMAL):
+                await self.bot.edit_message_text(text, chat_id=player.chat_id, message_id=player.message_id,
+                                                 reply_markup=CASHOUT_KB if live else None, parse_mode=None)
+            self.messages += 1
+        except (TelegramRetryAfter, TelegramBadRequest):
+            if not live:
+                logging.warning(f"Итог Crash не доставлен в чат {player.chat_id}")
+        except Exception:
+            logging.exception("Ошибка правки табло Crash")
+        finally:
+            player.editing = False
+
+    def spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def drain(self):
+        """Дождаться отправки табло и итогов"""
+        while self.tasks:
+            await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        await self.abort()
+        # Итоги возврата - пока очередь отправки ещё работает
+        if self.tasks:
+            await asyncio.wait(list(self.tasks), timeout=5)
+        for task in list(self.tasks):
+            task.cancel()
+
+    def metrics(self):
+        lags = sorted(self.lags)
+        return {
+            'phase': self.phase,
+            'round': self.round,
+            'players': len(self.players),
+            'pending': len(self.pending),
+            'ticks': self.ticks,
+            'late_ticks': self.late,
+            'p99_lag_ms': lags[int(len(lags) * 0.99)] * 1000 if lags else 0.0,
+            'transactions': self.transactions,
+            'settled': self.settled,
+            'max_settle_ms': self.max_settle_ms,
+            'messages': self.messages
+        }
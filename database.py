@@ -0,0 +1,650 @@
+# База данных казино-бота
+# Асинхронный слой поверх aiosqlite: запросы выполняются в отдельных потоках,
+# поэтому медленный fsync не останавливает обработку апдейтов других игроков.
+# Одно соединение пишет, чтение идёт через пул read-only соединений (WAL)
+
+import asyncio
+import logging
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pathlib import Path
+
+import aiosqlite
+
+from anticheat import CheatDetector
+from config import RATING_SETTINGS, STORAGE_SETTINGS
+from leaderboard import Leaderboard, TopCache
+
+# Сводные таблицы статистики: по дню и игре, по дню и игроку, по игроку.
+# Обновляются триггерами в той же транзакции, что и запись в games
+ROLLUP_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS stats_daily (
+        day DATE, game_type TEXT, games INTEGER DEFAULT 0, bets INTEGER DEFAULT 0,
+        payouts INTEGER DEFAULT 0, mult_sum REAL DEFAULT 0,
+        PRIMARY KEY (day, game_type)) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS stats_user_daily (
+        day DATE, user_id INTEGER, games INTEGER DEFAULT 0, bets INTEGER DEFAULT 0,
+        payouts INTEGER DEFAULT 0, PRIMARY KEY (day, user_id)) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS stats_users (
+        user_id INTEGER PRIMARY KEY, games INTEGER DEFAULT 0, bets INTEGER DEFAULT 0,
+        payouts INTEGER DEFAULT 0)''',
+    'CREATE INDEX IF NOT EXISTS idx_stats_users_profit ON stats_users (payouts - bets)',
+    '''CREATE TRIGGER IF NOT EXISTS games_rollup_insert AFTER INSERT ON games BEGIN
+        INSERT INTO stats_daily VALUES (COALESCE(DATE(NEW.created_at), DATE('now')), NEW.game_type,
+                                        1, NEW.bet, NEW.result, NEW.multiplier)
+            ON CONFLICT (day, game_type) DO UPDATE SET games = games + 1, bets = bets + excluded.bets,
+                payouts = payouts + excluded.payouts, mult_sum = mult_sum + excluded.mult_sum;
+        INSERT INTO stats_user_daily VALUES (COALESCE(DATE(NEW.created_at), DATE('now')), NEW.user_id,
+                                             1, NEW.bet, NEW.result)
+            ON CONFLICT (day, user_id) DO UPDATE SET games = games + 1, bets = bets + excluded.bets,
+                payouts = payouts + excluded.payouts;
+        INSERT INTO stats_users VALUES (NEW.user_id, 1, NEW.bet, NEW.result)
+            ON CONFLICT (user_id) DO UPDATE SET games = games + 1, bets = bets + excluded.bets,
+                payouts = payouts + excluded.payouts;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS games_rollup_delete AFTER DELETE ON games BEGIN
+        UPDATE stats_daily SET games = games - 1, bets = bets - OLD.bet, payouts = payouts - OLD.result,
+            mult_sum = mult_sum - OLD.multiplier
+            WHERE day = COALESCE(DATE(OLD.created_at), DATE('now')) AND game_type = OLD.game_type;
+        UPDATE stats_user_daily SET games = games - 1, bets = bets - OLD.bet, payouts = payouts - OLD.result
+            WHERE day = COALESCE(DATE(OLD.created_at), DATE('now')) AND user_id = OLD.user_id;
+        UPDATE stats_users SET games = games - 1, bets = bets - OLD.bet, payouts = payouts - OLD.result
+            WHERE user_id = OLD.user_id;
+    END''',
+]
+
+# Миграции схемы поверх базовых таблиц из DB.init.
+# Номер миграции = позиция в списке + 1, применённая версия хранится в PRAGMA user_version
+MIGRATIONS = [
+    # 1: индексы истории игр - анти-чит по игроку и выборки по времени
+    [
+        'CREATE INDEX IF NOT EXISTS idx_games_user_created ON games (user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS idx_games_created ON games (created_at)',
+    ],
+    # 2: джекпот - ставки текущего розыгрыша и история розыгрышей
+    [
+        '''CREATE TABLE IF NOT EXISTS jackpot_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, bet INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+        '''CREATE TABLE IF NOT EXISTS jackpot_draws (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, winner INTEGER, prize INTEGER, pot INTEGER,
+            entries INTEGER, participants INTEGER, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''',
+    ],
+    # 3: сохранённое состояние потокового анти-чита
+    [
+        'CREATE TABLE IF NOT EXISTS anticheat_state (user_id INTEGER PRIMARY KEY, state TEXT)',
+    ],
+    # 4: состояния диалогов aiogram, общие для всех процессов бота
+    [
+        '''CREATE TABLE IF NOT EXISTS fsm_states (
+            bot_id INTEGER, chat_id INTEGER, user_id INTEGER, thread_id INTEGER, destiny TEXT,
+            state TEXT, data TEXT, expires_at REAL,
+            PRIMARY KEY (bot_id, chat_id, user_id, thread_id, destiny)) WITHOUT ROWID''',
+        'CREATE INDEX IF NOT EXISTS idx_fsm_expires ON fsm_states (expires_at)',
+    ],
+    # 5: индексы из миграции 1 не нужны - анти-чит потоковый, статистика из сводных таблиц,
+    # а каждая запись истории игр их обновляла
+    [
+        'DROP INDEX IF EXISTS idx_games_user_created',
+        'DROP INDEX IF EXISTS idx_games_created',
+    ],
+    # 6: версии балансов - рейтинг воркера дочитывает только изменённые. Отдельная таблица,
+    # чтобы строки users (и их RETURNING * в кэше) не менялись. Записи в SQLite идут по одной,
+    # поэтому MAX(version) + 1 растёт в порядке commit
+    [
+        'CREATE TABLE IF NOT EXISTS user_versions (user_id INTEGER PRIMARY KEY, version INTEGER)',
+        'INSERT OR IGNORE INTO user_versions SELECT user_id, rowid FROM users',
+        'CREATE INDEX IF NOT EXISTS idx_user_versions ON user_versions (version)',
+        '''CREATE TRIGGER IF NOT EXISTS users_version_insert AFTER INSERT ON users BEGIN
+            INSERT INTO user_versions VALUES (NEW.user_id, (SELECT COALESCE(MAX(version), 0) + 1 FROM user_versions))
+                ON CONFLICT (user_id) DO UPDATE SET version = excluded.version;
+        END''',
+        '''CREATE TRIGGER IF NOT EXISTS users_version_update AFTER UPDATE OF balance ON users BEGIN
+            INSERT INTO user_versions VALUES (NEW.user_id, (SELECT COALESCE(MAX(version), 0) + 1 FROM user_versions))
+                ON CONFLICT (user_id) DO UPDATE SET version = excluded.version;
+        END''',
+    ],
+]
+
+GAME_INSERT = 'INSERT INTO games (user_id, game_type, bet, result, multiplier, created_at) VALUES (?, ?, ?, ?, ?, ?)'
+
+class GameBatcher:
+    """Групповая запись истории игр: одна транзакция на пачку записей.
+    Балансы пишутся сразу, в очередь попадают только строки games"""
+    def __init__(self, db, batch_size=200, flush_ms=100):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000
+        self.queue = []
+        self.wakeup = asyncio.Event()
+        self.task = None
+        # Метрики
+        self.flushes = 0
+        self.rows = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def add(self, user_id, game_type, bet, result, multiplier):
+        # Время фиксируется в момент игры, а не записи (UTC, как CURRENT_TIMESTAMP)
+        created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        self.queue.append((user_id, game_type, bet, result, multiplier, created_at))
+        if len(self.queue) >= self.batch_size:
+            self.wakeup.set()
+
+    def start(self):
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logging.exception(f"Ошибка записи истории игр: {e}")
+
+    async def flush(self):
+        """Записать накопленные игры одной транзакцией"""
+        if not self.queue:
+            return 0
+        async with self.db.write_lock:
+            batch, self.queue = self.queue, []
+            start = time.perf_counter()
+            try:
+                await self.db.conn.executemany(GAME_INSERT, batch)
+                await self.db.conn.commit()
+            except Exception:
+                # Не теряем записи: вернуть в начало очереди до следующей попытки
+                await self.db.conn.rollback()
+                self.queue[:0] = batch
+                raise
+        elapsed = (time.perf_counter() - start) * 1000
+        self.flushes += 1
+        self.rows += len(batch)
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        self.total_flush_ms += elapsed
+        return len(batch)
+
+    async def stop(self):
+        """Остановить фоновую запись и сбросить всё, что осталось в очереди"""
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        while self.queue:
+            await self.flush()
+
+    def metrics(self):
+        return {
+            'queue_depth': len(self.queue),
+            'flushes': self.flushes,
+            'rows': self.rows,
+            'last_flush_ms': self.last_flush_ms,
+            'max_flush_ms': self.max_flush_ms,
+            'avg_flush_ms': self.total_flush_ms / self.flushes if self.flushes else 0.0,
+        }
+
+class UserCache:
+    """LRU-кэш строк users. Записи DB обновляют его сквозным образом (RETURNING *)"""
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.rows = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, user_id):
+        row = self.rows.get(user_id)
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.rows.move_to_end(user_id)
+        return row
+
+    def put(self, user_id, row):
+        """Свежая строка после записи - всегда заменяет кэш"""
+        if self.capacity <= 0:
+            return
+        self.rows[user_id] = row
+        self.rows.move_to_end(user_id)
+        while len(self.rows) > self.capacity:
+            self.rows.popitem(last=False)
+            self.evictions += 1
+
+    def fill(self, user_id, row):
+        """Строка, прочитанная из базы. Не перетирает то, что успела положить запись,
+        пока шло чтение - иначе в кэш вернулся бы старый баланс"""
+        if user_id not in self.rows:
+            self.put(user_id, row)
+
+    def invalidate(self, user_id=None):
+        if user_id is None:
+            self.rows.clear()
+        else:
+            self.rows.pop(user_id, None)
+
+    def metrics(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self.rows),
+            'capacity': self.capacity,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
+
+class DB:
+    """Асинхронное хранилище пользователей, игр и промокодов"""
+    connection_factory = sqlite3.Connection
+    def __init__(self, path='casino.db', profile=None):
+        self.path = path
+        self.profile = {**STORAGE_SETTINGS, **(profile or {})}
+        self.conn = None
+        self.readers = None
+        self.history = None
+        self.leaderboard = Leaderboard()
+        self.top = TopCache(self.leaderboard, RATING_SETTINGS['page_size'], RATING_SETTINGS['cache_ttl'])
+        self.anticheat = CheatDetector()
+        self.users = UserCache(self.profile['user_cache_size'])
+        self.leaderboard_version = 0  # рейтинг учёл все строки users с version не больше этой
+        self.changed = None           # игроки, записанные этим процессом во время refresh_leaderboard
+        # Многошаговые записи (промокоды) не должны перемешиваться между корутинами
+        self.write_lock = asyncio.Lock()
+
+    async def connect(self):
+        """Открыть пишущее соединение, создать таблицы и пул читателей"""
+        if self.conn is None:
+            self.conn = await aiosqlite.connect(self.path, factory=self.connection_factory)
+            await self.apply_pragmas(self.conn, writer=True)
+            await self.init()
+            # Сначала версия: запись другого процесса между запросами будет дочитана ещё раз
+            self.leaderboard_version = (await self.conn.execute_fetchall(
+                'SELECT COALESCE(MAX(version), 0) FROM user_versions'))[0][0]
+            self.leaderboard.load(await self.conn.execute_fetchall('SELECT user_id, balance FROM users'))
+            # Анти-чит: при старте - только игроки с флагами, остальные подгружаются при игре
+            self.anticheat.load(await self.conn.execute_fetchall(
+                "SELECT user_id, state FROM anticheat_state WHERE json_array_length(state, '$[9]') > 0"))
+            self.anticheat.start(self)
+
+            self.readers = asyncio.Queue()
+            # База в памяти не видна другим соединениям - читаем через писателя
+            if self.path != ':memory:':
+                uri = Path(self.path).absolute().as_uri() + '?mode=ro'
+                for _ in range(self.profile['read_pool_size']):
+                    reader = await aiosqlite.connect(uri, uri=True, factory=self.connection_factory)
+                    await self.apply_pragmas(reader)
+                    self.readers.put_nowait(reader)
+
+            if self.profile['history_batch']:
+                self.history = GameBatcher(self, self.profile['history_batch_size'],
+                                           self.profile['history_flush_ms'])
+                self.history.start()
+        return self
+
+    async def apply_pragmas(self, conn, writer=False):
+        p = self.profile
+        if writer:
+            await conn.execute(f"PRAGMA journal_mode = {p['journal_mode']}")
+            await conn.execute(f"PRAGMA synchronous = {p['synchronous']}")
+        await conn.execute(f"PRAGMA busy_timeout = {int(p['busy_timeout_ms'])}")
+        await conn.execute(f"PRAGMA cache_size = {-int(p['cache_size_kb'])}")
+        await conn.execute(f"PRAGMA mmap_size = {int(p['mmap_size'])}")
+
+    async def close(self):
+        if self.conn is not None:
+            await self.anticheat.stop(self)
+            if self.history is not None:
+                await self.history.stop()
+                self.history = None
+            while self.readers is not None and not self.readers.empty():
+                await self.readers.get_nowait().close()
+            await self.conn.close()
+            self.conn = None
+            self.readers = None
+
+    @asynccontextmanager
+    async def reader(self):
+        """Соединение для чтения: из пула или пишущее, если пул пуст по настройкам"""
+        if not self.profile['read_pool_size'] or self.path == ':memory:':
+            yield self.conn
+            return
+        conn = await self.readers.get()
+        try:
+            yield conn
+        finally:
+            self.readers.put_nowait(conn)
+
+    async def init(self):
+        await self.conn.execute('''CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY, username TEXT, balance INTEGER DEFAULT 1000,
+            last_bonus DATE, total_games INTEGER DEFAULT 0, total_wins INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        await self.conn.execute('''CREATE TABLE IF NOT EXISTS games (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, game_type TEXT,
+            bet INTEGER, result INTEGER, multiplier REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+        await self.conn.execute('''CREATE TABLE IF NOT EXISTS promo_codes (
+            code TEXT PRIMARY KEY, reward INTEGER, max_uses INTEGER,
+            current_uses INTEGER DEFAULT 0)''')
+        await self.conn.execute('''CREATE TABLE IF NOT EXISTS used_promos (
+            user_id INTEGER, promo_code TEXT, PRIMARY KEY (user_id, promo_code))''')
+        for sql in ROLLUP_SCHEMA:
+            await self.conn.execute(sql)
+        await self.conn.commit()
+        await self.migrate()
+
+    async def migrate(self):
+        """Применить недостающие миграции, каждую в своей транзакции. Возвращает версию схемы"""
+        version = (await self.conn.execute_fetchall('PRAGMA user_version'))[0][0]
+        for number, statements in enumerate(MIGRATIONS[version:], version + 1):
+            await self.conn.execute('BEGIN')
+            try:
+                for sql in statements:
+                    await self.conn.execute(sql)
+                await self.conn.execute(f'PRAGMA user_version = {number}')
+                await self.conn.commit()
+            except Exception:
+                await self.conn.rollback()
+                raise
+            logging.info(f"Схема БД обновлена до версии {number}")
+            version = number
+        return version
+
+    async def backfill_rollups(self):
+        """Пересчитать сводные таблицы по всей истории игр (для старых баз)"""
+        if self.history is not None:
+            await self.history.flush()
+        async with self.write_lock:
+            for table in ('stats_daily', 'stats_user_daily', 'stats_users'):
+                await self.conn.execute(f'DELETE FROM {table}')
+            await self.conn.execute('''INSERT INTO stats_daily
+                SELECT COALESCE(DATE(created_at), DATE('now')), game_type, COUNT(*), SUM(bet), SUM(result), SUM(multiplier)
+                FROM games GROUP BY 1, 2''')
+            await self.conn.execute('''INSERT INTO stats_user_daily
+                SELECT COALESCE(DATE(created_at), DATE('now')), user_id, COUNT(*), SUM(bet), SUM(result)
+                FROM games GROUP BY 1, 2''')
+            await self.conn.execute('''INSERT INTO stats_users
+                SELECT user_id, COUNT(*), SUM(bet), SUM(result) FROM games GROUP BY user_id''')
+            await self.conn.commit()
+
+    async def fetchone(self, sql, params=()):
+        async with self.reader() as conn:
+            async with conn.execute(sql, params) as c:
+                return await c.fetchone()
+
+    async def fetchall(self, sql, params=()):
+        async with self.reader() as conn:
+            return await conn.execute_fetchall(sql, params)
+
+    async def write(self, sql, params=()):
+        """Выполнить запись и зафиксировать. Возвращает первую строку RETURNING"""
+        async with self.write_lock:
+            try:
+                async with self.conn.execute(sql, params) as c:
+                    row = await c.fetchone()
+                await self.conn.commit()
+            except Exception:
+                await self.conn.rollback()
+                raise
+            return row
+
+    async def write_user(self, sql, params=()):
+        """Запись строки users с RETURNING * и сквозным обновлением кэша и рейтинга"""
+        async with self.write_lock:
+            try:
+                async with self.conn.execute(sql, params) as c:
+                    row = await c.fetchone()
+                await self.conn.commit()
+            except Exception:
+                await self.conn.rollback()
+                raise
+            self.user_changed(row)
+            return row
+
+    def user_changed(self, row):
+        # Вызывается под write_lock после commit, чтобы порядок обновлений совпадал с порядком записей
+        if row:
+            self.users.put(row[0], row)
+            self.leaderboard.update(row[0], row[2])
+            if self.changed is not None:
+                self.changed.add(row[0])
+            self.top.observe(row[0], row[2])
+
+    async def get_user(self, user_id):
+        user = self.users.get(user_id)
+        if user is None:
+            user = await self.fetchone('SELECT * FROM users WHERE user_id = ?', (user_id,))
+            if user:
+                self.users.fill(user_id, user)
+        return user
+
+    async def create_user(self, user_id, username=None):
+        await self.write_user('INSERT OR IGNORE INTO users (user_id, username) VALUES (?, ?) RETURNING *',
+                              (user_id, username))
+
+    async def get_balance(self, user_id):
+        user = await self.get_user(user_id)
+        return user[2] if user else 0
+
+    async def update_balance(self, user_id, amount):
+        await self.write_user('UPDATE users SET balance = balance + ? WHERE user_id = ? RETURNING *',
+                              (amount, user_id))
+
+    async def can_bonus(self, user_id):
+        user = await self.get_user(user_id)
+        if not user or not user[3]: return True
+        return datetime.now().date() > datetime.strptime(user[3], '%Y-%m-%d').date()
+
+    async def claim_bonus(self, user_id):
+        await self.write_user('UPDATE users SET balance = balance + 500, last_bonus = ? WHERE user_id = ? RETURNING *',
+                              (datetime.now().date().isoformat(), user_id))
+
+    async def record_game(self, user_id, game_type, bet, result, multiplier):
+        """Строка истории в текущей транзакции (при пакетной записи - queue_game после commit)"""
+        if self.history is None:
+            await self.conn.execute('INSERT INTO games VALUES (NULL, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)',
+                                    (user_id, game_type, bet, result, multiplier))
+
+    def queue_game(self, user_id, game_type, bet, result, multiplier):
+        # Только после commit: откаченный раунд не должен попасть в историю
+        if self.history is not None:
+            self.history.add(user_id, game_type, bet, result, multiplier)
+
+    async def add_game(self, user_id, game_type, bet, result, multiplier):
+        won = 1 if result > 0 else 0
+        async with self.write_lock:
+            try:
+                await self.record_game(user_id, game_type, bet, result, multiplier)
+                async with self.conn.execute('''UPDATE users SET total_games = total_games + 1, total_wins = total_wins + ?
+                                                WHERE user_id = ? RETURNING *''', (won, user_id)) as c:
+                    row = await c.fetchone()
+                await self.conn.commit()
+            except Exception:
+                await self.conn.rollback()
+                raise
+            self.queue_game(user_id, game_type, bet, result, multiplier)
+            self.user_changed(row)
+        await self.observe([(user_id, bet, result)])
+
+    async def place_bet(self, user_id, bet):
+        """Списать ставку, если хватает средств. Возвращает False при нехватке"""
+        row = await self.write_user('UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ? RETURNING *',
+                                    (bet, user_id, bet))
+        return row is not None
+
+    async def settle_round(self, user_id, game, bet, mult, prepaid=False):
+        """Рассчитать раунд одной транзакцией: списание, выигрыш, запись игры и счётчики.
+        Без prepaid ставка списывается только при balance >= bet.
+        Возвращает выплату или None, если средств не хватило"""
+        result = int(bet * mult)
+        won = 1 if result > 0 else 0
+        async with self.write_lock:
+            if prepaid:
+                sql, params = '''UPDATE users SET balance = balance + ?,
+                    total_games = total_games + 1, total_wins = total_wins + ?
+                    WHERE user_id = ? RETURNING *''', (result, won, user_id)
+            else:
+                sql, params = '''UPDATE users SET balance = balance - ? + ?,
+                    total_games = total_games + 1, total_wins = total_wins + ?
+                    WHERE user_id = ? AND balance >= ? RETURNING *''', (bet, result, won, user_id, bet)
+            try:
+                async with self.conn.execute(sql, params) as c:
+                    row = await c.fetchone()
+                if row is None:
+                    await self.conn.rollback()
+                    return None
+                await self.record_game(user_id, game, bet, result, mult)
+                await self.conn.commit()
+            except Exception:
+                await self.conn.rollback()
+                raise
+            self.queue_game(user_id, game, bet, result, mult)
+            self.user_changed(row)
+        await self.observe([(user_id, bet, result)])
+        return result
+
+    async def select_users(self, user_ids):
+        """Строки users по списку id через пишущее соединение (видит его незафиксированные записи)"""
+        rows = []
+        for i in range(0, len(user_ids), 500):
+            chunk = user_ids[i:i + 500]
+            rows += await self.conn.execute_fetchall(
+                f'SELECT * FROM users WHERE user_id IN ({",".join("?" * len(chunk))})', chunk)
+        return rows
+
+    async def place_bets(self, bets):
+        """Списать пачку ставок [(user_id, bet)] одной транзакцией, id в пачке не повторяются.
+        Возвращает множество игроков, у которых хватило средств"""
+        async with self.write_lock:
+            rows = []
+            try:
+                # Условное списание: баланс мог изменить другой процесс бота, принятые ставки - по RETURNING
+                for i in range(0, len(bets), 400):
+                    chunk = bets[i:i + 400]
+                    rows += await self.conn.execute_fetchall(
+                        f'''UPDATE users SET balance = balance - bets.column2
+                            FROM (VALUES {",".join(["(?, ?)"] * len(chunk))}) AS bets
+                            WHERE users.user_id = bets.column1 AND users.balance >= bets.column2 RETURNING *''',
+                        [value for row in chunk for value in row])
+                await self.conn.commit()
+            except Exception:
+                await self.conn.rollback()
+                raise
+            for row in rows:
+                self.user_changed(row)
+        return {row[0] for row in rows}
+
+    async def settle_rounds(self, rounds):
+        """Рассчитать пачку раундов [(user_id, game, bet, mult)] со списанными ставками одной транзакцией.
+        Возвращает выплаты в том же порядке"""
+        created_at = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime())
+        games = [(user_id, game, bet, int(bet * mult), mult, created_at) for user_id, game, bet, mult in rounds]
+        async with self.write_lock:
+            try:
+                await self.conn.executemany('''UPDATE users SET balance = balance + ?,
+                    total_games = total_games + 1, total_wins = total_wins + ? WHERE user_id = ?''',
+                    [(result, 1 if result > 0 else 0, user_id) for user_id, _, _, result, _, _ in games])
+                if self.history is None:
+                    await self.conn.executemany(GAME_INSERT, games)
+                rows = await self.select_users([row[0] for row in games])
+                await self.conn.commit()
+            except Exception:
+                await self.conn.rollback()
+                raise
+            if self.history is not None:
+                for row in games:
+                    self.history.add(*row[:5])
+            for row in rows:
+                self.user_changed(row)
+        await self.observe([(user_id, bet, result) for user_id, _, bet, result, _, _ in games])
+        return [row[3] for row in games]
+
+    async def observe(self, rounds):
+        """Рассчитанные раунды [(user_id, bet, result)] - в анти-чит, выгруженные игроки подгружаются"""
+        await self.anticheat.fetch(self, list({user_id for user_id, _, _ in rounds}))
+        now = time.time()
+        for user_id, bet, result in rounds:
+            self.anticheat.observe(user_id, bet, result, now)
+
+    async def get_top(self, limit=10, offset=0):
+        """Страница рейтинга: (username, balance, total_games, total_wins)"""
+        page = self.leaderboard.page(offset, limit)
+        if not page:
+            return []
+        ids = [user_id for user_id, balance in page]
+        rows = await self.fetchall(f'''SELECT user_id, username, balance, total_games, total_wins
+                                       FROM users WHERE user_id IN ({",".join("?" * len(ids))})''', ids)
+        by_id = {row[0]: row[1:] for row in rows}
+        return [by_id[user_id] for user_id in ids if user_id in by_id]
+
+    async def refresh_leaderboard(self):
+        """Дочитать в рейтинг балансы, изменённые после прошлого раза (их меняют и другие процессы).
+        Возвращает число обновлённых игроков"""
+        self.changed = set()
+        try:
+            rows = await self.fetchall('''SELECT users.user_id, balance, version FROM user_versions
+                                          JOIN users USING (user_id) WHERE version > ? ORDER BY version''',
+                                       (self.leaderboard_version,))
+            changed = self.changed
+        finally:
+            self.changed = None
+        # Пока шло чтение, этот процесс мог записать игроку более новый баланс - он уже в рейтинге.
+        # Такие строки перечитываются в следующий раз: вдруг позже их изменил другой процесс
+        skipped = [version for user_id, _, version in rows if user_id in changed]
+        for user_id, balance, version in rows:
+            if user_id not in changed:
+                self.leaderboard.update(user_id, balance)
+        if rows:
+            self.leaderboard_version = min(skipped) - 1 if skipped else rows[-1][2]
+            self.top.invalidate()
+        return len(rows) - len(skipped)
+
+    def get_rank(self, user_id):
+        """Место игрока в рейтинге и число игроков"""
+        return self.leaderboard.rank(user_id), len(self.leaderboard)
+
+    async def get_stats(self):
+        """Пользователи, игры, сумма ставок и выплат (из сводных таблиц)"""
+        games, bets, wins = await self.fetchone('SELECT SUM(games), SUM(bets), SUM(payouts) FROM stats_daily')
+        return len(self.leaderboard), games or 0, bets or 0, wins or 0
+
+    async def create_promo(self, code, reward, max_uses=1):
+        await self.write('INSERT OR REPLACE INTO promo_codes VALUES (?, ?, ?, 0)', (code, reward, max_uses))
+
+    async def use_promo(self, user_id, code):
+        async with self.write_lock:
+            promo = await self.fetchone('SELECT * FROM promo_codes WHERE code = ?', (code,))
+            if not promo: return False, "Промокод не найден"
+
+            used = await self.fetchone('SELECT * FROM used_promos WHERE user_id = ? AND promo_code = ?',
+                                       (user_id, code))
+            if used: return False, "Уже использован"
+
+            if promo[3] >= promo[2]: return False, "Промокод исчерпан"
+
+            try:
+                await self.conn.execute('INSERT INTO used_promos VALUES (?, ?)', (user_id, code))
+                await self.conn.execute('UPDATE promo_codes SET current_uses = current_uses + 1 WHERE code = ?', (code,))
+                async with self.conn.execute('UPDATE users SET balance = balance + ? WHERE user_id = ? RETURNING *',
+                                             (promo[1], user_id)) as c:
+                    row = await c.fetchone()
+                await self.conn.commit()
+            except Exception:
+                await self.conn.rollback()
+                raise
+            self.user_changed(row)
+            return True, f"Получено {promo[1]} очков"
@@ -0,0 +1,179 @@
+# Хранилище FSM в SQLite
+# Состояния и данные диалогов лежат в таблице fsm_states той же базы (WAL), поэтому
+# их видят все процессы бота и они переживают перезапуск. Запись продлевает TTL,
+# брошенные состояния удаляет фоновая очистка. Поле bet в данных - списанная, но ещё
+# не сыгранная ставка: она пишется вместе со списанием и возвращается игроку в той же
+# транзакции, что удаляет состояние
+
+import asyncio
+import json
+import logging
+import time
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+from config import FSM_SETTINGS
+
+KEY = 'bot_id = ? AND chat_id = ? AND user_id = ? AND thread_id = ? AND destiny = ?'
+
+def dump(data):
+    """Данные диалога в компактный JSON, пустые - в NULL"""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')) if data else None
+
+def load(data):
+    return json.loads(data) if data else {}
+
+class SQLiteStorage(BaseStorage):
+    """BaseStorage aiogram поверх DB: чтение через пул читателей, запись - через пишущее соединение"""
+    def __init__(self, db, settings=None):
+        self.db = db
+        self.settings = dict(FSM_SETTINGS, **(settings or {}))
+        self.task = None
+        # Метрики
+        self.expired = 0
+        self.refunds = 0
+        self.refunded = 0
+
+    @staticmethod
+    def key(key):
+        return key.bot_id, key.chat_id, key.user_id, key.thread_id or 0, key.destiny
+
+    async def upsert(self, key, column, value):
+        await self.db.write(f'''INSERT INTO fsm_states (bot_id, chat_id, user_id, thread_id, destiny, {column}, expires_at)
+                                VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO UPDATE
+                                SET {column} = excluded.{column}, expires_at = excluded.expires_at''',
+                            (*self.key(key), value, time.time() + self.settings['ttl']))
+
+    async def set_state(self, key, state=None):
+        await self.upsert(key, 'state', state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key):
+        row = await self.db.fetchone(f'SELECT state FROM fsm_states WHERE {KEY}', self.key(key))
+        return row[0] if row else None
+
+    async def set_data(self, key, data):
+        await self.upsert(key, 'data', dump(data))
+
+    async def get_data(self, key):
+        row = await self.db.fetchone(f'SELECT data FROM fsm_states WHERE {KEY}', self.key(key))
+        return load(row[0]) if row else {}
+
+    async def pop(self, key):
+        """Забрать данные и очистить состояние одним DELETE ... RETURNING: одну и ту же ставку
+        не заберут ни повторное нажатие в другом процессе, ни возврат по TTL"""
+        row = await self.db.write(f'DELETE FROM fsm_states WHERE {KEY} RETURNING data', self.key(key))
+        return load(row[0]) if row else {}
+
+    async def stake(self, key, bet, state, data):
+        """Списать ставку и записать состояние с ней одной транзакцией.
+        Возвращает False, если средств не хватило (состояние не меняется)"""
+        db = self.db
+        async with db.write_lock:
+            try:
+                async with db.conn.execute('UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ? '
+                                           'RETURNING *', (bet, key.user_id, bet)) as c:
+                    row = await c.fetchone()
+                if row is None:
+                    await db.conn.rollback()
+                    return False
+                await db.conn.execute(f'''INSERT INTO fsm_states (bot_id, chat_id, user_id, thread_id, destiny, state, data, expires_at)
+                                         VALUES (?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT DO UPDATE SET state = excluded.state,
+                                         data = excluded.data, expires_at = excluded.expires_at''',
+                                      (*self.key(key), state.state if isinstance(state, State) else state,
+                                       dump(dict(data, bet=bet)), time.time() + self.settings['ttl']))
+                await db.conn.commit()
+            except Exception:
+                await db.conn.rollback()
+                raise
+            db.user_changed(row)
+        return True
+
+    async def refund(self, key):
+        """Очистить состояние и вернуть несыгранную ставку одной транзакцией.
+        Возвращает сумму возврата (0 - ставки не было)"""
+        db = self.db
+        async with db.write_lock:
+            try:
+                async with db.conn.execute(f'DELETE FROM fsm_states WHERE {KEY} RETURNING data', self.key(key)) as c:
+                    data = await c.fetchone()
+                bet = load(data[0]).get('bet', 0) if data else 0
+                row = None
+                if bet:
+                    async with db.conn.execute('UPDATE users SET balance = balance + ? WHERE user_id = ? RETURNING *',
+                                               (bet, key.user_id)) as c:
+                        row = await c.fetchone()
+                await db.conn.commit()
+            except Exception:
+                await db.conn.rollback()
+                raise
+            db.user_changed(row)
+        if bet:
+            self.refunds += 1
+            self.refunded += bet
+        return bet
+
+    async def sweep(self, now=None):
+        """Удалить состояния с истёкшим TTL и вернуть несыгранные ставки.
+        Возвращает (удалено состояний, возвращено очков)"""
+        if now is None:
+            now = time.time()
+        sql, params = 'DELETE FROM fsm_states WHERE expires_at < ?', (now,)
+        if self.settings['partition']:
+            # Воркер супервизора: только свои игроки, их кэш строк users - у этого процесса
+            index, count = self.settings['partition']
+            sql, params = sql + ' AND user_id % ? = ?', (now, count, index)
+        db = self.db
+        async with db.write_lock:
+            try:
+                rows = await db.conn.execute_fetchall(sql + ' RETURNING user_id, data', params)
+                refunds = {}
+                for user_id, data in rows:
+                    bet = load(data).get('bet')
+                    if bet:
+                        refunds[user_id] = refunds.get(user_id, 0) + bet
+                await db.conn.executemany('UPDATE users SET balance = balance + ? WHERE user_id = ?',
+                                          [(bet, user_id) for user_id, bet in refunds.items()])
+                users = await db.select_users(list(refunds))
+                await db.conn.commit()
+            except Exception:
+                await db.conn.rollback()
+                raise
+            for row in users:
+                db.user_changed(row)
+        total = sum(refunds.values())
+        self.expired += len(rows)
+        self.refunds += len(refunds)
+        self.refunded += total
+        if refunds:
+            logging.info(f"Возвращено {total} очков {len(refunds)} игрокам по брошенным ставкам")
+        return len(rows), total
+
+    def start(self):
+        """Запустить фоновую очистку (первый проход - сразу: ставки, брошенные до перезапуска)"""
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logging.exception(f"Ошибка очистки состояний FSM: {e}")
+            await asyncio.sleep(self.settings['sweep_interval'])
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def metrics(self):
+        return {
+            'expired': self.expired,
+            'refunds': self.refunds,
+            'refunded': self.refunded,
+        }
@@ -0,0 +1,198 @@
+# Реестр игр
+# Каждая игра объявляет пространство равновероятных исходов и таблицу выплат из PAYOUTS.
+# Таблицы исход -> множитель строятся один раз при импорте: раунд - это случайный
+# индекс исхода и поиск в списке, пакет раундов - поиск в numpy-массиве
+
+from itertools import product
+
+import rng
+from rng import np
+from config import PAYOUTS, ROULETTE_COLORS, SLOT_SYMBOLS
+
+class Game:
+    """Игра: исходы, класс исхода при ставке (classify), выплата класса и текст результата.
+    bets - виды ставок (None - ставка без выбора), choices - кнопки выбора ставки"""
+    def __init__(self, name, title, summary, outcomes, classify, payouts, render,
+                 bets=(None,), choices=None, prompt=None, frames=None, payout=None):
+        self.name = name
+        self.title = title
+        self.summary = summary
+        self.outcomes = list(outcomes)
+        self.classify = classify
+        self.payouts = payouts
+        self.render = render
+        self.choices = choices
+        self.prompt = prompt
+        self.frames = frames
+        payout = payout or (lambda outcome, cls: payouts[cls])
+        # Таблица множителей на каждый вид ставки: индекс исхода -> множитель
+        self.tables = {bet: [float(payout(o, classify(o, bet))) for o in self.outcomes] for bet in bets}
+        self.arrays = {bet: np.array(table) for bet, table in self.tables.items()} if np is not None else None
+
+    def play(self, bet=None):
+        """Один раунд: (выиграл, текст, множитель)"""
+        i = rng.randbelow(len(self.outcomes))
+        mult = self.tables[bet][i]
+        outcome = self.outcomes[i]
+        return mult > 0, self.render(outcome, self.classify(outcome, bet)), mult
+
+    def batch(self, n, bet=None):
+        """numpy-массив множителей n раундов"""
+        if self.arrays is None:
+            raise RuntimeError("Для пакетных раундов нужен numpy")
+        return self.arrays[bet][rng.randbelow_batch(len(self.outcomes), n)]
+
+# Описания игр: таблица выплат -> Game
+def coinflip_game(p):
+    return Game(
+        'coinflip', "🪙 Монетка", f"×{p['coinflip']:g}",
+        outcomes=['heads', 'tails'],
+        classify=lambda side, bet: 'win' if side == bet else 'lose',
+        payouts={'win': p['coinflip'], 'lose': 0.0},
+        render=lambda side, cls: f"🪙 Выпал {'орёл' if side == 'heads' else 'решка'}!",
+        bets=['heads', 'tails'],
+        choices=[[("🪙 Орёл", "heads"), ("🪙 Решка", "tails")]],
+        prompt="🪙 Выберите:")
+
+DICE_MARKS = {6: " 🎉", 'high': " ✨", 'low': " 😔"}
+
+def dice_game(p):
+    return Game(
+        'dice', "🎲 Кости", f"×{p['dice']['high']:g} или ×{p['dice'][6]:g}",
+        outcomes=range(1, 7),
+        classify=lambda face, bet: 6 if face == 6 else 'high' if face >= 4 else 'low',
+        payouts=p['dice'],
+        render=lambda face, cls: f"🎲 Выпало: {face}" + DICE_MARKS[cls])
+
+SLOTS_MARKS = {'triple': "\n🎉 ТРИ!", 'double': "\n✨ Пара!", 'nothing': "\n😔"}
+
+def slots_class(reels, bet):
+    a, b, c = reels
+    if a == b == c: return 'triple'
+    if a == b or b == c or a == c: return 'double'
+    return 'nothing'
+
+def slots_game(p):
+    return Game(
+        'slots', "🎰 Слоты", f"×{p['slots']['double']:g} или ×{p['slots']['triple']:g}",
+        outcomes=product(SLOT_SYMBOLS, repeat=3),
+        classify=slots_class,
+        payouts=p['slots'],
+        render=lambda reels, cls: f"🎰 {''.join(reels)}" + SLOTS_MARKS[cls],
+        frames=["🎰 🎲 🎲", "🎰 🎰 🎲", "🎰 🎰 🎰"])
+
+ROULETTE_BETS = ['color_red', 'color_black', 'even', 'odd'] + [f"number_{i}" for i in range(37)]
+ROULETTE_MARKS = {'number': "\n🎉 ТОЧНО!", 'color': "\n✨ Цвет!", 'even': "\n✨ Чёт!", 'odd': "\n✨ Нечёт!", 'lose': "\n😔"}
+COLOR_EMOJI = {'green': '🟢', 'red': '🔴', 'black': '⚫'}
+
+def roulette_class(number, bet):
+    kind, _, value = bet.partition("_")
+    if kind == 'number':
+        return 'number' if number == int(value) else 'lose'
+    if kind == 'color':
+        return 'color' if ROULETTE_COLORS[number] == value else 'lose'
+    if number != 0 and number % 2 == (0 if kind == 'even' else 1):
+        return kind
+    return 'lose'
+
+def roulette_game(p):
+    table = p['roulette']
+    return Game(
+        'roulette', "🎯 Рулетка", f"×{table['color']:g} или ×{table['number']:g}",
+        outcomes=range(37),
+        classify=roulette_class,
+        payouts={'number': table['number'], 'color': table['color'],
+                 'even': table['even_odd'], 'odd': table['even_odd'], 'lose': 0.0},
+        render=lambda number, cls: f"🎯 {number} ({COLOR_EMOJI[ROULETTE_COLORS[number]]})" + ROULETTE_MARKS[cls],
+        bets=ROULETTE_BETS,
+        choices=[[("🔴 Красное", "color_red"), ("⚫ Чёрное", "color_black")],
+                 [("📈 Чёт", "even"), ("📉 Нечёт", "odd")]],
+        prompt="🎯 Выберите:")
+
+BLACKJACK_MARKS = {'win': "Победа!", 'push': "Ничья!", 'lose': "Проигрыш!"}
+
+def blackjack_class(cards, bet):
+    # Две карты до 10 не дают перебора
+    player, dealer = cards[0] + cards[1], cards[2] + cards[3]
+    if player > dealer: return 'win'
+    if player == dealer: return 'push'
+    return 'lose'
+
+def blackjack_game(p):
+    return Game(
+        'blackjack', "🃏 Блэкджек", f"×{p['blackjack']:g}",
+        outcomes=product(range(1, 11), repeat=4),
+        classify=blackjack_class,
+        payouts={'win': p['blackjack'], 'push': 1.0, 'lose': 0.0},
+        render=lambda cards, cls: f"🃏 Вы: {cards[0] + cards[1]} | Дилер: {cards[2] + cards[3]}\n"
+                                  + BLACKJACK_MARKS[cls])
+
+def crash_render(outcome, cls):
+    crash_point, auto_cashout = (100 + outcome[0]) / 100, (100 + outcome[1]) / 100
+    if cls == 'cashout':
+        return f"📈 Crash на {crash_point:.2f}x\nВывели на {auto_cashout:.2f}x!"
+    return f"📈 Crash на {crash_point:.2f}x\nНе успели вывести!"
+
+def crash_game(p):
+    # Мгновенный вариант (extra_games.crash, RTP); в боте Crash идёт в реальном времени - crash.py.
+    # Исход - сотые доли точки краша (1.00-5.99) и автовывода (1.00-3.99)
+    return Game(
+        'crash', "📈 Crash", f"в реальном времени, до ×{p['crash_max']:g}",
+        outcomes=product(range(500), range(300)),
+        classify=lambda outcome, bet: 'cashout' if outcome[1] < outcome[0] else 'crash',
+        payouts=None,
+        payout=lambda outcome, cls: (100 + outcome[1]) / 100 if cls == 'cashout' else 0.0,
+        render=crash_render)
+
+BUILDERS = {
+    'coinflip': coinflip_game,
+    'dice': dice_game,
+    'slots': slots_game,
+    'roulette': roulette_game,
+    'blackjack': blackjack_game,
+    'crash': crash_game
+}
+
+def build(payouts=PAYOUTS, names=None):
+    """Реестр игр по таблице выплат"""
+    return {name: BUILDERS[name](payouts) for name in (names or BUILDERS)}
+
+GAMES = build()
+
+# Виды ставок, по которым считаются RTP и HOUSE_EDGE: имя -> (игра, ставка).
+# Crash игроки получают в реальном времени (crash.py): его RTP - rtp.live_crash, а не по исходам ниже
+VARIANTS = {
+    'coinflip': ('coinflip', 'heads'),
+    'dice': ('dice', None),
+    'slots': ('slots', None),
+    'roulette_number': ('roulette', 'number_17'),
+    'roulette_color': ('roulette', 'color_red'),
+    'roulette_even': ('roulette', 'even'),
+    'roulette_odd': ('roulette', 'odd'),
+    'blackjack': ('blackjack', None)
+}
+
+# Прежние функции игр - обёртки над реестром
+def coinflip(choice):
+    return GAMES['coinflip'].play(choice)
+
+def dice():
+    return GAMES['dice'].play()
+
+def slots():
+    return GAMES['slots'].play()
+
+def roulette(bet_type, bet_value=None):
+    return GAMES['roulette'].play(bet_type if bet_value is None else f"{bet_type}_{bet_value}")
+
+def coinflip_batch(choice, n):
+    return GAMES['coinflip'].batch(n, choice)
+
+def dice_batch(n):
+    return GAMES['dice'].batch(n)
+
+def slots_batch(n):
+    return GAMES['slots'].batch(n)
+
+def roulette_batch(bet_type, bet_value, n):
+    return GAMES['roulette'].batch(n, bet_type if bet_value is None else f"{bet_type}_{bet_value}")
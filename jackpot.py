@@ -0,0 +1,139 @@
+# Джекпот
+# Ставки текущего розыгрыша лежат в jackpot_entries и переживают перезапуск,
+# в памяти - префиксные суммы ставок: победитель ищется бинарным поиском за O(log n).
+# Ставка, розыгрыш и выплата проходят одной транзакцией, память меняется только
+# после commit - после падения состояние целиком восстанавливается из базы
+
+import bisect
+
+import rng
+from config import JACKPOT_SETTINGS
+
+class JackpotManager:
+    """Общий банк, разыгрываемый с шансом пропорционально ставкам"""
+    def __init__(self, db, settings=None):
+        self.db = db
+        self.settings = dict(JACKPOT_SETTINGS, **(settings or {}))
+        self.loaded = False
+        self.users = []        # user_id ставок в порядке id
+        self.cumulative = []   # префиксные суммы ставок
+        self.stakes = {}       # user_id -> сумма ставок игрока
+        self.draws = 0
+
+    @property
+    def pot(self):
+        return self.cumulative[-1] if self.cumulative else 0
+
+    def append(self, user_id, bet):
+        self.users.append(user_id)
+        self.cumulative.append(self.pot + bet)
+        self.stakes[user_id] = self.stakes.get(user_id, 0) + bet
+
+    def reset(self):
+        self.users = []
+        self.cumulative = []
+        self.stakes = {}
+
+    def pick(self):
+        """Победитель: случайная точка банка и бинарный поиск по префиксным суммам"""
+        point = rng.randbelow(self.pot)
+        return self.users[bisect.bisect_right(self.cumulative, point)]
+
+    async def load(self):
+        """Восстановить текущий розыгрыш из базы"""
+        async with self.db.write_lock:
+            rows = await self.db.conn.execute_fetchall('SELECT user_id, bet FROM jackpot_entries ORDER BY id')
+        self.reset()
+        for user_id, bet in rows:
+            self.append(user_id, bet)
+        self.loaded = True
+        return self
+
+    async def add_entry(self, user_id, bet):
+        """Ставка в джекпот со списанием с баланса. Возвращает False, если ставка меньше min_bet
+        или не хватает средств; (победитель, приз), если ставка запустила розыгрыш; иначе None"""
+        if bet < self.settings['min_bet']:
+            return False
+        if not self.loaded:
+            await self.load()
+        conn = self.db.conn
+        async with self.db.write_lock:
+            size = len(self.users)
+            try:
+                async with conn.execute('UPDATE users SET balance = balance - ? WHERE user_id = ? AND balance >= ? '
+                                        'RETURNING *', (bet, user_id, bet)) as c:
+                    row = await c.fetchone()
+                if row is None:
+                    await conn.rollback()
+                    return False
+                await conn.execute('INSERT INTO jackpot_entries (user_id, bet) VALUES (?, ?)', (user_id, bet))
+                # Розыгрыш должен видеть новую ставку: она добавляется в память заранее
+                # и убирается, если транзакция не прошла
+                self.append(user_id, bet)
+                result = None
+                if len(self.stakes) >= self.settings['auto_draw_threshold']:
+                    result = await self.payout()
+                await conn.commit()
+            except Exception:
+                await conn.rollback()
+                self.truncate(size)
+                raise
+            self.db.user_changed(row)
+            return self.finish(result)
+
+    async def draw_winner(self):
+        """Разыграть банк сейчас. None, если участников меньше min_participants"""
+        if not self.loaded:
+            await self.load()
+        async with self.db.write_lock:
+            if len(self.stakes) < self.settings['min_participants']:
+                return None
+            try:
+                result = await self.payout()
+                await self.db.conn.commit()
+            except Exception:
+                await self.db.conn.rollback()
+                raise
+            return self.finish(result)
+
+    async def payout(self):
+        """Внутри транзакции: выбрать победителя, зачислить приз, записать розыгрыш и очистить ставки"""
+        conn = self.db.conn
+        winner = self.pick()
+        pot = self.pot
+        prize = pot - int(pot * self.settings['commission'])
+        async with conn.execute('UPDATE users SET balance = balance + ? WHERE user_id = ? RETURNING *',
+                                (prize, winner)) as c:
+            row = await c.fetchone()
+        await conn.execute('''INSERT INTO jackpot_draws (winner, prize, pot, entries, participants)
+                              VALUES (?, ?, ?, ?, ?)''', (winner, prize, pot, len(self.users), len(self.stakes)))
+        await conn.execute('DELETE FROM jackpot_entries')
+        return winner, prize, row
+
+    def finish(self, result):
+        """После commit: обновить кэш победителя и очистить розыгрыш в памяти"""
+        if result is None:
+            return None
+        winner, prize, row = result
+        self.db.user_changed(row)
+        self.reset()
+        self.draws += 1
+        return winner, prize
+
+    def truncate(self, size):
+        """Откатить ставки в памяти до size штук"""
+        while len(self.users) > size:
+            user_id = self.users.pop()
+            bet = self.cumulative.pop() - self.pot
+            self.stakes[user_id] -= bet
+            if not self.stakes[user_id]:
+                del self.stakes[user_id]
+
+    def get_pot_info(self):
+        """Информация о текущем джекпоте"""
+        return {
+            'pot': self.pot,
+            'prize': self.pot - int(self.pot * self.settings['commission']),
+            'entries': len(self.users),
+            'participants': list(self.stakes)
+        }
@@ -0,0 +1,215 @@
+# Рейтинг игроков в памяти
+# Отсортированные блоки ключей + дерево Фенвика по размерам блоков:
+# место игрока и любая страница рейтинга - за O(log n) без запросов к SQLite.
+# Первая страница вместе с готовым текстом хранится снимком (TopCache) и
+# сбрасывается только изменениями, которые могут её задеть
+
+import asyncio
+import time
+from bisect import bisect_left, insort
+
+# Ключ - одно целое: сначала больший баланс, при равенстве меньший user_id
+USER_BITS = 52
+USER_MASK = (1 << USER_BITS) - 1
+
+def make_key(user_id, balance):
+    return (-balance << USER_BITS) + user_id
+
+def split_key(key):
+    """(user_id, balance) из ключа"""
+    return key & USER_MASK, -(key >> USER_BITS)
+
+class Leaderboard:
+    """Рейтинг по балансу, обновляется при каждом изменении баланса"""
+    LOAD = 512  # целевой размер блока
+
+    def __init__(self):
+        self.buckets = []
+        self.maxes = []    # последний ключ каждого блока
+        self.tree = []     # Фенвик: количество ключей в блоках
+        self.balances = {}
+
+    def __len__(self):
+        return len(self.balances)
+
+    def load(self, rows):
+        """Построить рейтинг заново из пар (user_id, balance)"""
+        self.balances = dict(rows)
+        keys = sorted(make_key(user_id, balance) for user_id, balance in self.balances.items())
+        self.buckets = [keys[i:i + self.LOAD] for i in range(0, len(keys), self.LOAD)]
+        self.rebuild()
+
+    def rebuild(self):
+        self.maxes = [bucket[-1] for bucket in self.buckets]
+        n = len(self.buckets)
+        self.tree = [len(bucket) for bucket in self.buckets]
+        for i in range(n):
+            j = i | (i + 1)
+            if j < n:
+                self.tree[j] += self.tree[i]
+
+    def tree_add(self, i, delta):
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i |= i + 1
+
+    def tree_prefix(self, i):
+        """Количество ключей в блоках [0, i)"""
+        total = 0
+        while i > 0:
+            total += self.tree[i - 1]
+            i &= i - 1
+        return total
+
+    def tree_find(self, pos):
+        """Блок, содержащий позицию pos (с нуля), и позиция внутри него"""
+        i, step = 0, 1 << len(self.tree).bit_length()
+        while step:
+            j = i + step
+            if j <= len(self.tree) and self.tree[j - 1] <= pos:
+                i = j
+                pos -= self.tree[j - 1]
+            step >>= 1
+        return i, pos
+
+    def update(self, user_id, balance):
+        """Новый баланс игрока (или новый игрок)"""
+        old = self.balances.get(user_id)
+        if old == balance:
+            return
+        if old is not None:
+            self.discard(make_key(user_id, old))
+        self.balances[user_id] = balance
+        self.insert(make_key(user_id, balance))
+
+    def remove(self, user_id):
+        balance = self.balances.pop(user_id, None)
+        if balance is not None:
+            self.discard(make_key(user_id, balance))
+
+    def insert(self, key):
+        if not self.buckets:
+            self.buckets.append([key])
+            self.rebuild()
+            return
+        i = min(bisect_left(self.maxes, key), len(self.buckets) - 1)
+        bucket = self.buckets[i]
+        insort(bucket, key)
+        self.maxes[i] = bucket[-1]
+        if len(bucket) > 2 * self.LOAD:
+            self.buckets[i:i + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self.rebuild()
+        else:
+            self.tree_add(i, 1)
+
+    def discard(self, key):
+        i = bisect_left(self.maxes, key)
+        bucket = self.buckets[i]
+        del bucket[bisect_left(bucket, key)]
+        if bucket:
+            self.maxes[i] = bucket[-1]
+            self.tree_add(i, -1)
+        else:
+            del self.buckets[i]
+            self.rebuild()
+
+    def rank(self, user_id):
+        """Место игрока (с единицы) или None"""
+        balance = self.balances.get(user_id)
+        if balance is None:
+            return None
+        key = make_key(user_id, balance)
+        i = bisect_left(self.maxes, key)
+        return self.tree_prefix(i) + bisect_left(self.buckets[i], key) + 1
+
+    def page(self, offset=0, limit=10):
+        """Игроки с местами offset+1 .. offset+limit: список (user_id, balance)"""
+        if offset >= len(self) or limit <= 0:
+            return []
+        i, pos = self.tree_find(offset)
+        result = []
+        while i < len(self.buckets) and len(result) < limit:
+            for key in self.buckets[i][pos:pos + limit - len(result)]:
+                result.append(split_key(key))
+            i, pos = i + 1, 0
+        return result
+
+class TopCache:
+    """Снимок первой страницы рейтинга (строки и текст). Устаревает, когда меняется игрок
+    из снимка или чей-то баланс проходит порог последнего места, и по ttl.
+    Перестраивается одной задачей: пока она идёт, остальные запросы получают прежний снимок"""
+    def __init__(self, leaderboard, size=10, ttl=30.0, clock=time.monotonic):
+        self.leaderboard = leaderboard
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self.snapshot = None
+        self.built_at = 0.0
+        self.ids = frozenset()
+        self.threshold = None   # ключ последнего места (None - страница не заполнена)
+        self.stale = True
+        self.task = None
+        # Метрики
+        self.hits = 0
+        self.previous = 0       # отдан прежний снимок во время перестройки
+        self.misses = 0
+        self.rebuilds = 0
+        self.invalidations = 0
+
+    def observe(self, user_id, balance):
+        """Изменился игрок: сбросить снимок, если изменение может его задеть"""
+        if self.stale:
+            return
+        if user_id in self.ids or self.threshold is None or make_key(user_id, balance) < self.threshold:
+            self.stale = True
+            self.invalidations += 1
+
+    def invalidate(self):
+        if not self.stale:
+            self.stale = True
+            self.invalidations += 1
+
+    async def get(self, build):
+        """Снимок первой страницы; build() - корутина, возвращающая новый снимок"""
+        if not self.stale and self.clock() - self.built_at < self.ttl:
+            self.hits += 1
+            return self.snapshot
+        if self.task is not None:
+            if self.snapshot is not None:
+                self.previous += 1
+                return self.snapshot
+            self.misses += 1
+            return await asyncio.shield(self.task)
+        self.misses += 1
+        self.task = asyncio.create_task(self.rebuild(build))
+        return await asyncio.shield(self.task)
+
+    async def rebuild(self, build):
+        # Границы снимка - по рейтингу на момент запроса: изменения во время
+        # перестройки снова помечают его устаревшим
+        page = self.leaderboard.page(0, self.size)
+        self.ids = frozenset(user_id for user_id, _ in page)
+        self.threshold = make_key(*page[-1]) if len(page) == self.size else None
+        self.stale = False
+        built_at = self.clock()
+        try:
+            self.snapshot = await build()
+        except Exception:
+            self.stale = True
+            raise
+        finally:
+            self.task = None
+        self.built_at = built_at
+        self.rebuilds += 1
+        return self.snapshot
+
+    def metrics(self):
+        total = self.hits + self.previous + self.misses
+        return {
+            'hit_rate': (self.hits + self.previous) / total if total else 0.0,
+            'hits': self.hits,
+            'previous': self.previous,
+            'misses': self.misses,
+            'rebuilds': self.rebuilds,
+            'invalidations': self.invalidations,
+        }
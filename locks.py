@@ -0,0 +1,21 @@
+# Блокировки по игрокам
+# Апдейты одного игрока выполняются строго по очереди, разные игроки - параллельно
+
+import asyncio
+import weakref
+
+class UserLocks:
+    """asyncio.Lock на каждого игрока. Блокировки хранятся по слабым ссылкам
+    и исчезают сами, как только их никто не держит и не ждёт"""
+    def __init__(self):
+        self.locks = weakref.WeakValueDictionary()
+
+    def __call__(self, user_id):
+        lock = self.locks.get(user_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self.locks[user_id] = lock
+        return lock
+
+    def __len__(self):
+        return len(self.locks)
@@ -0,0 +1,81 @@
+# Шаблоны MarkdownV2
+# Текст шаблона уже размечен (экранирован вручную) и разбирается один раз: литералы
+# склеиваются в строку для str.format, экранируются только подставляемые значения -
+# одной таблицей str.translate. Готовые фрагменты (строки рейтинга) кэшируются
+# по значениям полей: изменились данные - изменился ключ
+
+from collections import OrderedDict
+from string import Formatter
+
+SPECIAL = "\\_*[]()~`>#+-=|{}.!"
+ESCAPE = str.maketrans({char: "\\" + char for char in SPECIAL})
+
+class Markdown(str):
+    """Уже размеченный текст: подставляется в шаблон без экранирования"""
+    __slots__ = ()
+
+def md(text):
+    """Экранирование спецсимволов MarkdownV2"""
+    return str(text).translate(ESCAPE)
+
+def braces(text):
+    return text.replace("{", "{{").replace("}", "}}")
+
+def escape(value, spec="", conversion=None):
+    """Значение поля как текст MarkdownV2"""
+    if conversion == 'r':
+        value = repr(value)
+    elif conversion == 's':
+        value = str(value)
+    if isinstance(value, Markdown):
+        return value
+    return format(value, spec).translate(ESCAPE)
+
+class Template:
+    """Шаблон с полями str.format. static - значения, известные при сборке:
+    они подставляются сразу, в render остаются только поля ответа"""
+    def __init__(self, source, cache_size=1024, **static):
+        parts, fields = [], []
+        for literal, field, spec, conversion in Formatter().parse(source):
+            parts.append(braces(literal))
+            if field is None:
+                continue
+            if field in static:
+                parts.append(braces(escape(static[field], spec, conversion)))
+            else:
+                parts.append("{%d}" % len(fields))
+                fields.append((field, spec, conversion))
+        compiled = "".join(parts)
+        self.fields = fields
+        self.names = tuple(field for field, _, _ in fields)
+        self.format = compiled.format
+        self.text = None if fields else Markdown(compiled.format())
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, **values):
+        return Markdown(self.format(*[escape(values[field], spec, conversion)
+                                      for field, spec, conversion in self.fields]))
+
+    def cached(self, **values):
+        """render с кэшем по значениям полей (самые давние вытесняются)"""
+        key = tuple(values[name] for name in self.names)
+        text = self.cache.get(key)
+        if text is not None:
+            self.hits += 1
+            self.cache.move_to_end(key)
+            return text
+        self.misses += 1
+        text = self.cache[key] = self.render(**values)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return text
+
+    def metrics(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self.cache),
+            'hit_rate': self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,262 @@
+# Очередь исходящих запросов к Bot API
+# Все ответы бота проходят через один планировщик: лимиты Telegram на чат и на бота,
+# ожидание retry_after, слияние правок одного сообщения и приоритеты
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+from contextlib import contextmanager
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageCaption, EditMessageReplyMarkup, EditMessageText
+
+from config import OUTBOUND_SETTINGS
+
+# Приоритеты: меньше - раньше. LOW - то, что можно выбросить (кадры анимации)
+NORMAL, LOW = 0, 1
+current_priority = contextvars.ContextVar('send_priority', default=NORMAL)
+
+EDITS = (EditMessageText, EditMessageCaption, EditMessageReplyMarkup)
+
+@contextmanager
+def priority(level):
+    """Запросы внутри блока уходят с приоритетом level"""
+    token = current_priority.set(level)
+    try:
+        yield
+    finally:
+        current_priority.reset(token)
+
+class TokenBucket:
+    """rate токенов в секунду, не больше burst в запасе"""
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_time(self, now):
+        """Сколько ждать до следующего токена"""
+        self.refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self.refill(now)
+        self.tokens -= 1
+
+class Request:
+    __slots__ = ('priority', 'seq', 'make_request', 'bot', 'method', 'futures', 'retries')
+
+    def __init__(self, priority, seq, make_request, bot, method, future):
+        self.priority = priority
+        self.seq = seq
+        self.make_request = make_request
+        self.bot = bot
+        self.method = method
+        self.futures = [future]
+        self.retries = 0
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def resolve(self, result=None, error=None):
+        for future in self.futures:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+class Chat:
+    """Очередь одного чата. В полёте не больше одного запроса - порядок сообщений сохраняется"""
+    __slots__ = ('queue', 'edits', 'bucket', 'blocked', 'busy')
+
+    def __init__(self, rate, burst):
+        self.queue = []     # куча Request
+        self.edits = {}     # message_id -> ещё не отправленная правка
+        self.bucket = TokenBucket(rate, burst)
+        self.blocked = 0.0  # до какого момента действует retry_after
+        self.busy = False
+
+    def idle(self, now):
+        self.bucket.refill(now)
+        return not self.queue and not self.busy and now >= self.blocked \
+            and self.bucket.tokens >= self.bucket.burst
+
+class SendQueue(BaseRequestMiddleware):
+    """Middleware сессии бота: запросы с chat_id ставятся в очередь и отправляются
+    планировщиком, остальные (getUpdates, answerCallbackQuery...) идут напрямую"""
+    def __init__(self, settings=None):
+        self.settings = dict(OUTBOUND_SETTINGS, **(settings or {}))
+        self.bucket = TokenBucket(self.settings['global_rate'], self.settings['global_burst'])
+        self.chats = {}
+        self.ready = []    # куча (priority, seq, chat_id): чаты, которым можно слать сейчас
+        self.timers = []   # куча (when, chat_id): чаты, ждущие токен или retry_after
+        self.seq = itertools.count()
+        self.wakeup = None
+        self.worker = None
+        self.inflight = set()
+        self.swept = time.monotonic()
+        self.sent = 0
+        self.merged = 0
+        self.retried = 0
+        self.dropped = 0
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, 'chat_id', None)
+        if chat_id is None:
+            return await make_request(bot, method)
+        if self.worker is None or self.worker.done():
+            self.wakeup = asyncio.Event()
+            self.worker = asyncio.create_task(self.run())
+
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            chat = self.chats[chat_id] = Chat(self.settings['chat_rate'], self.settings['chat_burst'])
+        level = current_priority.get()
+        now = time.monotonic()
+
+        if level == LOW:
+            # Кадр не копится: если чат занят или под лимитом, он просто пропускается
+            wait = max(chat.blocked - now, chat.bucket.wait_time(now), 0.0)
+            if wait > 0 or chat.queue or chat.busy:
+                self.dropped += 1
+                raise TelegramRetryAfter(method=method, message="Чат занят, кадр пропущен", retry_after=wait)
+
+        future = asyncio.get_running_loop().create_future()
+        key = method.message_id if isinstance(method, EDITS) else None
+        request = chat.edits.get(key) if key else None
+        if request is not None:
+            # Правка того же сообщения ещё не ушла: отправится только последняя
+            request.method = method
+            request.priority = min(request.priority, level)
+            request.futures.append(future)
+            self.merged += 1
+        else:
+            request = Request(level, next(self.seq), make_request, bot, method, future)
+            heapq.heappush(chat.queue, request)
+            if key:
+                chat.edits[key] = request
+            self.schedule(chat_id, chat)
+        return await future
+
+    def schedule(self, chat_id, chat):
+        """Поставить чат в очередь планировщика, если у него есть что отправить"""
+        if chat.busy or not chat.queue:
+            return
+        now = time.monotonic()
+        when = max(chat.blocked, now + chat.bucket.wait_time(now))
+        if when <= now:
+            head = chat.queue[0]
+            heapq.heappush(self.ready, (head.priority, head.seq, chat_id))
+        else:
+            heapq.heappush(self.timers, (when, chat_id))
+        self.wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                now = time.monotonic()
+                while self.timers and self.timers[0][0] <= now:
+                    _, chat_id = heapq.heappop(self.timers)
+                    if chat_id in self.chats:
+                        self.schedule(chat_id, self.chats[chat_id])
+                if now - self.swept > 60:
+                    self.sweep(now)
+
+                if not self.ready:
+                    timeout = self.timers[0][0] - now if self.timers else None
+                    self.wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self.wakeup.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                wait = self.bucket.wait_time(now)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+
+                _, _, chat_id = heapq.heappop(self.ready)
+                chat = self.chats.get(chat_id)
+                if chat is None or chat.busy or not chat.queue:
+                    continue
+                if chat.blocked > now or chat.bucket.wait_time(now) > 0:
+                    self.schedule(chat_id, chat)
+                    continue
+
+                request = heapq.heappop(chat.queue)
+                key = getattr(request.method, 'message_id', None)
+                if chat.edits.get(key) is request:
+                    del chat.edits[key]
+                chat.busy = True
+                chat.bucket.take(now)
+                self.bucket.take(now)
+                task = asyncio.create_task(self.send(chat_id, chat, request))
+                self.inflight.add(task)
+                task.add_done_callback(self.inflight.discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("Ошибка планировщика исходящих сообщений")
+
+    async def send(self, chat_id, chat, request):
+        try:
+            result = await request.make_request(request.bot, request.method)
+        except TelegramRetryAfter as e:
+            chat.blocked = time.monotonic() + e.retry_after
+            request.retries += 1
+            if request.priority == LOW or request.retries > self.settings['max_retries']:
+                request.resolve(error=e)
+            else:
+                # Повтор - первым в своём чате, когда истечёт retry_after
+                self.retried += 1
+                heapq.heappush(chat.queue, request)
+        except Exception as e:
+            request.resolve(error=e)
+        else:
+            self.sent += 1
+            request.resolve(result)
+        finally:
+            chat.busy = False
+            self.schedule(chat_id, chat)
+
+    def sweep(self, now):
+        """Забыть чаты без очереди и с полным ведром"""
+        self.swept = now
+        for chat_id in [chat_id for chat_id, chat in self.chats.items() if chat.idle(now)]:
+            del self.chats[chat_id]
+
+    async def drain(self):
+        """Дождаться отправки всего, что стоит в очереди"""
+        while self.inflight or any(chat.queue for chat in self.chats.values()):
+            await asyncio.sleep(0.01)
+
+    async def close(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    def metrics(self):
+        return {
+            'queued': sum(len(chat.queue) for chat in self.chats.values()),
+            'chats': len(self.chats),
+            'sent': self.sent,
+            'merged': self.merged,
+            'retried': self.retried,
+            'dropped': self.dropped
+        }
@@ -0,0 +1,77 @@
+# Буферизованный криптостойкий генератор для игр
+# os.urandom читается большими блоками, а не системным вызовом на каждое число;
+# равномерность обеспечивает выборка с отклонением
+
+import os
+import secrets
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # пакетные раунды без numpy недоступны
+    np = None
+
+WORD = 1 << 32
+
+class BufferedRNG:
+    """Случайные числа из блоков os.urandom по 32-битным словам"""
+    def __init__(self, block_words=16384, source=os.urandom):
+        self.block_words = block_words
+        self.source = source
+        self.words = array('I')
+        self.pos = 0
+
+    def reset(self):
+        """Выбросить буфер (после fork у процессов не должно быть общих чисел)"""
+        self.words = array('I')
+        self.pos = 0
+
+    def word(self):
+        if self.pos >= len(self.words):
+            self.words = array('I', self.source(self.block_words * 4))
+            self.pos = 0
+        value = self.words[self.pos]
+        self.pos += 1
+        return value
+
+    def randbelow(self, n):
+        """Равномерное целое из [0, n)"""
+        if n <= 0:
+            raise ValueError("n должно быть положительным")
+        if n > WORD:
+            return secrets.randbelow(n)
+        # Слова из хвоста, не кратного n, отбрасываются - иначе остаток смещён
+        limit = WORD - WORD % n
+        while True:
+            value = self.word()
+            if value < limit:
+                return value % n
+
+    def choice(self, seq):
+        return seq[self.randbelow(len(seq))]
+
+    def randbelow_batch(self, n, size):
+        """numpy-массив из size равномерных целых из [0, n)"""
+        if np is None:
+            raise RuntimeError("Для пакетных раундов нужен numpy")
+        if not 0 < n <= WORD:
+            raise ValueError("n должно быть от 1 до 2**32")
+        limit = WORD - WORD % n
+        result = np.empty(size, dtype=np.int64)
+        filled = 0
+        while filled < size:
+            # Запас на отклонённые слова: их доля меньше n / 2**32
+            need = size - filled
+            words = np.frombuffer(self.source((need + need // 64 + 16) * 4), dtype=np.uint32)
+            accepted = words[words < limit][:need]
+            result[filled:filled + len(accepted)] = accepted % n
+            filled += len(accepted)
+        return result
+
+_rng = BufferedRNG()
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_rng.reset)
+
+randbelow = _rng.randbelow
+choice = _rng.choice
+randbelow_batch = _rng.randbelow_batch
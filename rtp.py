@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Точный RTP игр: перебор всех исходов из реестра games.py по таблице выплат, без симуляции
+Запуск: python rtp.py [--check]
+"""
+
+import os
+import sys
+import time
+from collections import Counter
+from fractions import Fraction
+from functools import lru_cache
+
+# Добавляем текущую директорию в путь для импорта
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import CRASH_SETTINGS, HOUSE_EDGE, PAYOUTS, RTP_TOLERANCE
+from crash import WORD
+import games
+
+def freeze(table):
+    """Таблица выплат -> хешируемый ключ для кэша"""
+    if isinstance(table, dict):
+        return tuple(sorted(((k, freeze(v)) for k, v in table.items()), key=lambda kv: str(kv[0])))
+    return table
+
+def thaw(frozen):
+    if isinstance(frozen, tuple):
+        return {k: thaw(v) for k, v in frozen}
+    return frozen
+
+@lru_cache(maxsize=64)
+def built(name, frozen):
+    """Игра из реестра, собранная по таблице выплат"""
+    return games.build(thaw(frozen), [name])[name]
+
+@lru_cache(maxsize=256)
+def exact_cached(variant, frozen):
+    name, bet = games.VARIANTS[variant]
+    table = built(name, frozen).tables[bet]
+    size = len(table)
+    rtp = second = Fraction(0)
+    # Исходы равновероятны: достаточно сгруппировать одинаковые множители
+    for mult, count in Counter(table).items():
+        mult = Fraction(repr(mult))  # 1.37 -> 137/100, а не двоичная дробь
+        prob = Fraction(count, size)
+        rtp += mult * prob
+        second += mult * mult * prob
+    return rtp, second - rtp * rtp
+
+def exact(variant, payouts=None):
+    """Точные (RTP, дисперсия множителя) вида ставки как Fraction; кэшируется по таблице выплат"""
+    return exact_cached(variant, freeze(PAYOUTS if payouts is None else payouts))
+
+@lru_cache(maxsize=16)
+def live_crash(house_edge=CRASH_SETTINGS['house_edge'], max_multiplier=CRASH_SETTINGS['max_multiplier']):
+    """Точные (RTP, дисперсия) Crash в реальном времени при самой выгодной игроку цели вывода.
+    Точка краша - crash.crash_point: P(краш >= n сотых) = floor(K / n) / WORD.
+    Вывод на a (ручной или авто) выигрывает, только если краш выше a"""
+    k = int((1 - house_edge) * 100 * WORD)
+    # RTP цели пропорционален cents * floor(K / (cents + 1)) - сравниваем целые числа
+    cents = max(range(101, round(max_multiplier * 100)), key=lambda c: c * (k // (c + 1)))
+    mult, prob = Fraction(cents, 100), Fraction(k // (cents + 1), WORD)
+    rtp = mult * prob
+    return rtp, mult * mult * prob - rtp * rtp
+
+def report(payouts=None):
+    """RTP, преимущество и дисперсия всех игр (Crash - по параметрам движка реального времени)"""
+    result = {}
+    for game in games.VARIANTS:
+        rtp, variance = exact(game, payouts)
+        result[game] = {'rtp': float(rtp), 'edge': float(1 - rtp), 'variance': float(variance)}
+    rtp, variance = live_crash()
+    result['crash'] = {'rtp': float(rtp), 'edge': float(1 - rtp), 'variance': float(variance)}
+    return result
+
+def check(payouts=None, house_edge=HOUSE_EDGE, tolerance=RTP_TOLERANCE):
+    """Игры, у которых точное преимущество расходится с конфигом"""
+    return [(game, r['edge'], house_edge[game]) for game, r in report(payouts).items()
+            if abs(r['edge'] - house_edge[game]) > tolerance]
+
+def main():
+    start = time.perf_counter()
+    results = report()
+    elapsed = (time.perf_counter() - start) * 1000
+    for game, r in results.items():
+        print(f"{game:16} RTP {r['rtp'] * 100:8.3f}%  преимущество {r['edge'] * 100:8.3f}% "
+              f"(в конфиге {HOUSE_EDGE[game] * 100:.3f}%)  σ² {r['variance']:.3f}")
+    print(f"\n⏱ {elapsed:.1f} мс")
+
+    if "--check" in sys.argv:
+        failures = check()
+        for game, edge, expected in failures:
+            print(f"❌ {game}: преимущество {edge * 100:.3f}%, в конфиге {expected * 100:.3f}%")
+        if failures:
+            sys.exit(1)
+        print("✅ Преимущество казино совпадает с конфигом")
+
+if __name__ == "__main__":
+    main()
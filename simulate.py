@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Симуляция Монте-Карло: RTP и преимущество казино по всем играм
+Запуск: python simulate.py [раундов на игру] [--check]
+"""
+
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Добавляем текущую директорию в путь для импорта
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import HOUSE_EDGE, RTP_TOLERANCE
+from games import VARIANTS
+
+GAMES = tuple(VARIANTS)
+
+CHUNK = 1 << 20  # раундов за один вызов пакетной функции
+Z95 = 1.96       # доверительный интервал в отчёте
+Z_CHECK = 3.29   # для проверки - 99.9%, чтобы CI не падал от случайности
+
+def game_batches():
+    """Пакетная функция каждого вида ставки: n -> массив множителей"""
+    from games import GAMES
+    return {variant: (lambda n, game=GAMES[name], bet=bet: game.batch(n, bet))
+            for variant, (name, bet) in VARIANTS.items()}
+
+def simulate_chunk(game, rounds):
+    """Сыграть rounds раундов (в процессе пула): количество, сумма и сумма квадратов множителей"""
+    batch = game_batches()[game]
+    total = total_sq = 0.0
+    done = 0
+    while done < rounds:
+        size = min(CHUNK, rounds - done)
+        mult = batch(size)
+        total += float(mult.sum())
+        total_sq += float((mult * mult).sum())
+        done += size
+    return rounds, total, total_sq
+
+def summarize(game, rounds, total, total_sq):
+    rtp = total / rounds
+    variance = max(total_sq / rounds - rtp * rtp, 0.0)
+    se = math.sqrt(variance / rounds)
+    return {
+        'game': game,
+        'rounds': rounds,
+        'rtp': rtp,
+        'edge': 1 - rtp,
+        'variance': variance,
+        'se': se,
+        'ci': (rtp - Z95 * se, rtp + Z95 * se)
+    }
+
+def simulate(rounds, games=GAMES, workers=None):
+    """RTP игр по rounds раундов на каждую, раунды делятся между процессами"""
+    workers = workers or os.cpu_count() or 1
+    parts = max(1, min(workers * 2, rounds // CHUNK))
+    sizes = [rounds // parts + (1 if i < rounds % parts else 0) for i in range(parts)]
+    with ProcessPoolExecutor(workers) as pool:
+        futures = {game: [pool.submit(simulate_chunk, game, size) for size in sizes] for game in games}
+        results = {}
+        for game, parts_of_game in futures.items():
+            n = total = total_sq = 0
+            for future in parts_of_game:
+                part_n, part_total, part_sq = future.result()
+                n += part_n
+                total += part_total
+                total_sq += part_sq
+            results[game] = summarize(game, n, total, total_sq)
+    return results
+
+def check(results, house_edge=HOUSE_EDGE, tolerance=RTP_TOLERANCE):
+    """Игры, у которых измеренное преимущество ушло от заданного в конфиге"""
+    failures = []
+    for game, r in results.items():
+        allowed = tolerance + Z_CHECK * r['se']
+        if abs(r['edge'] - house_edge[game]) > allowed:
+            failures.append((game, r['edge'], house_edge[game], allowed))
+    return failures
+
+def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    rounds = int(float(args[0])) if args else 10 ** 8
+    print(f"🎲 Монте-Карло: {rounds:,} раундов на игру, процессов: {os.cpu_count()}\n")
+
+    start = time.perf_counter()
+    results = simulate(rounds)
+    elapsed = time.perf_counter() - start
+
+    for game, r in results.items():
+        print(f"{game:16} RTP {r['rtp'] * 100:8.3f}% ± {Z95 * r['se'] * 100:.3f}  "
+              f"преимущество {r['edge'] * 100:8.3f}% (в конфиге {HOUSE_EDGE[game] * 100:.3f}%)  "
+              f"σ² {r['variance']:.3f}")
+    print(f"\n⏱ {rounds * len(results) / elapsed:,.0f} раундов/сек, {elapsed:.1f} сек")
+    losing = [game for game, r in results.items() if r['ci'][0] > 1]
+    if losing:
+        print(f"⚠️ Казино в минусе: {', '.join(losing)}")
+
+    if "--check" in sys.argv:
+        failures = check(results)
+        for game, edge, expected, allowed in failures:
+            print(f"❌ {game}: преимущество {edge * 100:.3f}%, ожидалось {expected * 100:.3f}% ± {allowed * 100:.3f}")
+        if failures:
+            sys.exit(1)
+        print("✅ Преимущество казино совпадает с конфигом")
+
+if __name__ == "__main__":
+    main()
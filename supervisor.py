@@ -0,0 +1,250 @@
+# Несколько процессов бота
+# Супервизор запускает N воркеров (bot.py --worker) и раздаёт им апдейты по user_id:
+# все апдейты игрока попадают в один и тот же воркер, поэтому его блокировки, кэш строк,
+# анимации и анти-чит остаются локальными и не требуют синхронизации между процессами.
+# Общий реестр балансов - база SQLite в режиме WAL: списания условные (balance >= ставки),
+# так что параллельные процессы не уводят баланс в минус. У каждого воркера свой раунд Crash
+
+import asyncio
+import logging
+import os
+import secrets
+import signal
+import sys
+
+import aiohttp
+from aiohttp import web
+
+from config import SUPERVISOR_SETTINGS, WEBHOOK_SETTINGS
+from webhook import wait_for_signal
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+BOT_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bot.py")
+
+def update_user(update):
+    """id игрока, от которого пришёл апдейт (без игрока - id чата, иначе 0)"""
+    for kind, event in update.items():
+        if isinstance(event, dict):
+            user = event.get('from') or event.get('user')
+            if user:
+                return user['id']
+            chat = event.get('chat') or (event.get('message') or {}).get('chat')
+            if chat:
+                return chat['id']
+    return 0
+
+def route(update, workers):
+    """Номер воркера для апдейта: один и тот же для всех апдейтов игрока"""
+    return update_user(update) % workers
+
+class Worker:
+    """Процесс bot.py --worker и очередь апдейтов для него (порядок апдейтов сохраняется)"""
+    def __init__(self, index, port):
+        self.index = index
+        self.port = port
+        self.url = f"http://127.0.0.1:{port}{WEBHOOK_SETTINGS['path']}"
+        self.process = None
+        self.queue = asyncio.Queue()
+        self.forwarded = 0
+        self.restarts = 0
+
+class Supervisor:
+    """Запуск воркеров, перезапуск упавших и доставка апдейтов по user_id"""
+    def __init__(self, workers=None, settings=None, env=None):
+        self.settings = dict(SUPERVISOR_SETTINGS, **(settings or {}))
+        count = workers or self.settings['workers']
+        self.workers = [Worker(i, self.settings['base_port'] + i) for i in range(count)]
+        self.env = env or {}
+        self.secret = secrets.token_urlsafe(32)
+        self.session = None
+        self.tasks = []
+        self.stopping = False
+
+    async def start(self):
+        """Запустить воркеры и дождаться, пока каждый начнёт принимать апдейты"""
+        self.session = aiohttp.ClientSession()
+        # Первый воркер применяет миграции базы, остальные стартуют после него
+        first, *rest = self.workers
+        await self.spawn(first)
+        await self.ready(first)
+        for worker in rest:
+            await self.spawn(worker)
+        await asyncio.gather(*(self.ready(worker) for worker in rest))
+        for worker in self.workers:
+            self.tasks.append(asyncio.create_task(self.forward(worker)))
+            self.tasks.append(asyncio.create_task(self.watch(worker)))
+        return self
+
+    async def spawn(self, worker):
+        env = dict(os.environ, **self.env, WORKER_INDEX=str(worker.index), WORKER_COUNT=str(len(self.workers)),
+                   WORKER_PORT=str(worker.port), WORKER_SECRET=self.secret)
+        worker.process = await asyncio.create_subprocess_exec(sys.executable, BOT_SCRIPT, "--worker", env=env)
+
+    async def ready(self, worker, timeout=60.0):
+        # Воркер готов, когда его вебхук отвечает (401 на запрос без секрета)
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            try:
+                async with self.session.post(worker.url, json={}) as resp:
+                    return resp.status
+            except aiohttp.ClientConnectionError:
+                if worker.process.returncode is not None or asyncio.get_running_loop().time() > deadline:
+                    raise RuntimeError(f"Воркер {worker.index} не запустился")
+                await asyncio.sleep(0.1)
+
+    async def watch(self, worker):
+        """Перезапустить воркер, если он завершился сам"""
+        while True:
+            code = await worker.process.wait()
+            if self.stopping:
+                return
+            logging.error(f"Воркер {worker.index} завершился с кодом {code}, перезапуск")
+            await asyncio.sleep(self.settings['restart_delay'])
+            worker.restarts += 1
+            await self.spawn(worker)
+
+    async def forward(self, worker):
+        """Отправлять апдейты воркеру по одному, пока он не примет очередной"""
+        while True:
+            update = await worker.queue.get()
+            while True:
+                try:
+                    async with self.session.post(worker.url, json=update,
+                                                 headers={SECRET_HEADER: self.secret}) as resp:
+                        if resp.status == 200:
+                            break
+                        logging.warning(f"Воркер {worker.index} ответил {resp.status} на апдейт")
+                        if resp.status < 500:
+                            break
+                except aiohttp.ClientError:
+                    pass  # воркер перезапускается - апдейт ждёт его
+                await asyncio.sleep(self.settings['restart_delay'])
+            worker.forwarded += 1
+
+    def dispatch(self, update):
+        self.workers[route(update, len(self.workers))].queue.put_nowait(update)
+
+    async def drain(self):
+        """Дождаться отправки всех апдейтов из очередей"""
+        while any(not worker.queue.empty() for worker in self.workers):
+            await asyncio.sleep(0.01)
+
+    async def poll(self, token, api_url="https://api.telegram.org"):
+        """Long polling от имени всех воркеров"""
+        url = f"{api_url.rstrip('/')}/bot{token}/getUpdates"
+        offset = None
+        while True:
+            params = {'timeout': self.settings['poll_timeout'], 'offset': offset}
+            try:
+                async with self.session.post(url, json=params,
+                                             timeout=aiohttp.ClientTimeout(total=params['timeout'] + 10)) as resp:
+                    result = await resp.json()
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logging.warning(f"Ошибка getUpdates: {e}")
+                await asyncio.sleep(1)
+                continue
+            if not result.get('ok'):
+                # 401 - неверный токен, 409 - ещё стоит вебхук; 429 - подождать retry_after
+                retry = (result.get('parameters') or {}).get('retry_after') or self.settings['restart_delay']
+                logging.error(f"getUpdates отклонён: {result.get('error_code')} {result.get('description')}")
+                await asyncio.sleep(max(retry, 1))
+                continue
+            for update in result['result']:
+                offset = update['update_id'] + 1
+                self.dispatch(update)
+
+    async def serve_webhook(self, token, url, secret, settings, api_url="https://api.telegram.org"):
+        """Принимать апдейты вебхуком Telegram и раздавать воркерам"""
+        async def handle(request):
+            if not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+                return web.Response(status=401)
+            try:
+                self.dispatch(await request.json())
+            except ValueError:
+                return web.Response(status=400)
+            return web.Response()
+
+        app = web.Application()
+        app.router.add_post(settings['path'], handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, settings['host'], settings['port']).start()
+        try:
+            async with self.session.post(f"{api_url.rstrip('/')}/bot{token}/setWebhook", json={
+                    'url': url.rstrip("/") + settings['path'], 'secret_token': secret,
+                    'max_connections': min(settings['max_concurrency'], 100)}) as resp:
+                if not (await resp.json()).get('ok'):
+                    raise RuntimeError("Telegram не принял вебхук")
+            print(f"🌐 Вебхук слушает {settings['host']}:{settings['port']}{settings['path']}")
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    async def stop(self, timeout=10.0):
+        """Остановить воркеры (SIGTERM - бот сбрасывает историю, возвращает ставки и закрывает базу)"""
+        self.stopping = True
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        # Сигнал мог прийти, пока воркеры ещё запускались
+        started = [worker for worker in self.workers if worker.process is not None]
+        for worker in started:
+            if worker.process.returncode is None:
+                worker.process.send_signal(signal.SIGTERM)
+        for worker in started:
+            try:
+                await asyncio.wait_for(worker.process.wait(), timeout)
+            except asyncio.TimeoutError:
+                worker.process.kill()
+                await worker.process.wait()
+        if self.session is not None:
+            await self.session.close()
+
+    def metrics(self):
+        return {
+            'workers': len(self.workers),
+            'forwarded': [worker.forwarded for worker in self.workers],
+            'queued': sum(worker.queue.qsize() for worker in self.workers),
+            'restarts': sum(worker.restarts for worker in self.workers),
+        }
+
+async def run(supervisor, token, api_url):
+    await supervisor.start()
+    print(f"🧩 Запущено воркеров: {len(supervisor.workers)}")
+    if "--webhook" in sys.argv or os.getenv("BOT_MODE") == "webhook":
+        settings = dict(WEBHOOK_SETTINGS, port=int(os.getenv("PORT", WEBHOOK_SETTINGS['port'])))
+        url = os.getenv("WEBHOOK_URL")
+        if not url:
+            raise ValueError("Не задан WEBHOOK_URL для режима вебхука")
+        await supervisor.serve_webhook(token, url, os.getenv("WEBHOOK_SECRET") or secrets.token_urlsafe(32),
+                                       settings, api_url)
+    else:
+        await supervisor.poll(token, api_url)
+
+async def main(workers):
+    from dotenv import load_dotenv
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    token = os.getenv("BOT_TOKEN", "YOUR_BOT_TOKEN_HERE")
+    api_url = os.getenv("BOT_API_URL") or "https://api.telegram.org"
+    supervisor = Supervisor(workers)
+    # SIGTERM/SIGINT - в том числе пока воркеры запускаются: остановка всегда идёт через stop(),
+    # воркеры получают SIGTERM и успевают сохранить состояние
+    serving = asyncio.create_task(run(supervisor, token, api_url))
+    signalled = asyncio.create_task(wait_for_signal())
+    try:
+        await asyncio.wait([serving, signalled], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        serving.cancel()
+        signalled.cancel()
+        await asyncio.gather(serving, signalled, return_exceptions=True)
+        await supervisor.stop()
+    if not serving.cancelled():
+        serving.result()  # ошибка запуска (нет WEBHOOK_URL, воркер не поднялся)
+
+if __name__ == "__main__":
+    count = int(sys.argv[sys.argv.index("--workers") + 1]) if "--workers" in sys.argv else None
+    try:
+        asyncio.run(main(count))
+    except KeyboardInterrupt:
+        pass
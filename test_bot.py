@@ -1,283 +1,1909 @@
-#!/usr/bin/env python3
-"""
-Тестовый скрипт для проверки функций казино-бота
-Запуск: python test_bot.py
-"""
-
-import sqlite3
-import sys
-import os
-
-# Добавляем текущую директорию в путь для импорта
-sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-
-def test_database():
-    """Тест базы данных"""
-    print("🧪 Тестирование базы данных...")
-
-    try:
-        from bot import Database
-        db = Database()
-
-        # Тест создания пользователя
-        test_user_id = 999999999
-        db.create_user(test_user_id, "test_user")
-        user = db.get_user(test_user_id)
-
-        if user and user[2] == 1000:  # Стартовый баланс
-            print("✅ Создание пользователя работает")
-        else:
-            print("❌ Ошибка создания пользователя")
-            return False
-
-        # Тест обновления баланса
-        db.update_balance(test_user_id, 500)
-        balance = db.get_balance(test_user_id)
-
-        if balance == 1500:
-            print("✅ Обновление баланса работает")
-        else:
-            print("❌ Ошибка обновления баланса")
-            return False
-
-        # Тест промокода
-        db.create_promo("TEST123", 777, 1)
-        success, msg = db.use_promo(test_user_id, "TEST123")
-
-        if success:
-            print("✅ Система промокодов работает")
-        else:
-            print("❌ Ошибка промокодов")
-            return False
-
-        # Очистка тестовых данных
-        cursor = db.conn.cursor()
-        cursor.execute('DELETE FROM users WHERE user_id = ?', (test_user_id,))
-        cursor.execute('DELETE FROM promo_codes WHERE code = ?', ("TEST123",))
-        cursor.execute('DELETE FROM used_promos WHERE user_id = ?', (test_user_id,))
-        db.conn.commit()
-
-        print("✅ База данных протестирована успешно")
-        return True
-
-    except Exception as e:
-        print(f"❌ Ошибка тестирования БД: {e}")
-        return False
-
-def test_games():
-    """Тест игровых функций"""
-    print("\n🎮 Тестирование игр...")
-
-    try:
-        # Импортируем игровые функции из bot.py
-        from bot import coinflip, dice, slots, roulette
-
-        # Тест монетки
-        won, msg, mult = coinflip('heads')
-        if isinstance(won, bool) and isinstance(mult, float):
-            print("✅ Монетка работает")
-        else:
-            print("❌ Ошибка в монетке")
-            return False
-
-        # Тест костей
-        won, msg, mult = dice()
-        if isinstance(won, bool) and mult in [0.0, 2.0, 5.0]:
-            print("✅ Кости работают")
-        else:
-            print("❌ Ошибка в костях")
-            return False
-
-        # Тест слотов
-        won, msg, mult = slots()
-        if isinstance(won, bool) and mult in [0.0, 3.0, 10.0]:
-            print("✅ Слоты работают")
-        else:
-            print("❌ Ошибка в слотах")
-            return False
-
-        # Тест рулетки
-        won, msg, mult = roulette('color', 'red')
-        if isinstance(won, bool) and isinstance(mult, float):
-            print("✅ Рулетка работает")
-        else:
-            print("❌ Ошибка в рулетке")
-            return False
-
-        print("✅ Все игры протестированы успешно")
-        return True
-
-    except Exception as e:
-        print(f"❌ Ошибка тестирования игр: {e}")
-        return False
-
-def test_config():
-    """Тест конфигурации"""
-    print("\n⚙️ Проверка конфигурации...")
-
-    # Проверка .env файла
-    if os.path.exists('.env'):
-        print("✅ Файл .env найден")
-
-        from dotenv import load_dotenv
-        load_dotenv()
-
-        bot_token = os.getenv("BOT_TOKEN")
-        admin_id = os.getenv("ADMIN_ID")
-
-        if bot_token and bot_token != "YOUR_BOT_TOKEN_HERE":
-            print("✅ BOT_TOKEN настроен")
-        else:
-            print("⚠️ BOT_TOKEN не настроен - получите токен у @BotFather")
-
-        if admin_id and admin_id != "123456789":
-            print("✅ ADMIN_ID настроен")
-        else:
-            print("⚠️ ADMIN_ID не настроен - укажите ваш Telegram ID")
-    else:
-        print("⚠️ Файл .env не найден")
-
-    # Проверка зависимостей
-    try:
-        import aiogram
-        print("✅ aiogram установлен")
-    except ImportError:
-        print("❌ aiogram не установлен")
-        return False
-
-    try:
-        from dotenv import load_dotenv
-        print("✅ python-dotenv установлен")
-    except ImportError:
-        print("❌ python-dotenv не установлен")
-        return False
-
-    return True
-
-def test_performance():
-    """Тест производительности"""
-    print("\n⚡ Тест производительности...")
-
-    import time
-
-    try:
-        from bot import coinflip, dice, slots
-
-        # Тест скорости игр
-        start_time = time.time()
-        for _ in range(1000):
-            coinflip('heads')
-            dice()
-            slots()
-        end_time = time.time()
-
-        games_per_second = 3000 / (end_time - start_time)
-        print(f"✅ Скорость игр: {games_per_second:.0f} игр/сек")
-
-        # Тест базы данных
-        from bot import Database
-        db = Database()
-
-        start_time = time.time()
-        test_user = 888888888
-
-        for i in range(100):
-            db.create_user(test_user + i, f"test_user_{i}")
-            db.update_balance(test_user + i, 100)
-            db.add_game(test_user + i, "test", 100, 200, 2.0)
-
-        end_time = time.time()
-        operations_per_second = 300 / (end_time - start_time)
-        print(f"✅ Скорость БД: {operations_per_second:.0f} операций/сек")
-
-        # Очистка тестовых данных
-        cursor = db.conn.cursor()
-        for i in range(100):
-            cursor.execute('DELETE FROM users WHERE user_id = ?', (test_user + i,))
-            cursor.execute('DELETE FROM games WHERE user_id = ?', (test_user + i,))
-        db.conn.commit()
-
-        return True
-
-    except Exception as e:
-        print(f"❌ Ошибка теста производительности: {e}")
-        return False
-
-def show_statistics():
-    """Показать статистику если бот уже работал"""
-    print("\n📊 Статистика (если есть данные)...")
-
-    if not os.path.exists('casino.db'):
-        print("ℹ️ База данных пока не создана")
-        return
-
-    try:
-        conn = sqlite3.connect('casino.db')
-        c = conn.cursor()
-
-        # Проверяем наличие данных
-        users_count = c.execute('SELECT COUNT(*) FROM users').fetchone()[0]
-        games_count = c.execute('SELECT COUNT(*) FROM games').fetchone()[0]
-
-        if users_count == 0:
-            print("ℹ️ Пользователей пока нет")
-        else:
-            print(f"👥 Пользователей: {users_count}")
-            print(f"🎮 Игр сыграно: {games_count}")
-
-            # Популярные игры
-            popular = c.execute('''
-                SELECT game_type, COUNT(*) as count
-                FROM games
-                GROUP BY game_type
-                ORDER BY count DESC
-                LIMIT 3
-            ''').fetchall()
-
-            if popular:
-                print("🏆 Популярные игры:")
-                for game, count in popular:
-                    print(f"  • {game}: {count} игр")
-
-        conn.close()
-
-    except Exception as e:
-        print(f"❌ Ошибка получения статистики: {e}")
-
-def main():
-    print("🎰 Тестирование Казино-Бота 🎰\n")
-
-    results = []
-
-    # Запускаем все тесты
-    results.append(("Конфигурация", test_config()))
-    results.append(("База данных", test_database()))
-    results.append(("Игровые функции", test_games()))
-    results.append(("Производительность", test_performance()))
-
-    # Показываем статистику
-    show_statistics()
-
-    # Итоги
-    print("\n" + "="*50)
-    print("📋 РЕЗУЛЬТАТЫ ТЕСТИРОВАНИЯ:")
-    print("="*50)
-
-    passed = 0
-    for test_name, result in results:
-        status = "✅ ПРОЙДЕН" if result else "❌ ПРОВАЛЕН"
-        print(f"{test_name:20} {status}")
-        if result:
-            passed += 1
-
-    print(f"\nИтого: {passed}/{len(results)} тестов пройдено")
-
-    if passed == len(results):
-        print("\n🎉 Все тесты пройдены! Бот готов к запуску!")
-        print("Запустите: python bot.py")
-    else:
-        print("\n⚠️ Есть проблемы. Проверьте настройки.")
-        print("Инструкция: python run.py check")
-
-if __name__ == "__main__":
-    main()
+#!/usr/bin/env python3
+"""
+Тестовый скрипт для проверки функций казино-бота
+Запуск: python test_bot.py
+"""
+
+import sqlite3
+import sys
+import os
+
+# Добавляем текущую директорию в путь для импорта
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+def test_database():
+    """Тест базы данных"""
+    print("🧪 Тестирование базы данных...")
+
+    import asyncio
+
+    async def run():
+        from database import DB
+        db = await DB().connect()
+
+        try:
+            # Тест создания пользователя
+            test_user_id = 999999999
+            await db.create_user(test_user_id, "test_user")
+            user = await db.get_user(test_user_id)
+
+            if user and user[2] == 1000:  # Стартовый баланс
+                print("✅ Создание пользователя работает")
+            else:
+                print("❌ Ошибка создания пользователя")
+                return False
+
+            # Тест обновления баланса
+            await db.update_balance(test_user_id, 500)
+            balance = await db.get_balance(test_user_id)
+
+            if balance == 1500:
+                print("✅ Обновление баланса работает")
+            else:
+                print("❌ Ошибка обновления баланса")
+                return False
+
+            # Тест промокода
+            await db.create_promo("TEST123", 777, 1)
+            success, msg = await db.use_promo(test_user_id, "TEST123")
+
+            if success:
+                print("✅ Система промокодов работает")
+            else:
+                print("❌ Ошибка промокодов")
+                return False
+
+            print("✅ База данных протестирована успешно")
+            return True
+
+        finally:
+            # Очистка тестовых данных
+            await db.conn.execute('DELETE FROM users WHERE user_id = ?', (test_user_id,))
+            await db.conn.execute('DELETE FROM promo_codes WHERE code = ?', ("TEST123",))
+            await db.conn.execute('DELETE FROM used_promos WHERE user_id = ?', (test_user_id,))
+            await db.conn.commit()
+            await db.close()
+
+    try:
+        return asyncio.run(run())
+    except Exception as e:
+        print(f"❌ Ошибка тестирования БД: {e}")
+        return False
+
+def test_settlement():
+    """Тест расчёта раунда одной транзакцией"""
+    print("\n💰 Тестирование расчёта раундов...")
+
+    import asyncio
+    import tempfile
+
+    async def run(path):
+        from database import DB
+        db = await DB(path).connect()
+        try:
+            await db.create_user(1, "player")
+
+            # Выигрыш: списание 100 и зачисление 200 одной транзакцией
+            result = await db.settle_round(1, "dice", 100, 2.0)
+            user = await db.get_user(1)
+            if result != 200 or user[2] != 1100 or user[4] != 1 or user[5] != 1:
+                print("❌ Ошибка расчёта выигрыша")
+                return False
+
+            # Ставка больше баланса не проходит и ничего не меняет
+            result = await db.settle_round(1, "dice", 5000, 5.0)
+            games = (await db.fetchone('SELECT COUNT(*) FROM games'))[0]
+            if result is not None or await db.get_balance(1) != 1100 or games != 1:
+                print("❌ Ставка без средств прошла")
+                return False
+
+            # Двухшаговая игра: ставка списана заранее
+            if not await db.place_bet(1, 1100) or await db.place_bet(1, 100):
+                print("❌ Ошибка списания ставки")
+                return False
+            await db.settle_round(1, "coinflip", 1100, 0.0, prepaid=True)
+            user = await db.get_user(1)
+            if user[2] != 0 or user[4] != 2 or user[5] != 1:
+                print("❌ Ошибка расчёта проигрыша")
+                return False
+
+            # Параллельные ставки не уводят баланс в минус
+            await db.update_balance(1, 1000)
+            results = await asyncio.gather(*(db.settle_round(1, "dice", 300, 0.0) for _ in range(10)))
+            if sum(r is not None for r in results) != 3 or await db.get_balance(1) != 100:
+                print("❌ Параллельные ставки списали больше баланса")
+                return False
+
+            # Ставка выше максимальной отклоняется обработчиком, до базы не доходит
+            import bot
+            from aiogram.fsm.storage.memory import MemoryStorage
+            from bench import FakeMessage, make_state
+            old_db, bot.db = bot.db, db
+            try:
+                state = make_state(MemoryStorage(), 1)
+                await state.set_state(bot.GameStates.waiting_bet)
+                await state.set_data({'game': 'dice'})
+                message = FakeMessage(1, str(10 ** 20))
+                await bot.handle_bet(message, state)
+            finally:
+                bot.db = old_db
+            if message.answers != [bot.TEXTS['max_bet_error']] or await db.get_balance(1) != 100 \
+                    or await state.get_state() != bot.GameStates.waiting_bet:
+                print(f"❌ Ставка выше максимальной принята: {message.answers}")
+                return False
+
+            # Сбой commit откатывает транзакцию: следующая запись не зафиксирует списание
+            # несостоявшегося раунда, а его строка не попадает в очередь истории
+            batched = await DB(path + '.batch', {'history_batch': True}).connect()
+            try:
+                await batched.create_user(1)
+                commit = batched.conn.commit
+                async def failing_commit():
+                    raise sqlite3.OperationalError("disk I/O error")
+                batched.conn.commit = failing_commit
+                failed = []
+                for call in (batched.settle_round(1, "dice", 100, 2.0), batched.add_game(1, "dice", 100, 0, 0.0),
+                             batched.use_promo(1, "NONE"), batched.update_balance(1, 100)):
+                    try:
+                        await call
+                    except sqlite3.OperationalError:
+                        failed.append(True)
+                batched.conn.commit = commit
+                await batched.update_balance(1, 0)
+                row = await batched.conn.execute_fetchall('SELECT balance, total_games FROM users')
+                if len(failed) != 3 or batched.conn.in_transaction or batched.history.queue or row != [(1000, 0)]:
+                    print(f"❌ Сбой commit оставил изменения: {row}, {batched.history.queue}")
+                    return False
+            finally:
+                await batched.close()
+
+            print("✅ Расчёт раундов работает")
+            return True
+        finally:
+            await db.close()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(run(os.path.join(tmp, 'test.db')))
+    except Exception as e:
+        print(f"❌ Ошибка тестирования расчёта: {e}")
+        return False
+
+def test_storage_profile():
+    """Тест WAL и пула читателей"""
+    print("\n🗄 Тестирование профиля хранилища...")
+
+    import asyncio
+    import tempfile
+
+    async def run(path):
+        from database import DB
+        db = await DB(path).connect()
+        try:
+            mode = (await db.conn.execute_fetchall('PRAGMA journal_mode'))[0][0]
+            if mode != 'wal':
+                print(f"❌ Режим журнала: {mode}")
+                return False
+
+            # Открытая транзакция записи не мешает читателям
+            await db.create_user(1, "player")
+            await db.conn.execute('UPDATE users SET balance = 0 WHERE user_id = 1')
+            balance = await asyncio.wait_for(db.get_balance(1), 1.0)
+            await db.conn.rollback()
+            if balance != 1000:
+                print("❌ Читатель увидел незафиксированные данные")
+                return False
+
+            print("✅ WAL и пул читателей работают")
+            return True
+        finally:
+            await db.close()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(run(os.path.join(tmp, 'test.db')))
+    except Exception as e:
+        print(f"❌ Ошибка тестирования хранилища: {e}")
+        return False
+
+def test_history_batch():
+    """Тест групповой записи истории игр"""
+    print("\n📝 Тестирование групповой записи истории...")
+
+    import asyncio
+    import tempfile
+
+    async def run(path):
+        from database import DB
+        db = await DB(path, {'history_batch': True, 'history_batch_size': 5, 'history_flush_ms': 60000}).connect()
+        try:
+            await db.create_user(1, "player")
+            for _ in range(7):
+                await db.settle_round(1, "dice", 100, 2.0)
+
+            # Баланс виден сразу, история - пачками
+            user = await db.get_user(1)
+            if user[2] != 1700 or user[4] != 7:
+                print("❌ Баланс не записан сразу")
+                return False
+            await asyncio.sleep(0.1)
+            games = (await db.fetchone('SELECT COUNT(*) FROM games'))[0]
+            if games < 5 or games + db.history.metrics()['queue_depth'] != 7:
+                print(f"❌ Пачка по размеру не записана: {games}")
+                return False
+        finally:
+            await db.close()
+
+        # Остаток очереди записан при остановке
+        db = await DB(path).connect()
+        try:
+            games = (await db.fetchone('SELECT COUNT(*) FROM games'))[0]
+            if games != 7:
+                print(f"❌ История потеряна при остановке: {games}")
+                return False
+        finally:
+            await db.close()
+
+        print("✅ Групповая запись истории работает")
+        return True
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(run(os.path.join(tmp, 'test.db')))
+    except Exception as e:
+        print(f"❌ Ошибка тестирования истории: {e}")
+        return False
+
+def test_leaderboard():
+    """Тест рейтинга в памяти против полной сортировки и снимка первой страницы"""
+    print("\n🏆 Тестирование рейтинга...")
+
+    import random
+
+    try:
+        from leaderboard import Leaderboard
+        board = Leaderboard()
+        board.LOAD = 8  # маленькие блоки, чтобы проверить разбиение и удаление блоков
+        balances = {user_id: random.randint(0, 5000) for user_id in range(300)}
+        board.load(balances.items())
+
+        for _ in range(3000):
+            user_id = random.randrange(400)
+            if random.random() < 0.05:
+                board.remove(user_id)
+                balances.pop(user_id, None)
+            else:
+                balances[user_id] = random.randint(0, 5000)
+                board.update(user_id, balances[user_id])
+
+        expected = sorted(balances.items(), key=lambda item: (-item[1], item[0]))
+        if board.page(0, len(expected)) != expected or board.page(37, 10) != expected[37:47]:
+            print("❌ Порядок рейтинга неверен")
+            return False
+        for place, (user_id, balance) in enumerate(expected, 1):
+            if board.rank(user_id) != place:
+                print(f"❌ Неверное место игрока {user_id}")
+                return False
+
+        # Снимок первой страницы: сбрасывается только изменениями у порога и по ttl
+        import asyncio
+        from leaderboard import TopCache
+        board.load([(1, 500), (2, 400), (3, 300), (4, 100), (5, 50)])
+        now = 0.0
+        cache = TopCache(board, size=3, ttl=60, clock=lambda: now)
+        builds = []
+
+        async def build():
+            builds.append(board.page(0, 3))
+            await asyncio.sleep(0.01)
+            return builds[-1]
+
+        def change(user_id, balance):
+            board.update(user_id, balance)
+            cache.observe(user_id, balance)
+
+        async def run():
+            await cache.get(build)
+            await cache.get(build)
+            change(5, 200)                   # ниже порога - снимок прежний
+            fresh = await cache.get(build)
+            change(4, 350)                   # обошёл третьего
+            changed = await cache.get(build)
+            change(1, 600)                   # игрок из снимка
+            during = await asyncio.gather(cache.get(build), cache.get(build), cache.get(build))
+            return fresh, changed, during
+
+        fresh, changed, during = asyncio.run(run())
+        now = 61.0
+        asyncio.run(cache.get(build))
+        m = cache.metrics()
+        if len(builds) != 4 or fresh != [(1, 500), (2, 400), (3, 300)] or changed[2] != (4, 350) \
+                or during[0][0] != (1, 600) or during[1] != changed or m['previous'] != 2 or m['hits'] != 2:
+            print(f"❌ Ошибка снимка рейтинга: {builds}, {m}")
+            return False
+
+        print("✅ Рейтинг работает")
+        return True
+
+    except Exception as e:
+        print(f"❌ Ошибка тестирования рейтинга: {e}")
+        return False
+
+def test_rollups():
+    """Тест сводных таблиц статистики"""
+    print("\n📊 Тестирование сводной статистики...")
+
+    import asyncio
+    import tempfile
+
+    async def run(path):
+        from config import ADMIN_STATS_QUERIES
+        from database import DB
+        from extra_games import get_detailed_stats
+        db = await DB(path).connect()
+        try:
+            for user_id in (1, 2):
+                await db.create_user(user_id, f"player{user_id}")
+                await db.update_balance(user_id, 10000)
+            for i in range(20):
+                await db.settle_round(1 + i % 2, ("dice", "slots")[i % 3 == 0], 100 + i, (0.0, 2.0)[i % 2])
+
+            expected = await db.fetchall('''SELECT DATE(created_at), game_type, COUNT(*), SUM(bet), SUM(result)
+                                            FROM games GROUP BY 1, 2 ORDER BY 1, 2''')
+            query = 'SELECT day, game_type, games, bets, payouts FROM stats_daily ORDER BY 1, 2'
+            if await db.fetchall(query) != expected:
+                print("❌ Сводные таблицы расходятся с историей")
+                return False
+
+            users, games, bets, wins = await db.get_stats()
+            if (users, games, bets) != (2, 20, sum(100 + i for i in range(20))):
+                print("❌ Ошибка общей статистики")
+                return False
+
+            # Пересчёт с нуля даёт тот же результат
+            await db.write('DELETE FROM stats_daily')
+            await db.backfill_rollups()
+            if await db.fetchall(query) != expected:
+                print("❌ Ошибка пересчёта сводных таблиц")
+                return False
+
+            for name, sql in ADMIN_STATS_QUERIES.items():
+                await db.fetchall(sql)
+            stats = await get_detailed_stats(db)
+            if stats['top_winners'][0][0] != "player2":
+                print("❌ Ошибка топа по выигрышам")
+                return False
+
+            print("✅ Сводная статистика работает")
+            return True
+        finally:
+            await db.close()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(run(os.path.join(tmp, 'test.db')))
+    except Exception as e:
+        print(f"❌ Ошибка тестирования статистики: {e}")
+        return False
+
+def test_query_plans():
+    """Тест: ни один запрос бота не сканирует большие таблицы целиком"""
+    print("\n🔎 Проверка планов запросов...")
+
+    import asyncio
+    import re
+    import sqlite3
+    import tempfile
+
+    statements = []
+
+    class TracingConnection(sqlite3.Connection):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.set_trace_callback(statements.append)
+
+    # Намеренные полные проходы: загрузка рейтинга и отмеченных анти-читом при старте, миграция 6
+    allowed = {'SELECT user_id, balance FROM users',
+               'INSERT OR IGNORE INTO user_versions SELECT user_id, rowid FROM users',
+               "SELECT user_id, state FROM anticheat_state WHERE json_array_length(state, '$[9]') > 0"}
+    # Сводная таблица по дням и играм мала по построению
+    small_tables = {'stats_daily'}
+
+    async def run(path):
+        from config import ADMIN_STATS_QUERIES
+        from database import DB
+        from aiogram.fsm.storage.base import StorageKey
+        from extra_games import AntiCheat, get_detailed_stats
+        from fsm_storage import SQLiteStorage
+
+        db = DB(path)
+        db.connection_factory = TracingConnection
+        await db.connect()
+        try:
+            await db.create_user(1, "player")
+            await db.get_user(1)
+            await db.get_balance(1)
+            await db.update_balance(1, 1000)
+            if await db.can_bonus(1):
+                await db.claim_bonus(1)
+            await db.place_bet(1, 100)
+            await db.settle_round(1, "coinflip", 100, 2.0, prepaid=True)
+            await db.settle_round(1, "dice", 100, 0.0)
+            await db.add_game(1, "slots", 100, 300, 3.0)
+            await db.get_top(10)
+            await db.get_top(10, 10)
+            await db.refresh_leaderboard()
+            await db.get_stats()
+            await db.create_promo("PLAN", 100, 5)
+            await db.use_promo(1, "PLAN")
+            await AntiCheat.check_user_activity(db, 1)
+            await AntiCheat.check_win_rate(db, 1)
+            await db.anticheat.fetch(db, [2, 3])
+            storage, key = SQLiteStorage(db), StorageKey(bot_id=1, chat_id=1, user_id=1)
+            await storage.set_state(key, 'GameStates:waiting_choice')
+            await storage.update_data(key, {'bet': 100})
+            await storage.get_state(key)
+            await storage.pop(key)
+            await storage.sweep()
+            await get_detailed_stats(db)
+            for sql in ADMIN_STATS_QUERIES.values():
+                await db.fetchall(sql)
+        finally:
+            await db.close()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'test.db')
+            asyncio.run(run(path))
+
+            conn = sqlite3.connect(path)
+            queries = {' '.join(sql.split()) for sql in statements
+                       if re.match(r'\s*(SELECT|UPDATE|DELETE|INSERT|WITH)\b', sql, re.I)}
+            used = set()
+            for sql in sorted(queries - allowed):
+                plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql)]
+                for detail in plan:
+                    used.update(re.findall(r'INDEX (\w+)', detail))
+                    scan = re.match(r'SCAN (\w+)$', detail)
+                    if scan and scan.group(1) not in small_tables:
+                        print(f"❌ Полный проход таблицы: {sql}\n   {detail}")
+                        return False
+            # История игр только пишется: индексы на ней удорожали бы каждую запись
+            indexes = conn.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'games'").fetchall()
+            conn.close()
+            if indexes:
+                print(f"❌ Лишние индексы на games: {indexes}")
+                return False
+
+        if 'idx_fsm_expires' not in used:
+            print("❌ Очистка состояний FSM не использует индекс fsm_states(expires_at)")
+            return False
+
+        print(f"✅ Проверено запросов: {len(queries)}, полных проходов нет")
+        return True
+
+    except Exception as e:
+        print(f"❌ Ошибка проверки планов: {e}")
+        return False
+
+def test_user_cache():
+    """Тест сквозного LRU-кэша игроков"""
+    print("\n🧠 Тестирование кэша игроков...")
+
+    import asyncio
+    import tempfile
+
+    async def run(path):
+        from database import DB
+        db = await DB(path, {'user_cache_size': 2}).connect()
+        try:
+            await db.create_user(1, "player")
+            await db.update_balance(1, 1000)
+
+            # Меню, ставка, профиль: все чтения из кэша
+            await db.get_balance(1)
+            await db.settle_round(1, "dice", 100, 5.0)
+            await db.can_bonus(1)
+            user = await db.get_user(1)
+            m = db.users.metrics()
+            if m['misses'] != 0 or m['hits'] != 3:
+                print(f"❌ Чтения ушли в базу: {m}")
+                return False
+            if user != await db.fetchone('SELECT * FROM users WHERE user_id = 1') or user[2] != 2400:
+                print("❌ Кэш разошёлся с базой")
+                return False
+
+            # Вытеснение по размеру
+            await db.create_user(2)
+            await db.create_user(3)
+            if 1 in db.users.rows or db.users.metrics()['evictions'] != 1:
+                print("❌ Ошибка вытеснения")
+                return False
+            if await db.get_balance(1) != 2400 or db.users.metrics()['misses'] != 1:
+                print("❌ Ошибка чтения после вытеснения")
+                return False
+
+            print("✅ Кэш игроков работает")
+            return True
+        finally:
+            await db.close()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(run(os.path.join(tmp, 'test.db')))
+    except Exception as e:
+        print(f"❌ Ошибка тестирования кэша: {e}")
+        return False
+
+def test_user_locks():
+    """Тест блокировок по игрокам: параллельные ставки одного игрока"""
+    print("\n🔒 Тестирование блокировок...")
+
+    import asyncio
+    import tempfile
+
+    async def run(path):
+        import bot
+        from aiogram.fsm.storage.memory import MemoryStorage
+        from bench import FakeMessage, FakeCallback, make_state
+        from database import DB
+
+        db = await DB(path).connect()
+        old_db, bot.db = bot.db, db
+        try:
+            users = range(1, 11)
+            for user_id in users:
+                await db.create_user(user_id)
+
+            # 1000 ставок по 300 очков одновременно: у каждой своё состояние,
+            # поэтому порядок держат только блокировки и условное списание
+            async def bet(user_id):
+                state = make_state(MemoryStorage(), user_id)
+                await state.set_state(bot.GameStates.waiting_bet)
+                await state.update_data(game="dice")
+                await bot.handle_bet(FakeMessage(user_id, "300"), state)
+
+            await asyncio.gather(*(bet(user_id) for user_id in users for _ in range(100)))
+
+            for user_id in users:
+                balance = await db.get_balance(user_id)
+                row = await db.fetchone(
+                    'SELECT COUNT(*), COALESCE(SUM(result - bet), 0) FROM games WHERE user_id = ?', (user_id,))
+                if balance < 0 or balance != 1000 + row[1] or row[0] == 0:
+                    print(f"❌ Баланс игрока {user_id} разошёлся с историей: {balance}, {row}")
+                    return False
+            if len(bot.user_locks):
+                print("❌ Блокировки не освобождаются")
+                return False
+
+            # Двойное нажатие на выбор: ставка рассчитывается один раз
+            await db.update_balance(1, 1000)
+            state = make_state(MemoryStorage(), 1)
+            await state.set_state(bot.GameStates.waiting_bet)
+            await state.update_data(game="coinflip")
+            await bot.handle_bet(FakeMessage(1, "500"), state)
+            before = (await db.fetchone('SELECT COUNT(*) FROM games WHERE user_id = 1'))[0]
+            await asyncio.gather(*(bot.handle_pick(FakeCallback(1, "pick_heads"), state) for _ in range(5)))
+            after = (await db.fetchone('SELECT COUNT(*) FROM games WHERE user_id = 1'))[0]
+            if after - before != 1:
+                print(f"❌ Ставка рассчитана {after - before} раз")
+                return False
+
+            print("✅ Блокировки работают")
+            return True
+        finally:
+            bot.db = old_db
+            await db.close()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(run(os.path.join(tmp, 'test.db')))
+    except Exception as e:
+        print(f"❌ Ошибка тестирования блокировок: {e}")
+        return False
+
+def test_webhook():
+    """Тест режима вебхука: записанные апдейты POST-запросами в локальный сервер"""
+    print("\n🌐 Тестирование вебхука...")
+
+    import asyncio
+    import tempfile
+
+    # Апдейт /start в том виде, как его присылает Telegram
+    START_UPDATE = {
+        "update_id": 100000001,
+        "message": {
+            "message_id": 1,
+            "from": {"id": 777, "is_bot": False, "first_name": "Тест", "username": "tester", "language_code": "ru"},
+            "chat": {"id": 777, "first_name": "Тест", "username": "tester", "type": "private"},
+            "date": 1700000000,
+            "text": "/start",
+            "entities": [{"offset": 0, "length": 6, "type": "bot_command"}]
+        }
+    }
+
+    async def run(path):
+        import bot
+        from aiohttp import ClientSession
+        from aiohttp.test_utils import TestServer
+        from bench import StubBotAPI, make_update
+        from database import DB
+        from webhook import SECRET_HEADER, make_app
+
+        db = await DB(path).connect()
+        old_db, bot.db = bot.db, db
+        bot.storage.db = db
+        api = await StubBotAPI(latency=0.05).start()
+        tg = api.bot()
+        app = make_app(bot.dp, tg, "test-secret", max_concurrency=2)
+        handler = app['webhook']
+        server = TestServer(app)
+        await server.start_server()
+        url = server.make_url("/webhook")
+        try:
+            async with ClientSession() as session:
+                async def post(update, secret="test-secret"):
+                    async with session.post(url, json=update, headers={SECRET_HEADER: secret}) as resp:
+                        return resp.status
+
+                if await post(START_UPDATE, "wrong") != 401 or await post({"update_id": "x"}) != 400:
+                    print("❌ Вебхук принимает чужие или битые запросы")
+                    return False
+                if await post(START_UPDATE) != 200:
+                    print("❌ Вебхук не принял апдейт")
+                    return False
+                await handler.drain()
+                if await db.get_balance(777) != 1000 or api.calls['sendMessage'] != 1:
+                    print("❌ Апдейт /start не обработан")
+                    return False
+
+                # Лимит параллельных обработчиков
+                active = peak = 0
+                process = handler.process
+
+                async def counted(update):
+                    nonlocal active, peak
+                    active += 1
+                    peak = max(peak, active)
+                    try:
+                        await process(update)
+                    finally:
+                        active -= 1
+
+                handler.process = counted
+                # Разные игроки: лимит апдейтов на игрока здесь не должен срабатывать
+                statuses = await asyncio.gather(*(post(make_update(i, 777 + i, data="main")) for i in range(2, 12)))
+                await handler.drain()
+                if set(statuses) != {200} or api.calls['editMessageText'] != 10 or peak != 2:
+                    print(f"❌ Ошибка лимита обработчиков: пик {peak}, {dict(api.calls)}")
+                    return False
+                if handler.metrics()['failed']:
+                    print("❌ Ошибки в обработчиках")
+                    return False
+
+            # SIGTERM завершает serve штатно - остановка бота успевает сохранить состояние
+            import signal
+            import socket
+            from config import WEBHOOK_SETTINGS
+            from webhook import serve
+            with socket.socket() as sock:
+                sock.bind(("127.0.0.1", 0))
+                port = sock.getsockname()[1]
+            settings = dict(WEBHOOK_SETTINGS, host="127.0.0.1", port=port)
+            serving = asyncio.create_task(serve(bot.dp, tg, None, settings, "test-secret", register=False))
+            await asyncio.sleep(0.2)
+            os.kill(os.getpid(), signal.SIGTERM)
+            try:
+                await asyncio.wait_for(serving, 5)
+            except asyncio.TimeoutError:
+                print("❌ Вебхук не остановился по SIGTERM")
+                return False
+
+            print("✅ Вебхук работает")
+            return True
+        finally:
+            await server.close()
+            await tg.session.close()
+            await api.close()
+            bot.db = bot.storage.db = old_db
+            await db.close()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(run(os.path.join(tmp, 'test.db')))
+    except Exception as e:
+        print(f"❌ Ошибка тестирования вебхука: {e}")
+        return False
+
+def test_animation():
+    """Тест фоновой анимации слотов"""
+    print("\n🎞 Тестирование анимации...")
+
+    import asyncio
+    import tempfile
+    import time
+
+    async def run(path):
+        import bot
+        from aiogram.exceptions import TelegramRetryAfter
+        from aiogram.fsm.storage.memory import MemoryStorage
+        from animations import Animator
+        from bench import FakeMessage, make_state
+        from database import DB
+
+        class FloodMessage(FakeMessage):
+            """Первая правка упирается в flood control"""
+            flooded = False
+
+            async def edit_text(self, text, reply_markup=None):
+                if not self.flooded:
+                    self.flooded = True
+                    raise TelegramRetryAfter(method=None, message="Too Many Requests", retry_after=0.3)
+                return await super().edit_text(text, reply_markup)
+
+        db = await DB(path).connect()
+        old_db, old_animator = bot.db, bot.animator
+        bot.db, bot.animator = db, Animator(frame_delay=0.1, min_interval=0.05)
+        try:
+            await db.create_user(1)
+
+            # Обработчик не ждёт анимацию
+            message = FakeMessage(1, "100")
+            state = make_state(MemoryStorage(), 1)
+            await state.set_state(bot.GameStates.waiting_bet)
+            await state.update_data(game="slots")
+            start = time.perf_counter()
+            await bot.handle_bet(message, state)
+            if time.perf_counter() - start > 0.1 or await state.get_state() is not None:
+                print("❌ Обработчик ждёт анимацию")
+                return False
+            await bot.animator.drain()
+            final = message.answers[-1]
+            if message.answers[:-1] != bot.GAMES['slots'].frames or not ("Выигрыш" in final or "Проигрыш" in final):
+                print(f"❌ Неверные кадры: {message.answers}")
+                return False
+
+            # Flood control: кадры пропускаются, итог приходит после retry_after
+            animator = Animator(frame_delay=0.1, min_interval=0.05)
+            message = FloodMessage(2)
+            animator.play(message, ["1", "2", "3"], "итог")
+            await animator.drain()
+            if message.answers != ["1", "итог"] or animator.metrics()['dropped'] != 2:
+                print(f"❌ Ошибка при flood control: {message.answers}")
+                return False
+
+            # Новая анимация в том же чате обрывает кадры прежней
+            animator = Animator(frame_delay=0.1, min_interval=0.0)
+            first, second = FakeMessage(3), FakeMessage(3)
+            animator.play(first, ["a1", "a2", "a3"], "итог1")
+            await asyncio.sleep(0.05)
+            animator.play(second, ["b1", "b2", "b3"], "итог2")
+            await animator.drain()
+            if first.answers != ["a1", "итог1"] or second.answers != ["b1", "b2", "b3", "итог2"]:
+                print(f"❌ Ошибка слияния анимаций: {first.answers}, {second.answers}")
+                return False
+            if animator.current or animator.last_sent:
+                print("❌ Состояние чатов не очищается")
+                return False
+
+            print("✅ Анимация работает")
+            return True
+        finally:
+            bot.db, bot.animator = old_db, old_animator
+            await db.close()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(run(os.path.join(tmp, 'test.db')))
+    except Exception as e:
+        print(f"❌ Ошибка тестирования анимации: {e}")
+        return False
+
+def test_outbox():
+    """Тест очереди исходящих сообщений против заглушки Bot API с 429"""
+    print("\n📤 Тестирование очереди отправки...")
+
+    import asyncio
+
+    async def run():
+        from aiogram.exceptions import TelegramRetryAfter
+        from bench import StubBotAPI
+        from outbox import LOW, SendQueue, priority
+
+        fast = {'chat_rate': 1000, 'chat_burst': 1000, 'global_rate': 1000, 'global_burst': 1000}
+
+        def texts(api, chat_id):
+            return [text for _, _, c, text in api.log if c == chat_id]
+
+        # Без очереди 429 долетает до обработчика
+        api = await StubBotAPI(chat_limit=2).start()
+        tg = api.bot()
+        results = await asyncio.gather(*(tg.send_message(1, f"m{i}") for i in range(4)), return_exceptions=True)
+        await tg.session.close()
+        await api.close()
+        if not any(isinstance(r, TelegramRetryAfter) for r in results):
+            print("❌ Заглушка не отдаёт 429")
+            return False
+
+        # С очередью: retry_after выдерживается, всё доставлено по порядку
+        api = await StubBotAPI(chat_limit=2).start()
+        outbox = SendQueue(fast)
+        tg = api.bot(outbox)
+        try:
+            await asyncio.gather(*(tg.send_message(1, f"m{i}") for i in range(4)))
+            if texts(api, 1) != ["m0", "m1", "m2", "m3"] or not api.floods or not outbox.retried:
+                print(f"❌ Ошибка повтора после 429: {api.log}")
+                return False
+        finally:
+            await outbox.close()
+            await tg.session.close()
+            await api.close()
+
+        api = await StubBotAPI(latency=0.1).start()
+        outbox = SendQueue(dict(fast, chat_rate=10, chat_burst=1, global_rate=20, global_burst=1))
+        tg = api.bot(outbox)
+        try:
+            # Ведро на чат: не чаще 10 в секунду
+            await asyncio.gather(*(tg.send_message(1, f"m{i}") for i in range(3)))
+            stamps = [t for t, _, c, _ in api.log if c == 1]
+            if min(b - a for a, b in zip(stamps, stamps[1:])) < 0.09:
+                print("❌ Превышен лимит чата")
+                return False
+
+            # Правки одного сообщения, пока чат занят, сливаются в одну
+            first = asyncio.create_task(tg.send_message(2, "занят"))
+            await asyncio.sleep(0.01)
+            edits = await asyncio.gather(*(tg.edit_message_text(f"e{i}", chat_id=2, message_id=7) for i in range(5)))
+            await first
+            if texts(api, 2) != ["занят", "e4"] or outbox.merged != 4 or len(edits) != 5:
+                print(f"❌ Ошибка слияния правок: {texts(api, 2)}")
+                return False
+
+            # Кадр в занятый чат выбрасывается сразу
+            busy = asyncio.create_task(tg.send_message(3, "итог"))
+            await asyncio.sleep(0.01)
+            try:
+                with priority(LOW):
+                    await tg.send_message(3, "кадр")
+                print("❌ Кадр в занятый чат не выброшен")
+                return False
+            except TelegramRetryAfter:
+                pass
+            await busy
+
+            # Глобальное ведро пусто: обычное сообщение обгоняет кадр
+            await asyncio.sleep(0.1)
+            start = len(api.log)
+
+            async def frame():
+                with priority(LOW):
+                    await tg.send_message(5, "кадр")
+
+            tasks = [asyncio.create_task(tg.send_message(4, "раз"))]
+            await asyncio.sleep(0.01)
+            tasks.append(asyncio.create_task(frame()))
+            await asyncio.sleep(0.01)
+            tasks.append(asyncio.create_task(tg.send_message(6, "итог")))
+            await asyncio.gather(*tasks)
+            if [text for _, _, _, text in api.log[start:]] != ["раз", "итог", "кадр"]:
+                print(f"❌ Ошибка приоритетов: {api.log[start:]}")
+                return False
+        finally:
+            await outbox.close()
+            await tg.session.close()
+            await api.close()
+
+        print("✅ Очередь отправки работает")
+        return True
+
+    try:
+        return asyncio.run(run())
+    except Exception as e:
+        print(f"❌ Ошибка тестирования очереди отправки: {e}")
+        return False
+
+def test_rng():
+    """Тест буферизованного генератора: равномерность и пакетные раунды"""
+    print("\n🎲 Тестирование генератора...")
+
+    try:
+        import struct
+        import rng
+        from rng import BufferedRNG, np
+
+        def chi2(counts):
+            expected = sum(counts) / len(counts)
+            return sum((c - expected) ** 2 / expected for c in counts)
+
+        # Критические значения хи-квадрат при p = 0.0001 (5 и 36 степеней свободы)
+        counts = [0] * 37
+        for _ in range(74000):
+            counts[rng.randbelow(37)] += 1
+        if chi2(counts) > 74.7:
+            print(f"❌ Смещение randbelow: хи-квадрат {chi2(counts):.1f}")
+            return False
+
+        # Хвост, не кратный n, отбрасывается: 2**32 - 1 для n = 3 отклоняется
+        words = struct.pack('<4I', 2 ** 32 - 1, 5, 2 ** 32 - 1, 7)
+        fake = BufferedRNG(block_words=4, source=lambda size: words)
+        if fake.randbelow(3) != 2 or fake.randbelow(3) != 1:
+            print("❌ Нет отклонения смещённых слов")
+            return False
+
+        if np is None:
+            print("⚠️ numpy не установлен - пакетные раунды не проверены")
+            return True
+
+        batch = rng.randbelow_batch(6, 600000)
+        if batch.min() < 0 or batch.max() > 5 or chi2(np.bincount(batch, minlength=6)) > 25.7:
+            print("❌ Смещение randbelow_batch")
+            return False
+        fake = BufferedRNG(source=lambda size: words * (size // 16 + 1))
+        if list(fake.randbelow_batch(3, 4)) != [2, 1, 2, 1]:
+            print("❌ Нет отклонения в пакетном режиме")
+            return False
+
+        # Пакет и одиночные раунды играют по одним правилам
+        from games import slots_batch, dice_batch, roulette_batch
+        slots_rtp = slots_batch(200000).mean()
+        dice_rtp = dice_batch(200000).mean()
+        red_rtp = roulette_batch('color', 'red', 200000).mean()
+        if abs(slots_rtp - 584 / 512) > 0.03 or abs(dice_rtp - 9 / 6) > 0.02 \
+                or abs(red_rtp - 2 * 18 / 37) > 0.02:
+            print(f"❌ Пакетные раунды разошлись с правилами: {slots_rtp:.3f}, {dice_rtp:.3f}, {red_rtp:.3f}")
+            return False
+
+        print("✅ Генератор работает")
+        return True
+
+    except Exception as e:
+        print(f"❌ Ошибка тестирования генератора: {e}")
+        return False
+
+def test_rtp():
+    """Тест RTP: симуляция всех игр сходится с преимуществом казино из конфига"""
+    print("\n📐 Проверка RTP...")
+
+    try:
+        from config import HOUSE_EDGE
+        from simulate import check, simulate
+
+        results = simulate(1_000_000, workers=2)
+        failures = check(results)
+        if failures:
+            for game, edge, expected, allowed in failures:
+                print(f"❌ {game}: преимущество {edge * 100:.2f}%, в конфиге {expected * 100:.2f}%")
+            return False
+
+        # Изменённые выплаты без правки конфига ловятся
+        if [f[0] for f in check(results, dict(HOUSE_EDGE, slots=0.05))] != ['slots']:
+            print("❌ Расхождение с конфигом не обнаружено")
+            return False
+
+        # Точный перебор исходов сходится с симуляцией и с конфигом
+        from fractions import Fraction
+        from config import PAYOUTS
+        from simulate import Z_CHECK
+        import rtp
+
+        for game, r in results.items():
+            exact_rtp, variance = rtp.exact(game)
+            if abs(r['rtp'] - exact_rtp) > Z_CHECK * r['se'] or abs(r['variance'] - variance) > 0.05 * variance:
+                print(f"❌ {game}: симуляция {r['rtp']:.4f}, точно {float(exact_rtp):.4f}")
+                return False
+        if rtp.check() or rtp.exact('slots')[0] != Fraction(584, 512):
+            print("❌ Точный RTP расходится с конфигом")
+            return False
+
+        # Crash в отчёте - движок реального времени, а не мгновенный вариант
+        from config import CRASH_SETTINGS
+        live = rtp.report()['crash']['rtp']
+        if 'crash' in results or abs(live - (1 - CRASH_SETTINGS['house_edge'])) > 0.001:
+            print(f"❌ RTP Crash не по движку реального времени: {live:.4f}")
+            return False
+
+        # Новая таблица выплат считается сразу, повторный запрос - из кэша
+        changed = dict(PAYOUTS, slots=dict(PAYOUTS['slots'], triple=20.0, double=1.0))
+        if rtp.exact('slots', changed)[0] != Fraction(20 * 8 + 168, 512) or [f[0] for f in rtp.check(changed)] != ['slots']:
+            print("❌ Ошибка пересчёта RTP по новой таблице выплат")
+            return False
+        hits = rtp.exact_cached.cache_info().hits
+        rtp.exact('slots', dict(changed))
+        if rtp.exact_cached.cache_info().hits != hits + 1:
+            print("❌ RTP не кэшируется")
+            return False
+
+        print(f"✅ RTP совпадает с конфигом ({len(results)} игр)")
+        return True
+
+    except Exception as e:
+        print(f"❌ Ошибка проверки RTP: {e}")
+        return False
+
+def test_crash():
+    """Тест Crash в реальном времени: выводы, автовывод, краш и расчёт пачкой"""
+    print("\n📈 Тестирование Crash...")
+
+    import asyncio
+    import tempfile
+
+    async def run(path):
+        from bench import StubBotAPI
+        from crash import IDLE, CrashEngine, crash_point
+        from database import DB
+
+        # P(краш >= m) = (1 - house_edge) / m
+        draws = [crash_point(0.01, 100.0) for _ in range(20000)]
+        share = sum(d >= 2 for d in draws) / len(draws)
+        if abs(share - 0.495) > 0.02 or min(draws) < 1.0 or max(draws) > 100.0:
+            print(f"❌ Неверное распределение точки краша: P(>= 2) = {share:.3f}")
+            return False
+
+        db = await DB(path).connect()
+        api = await StubBotAPI().start()
+        tg = api.bot()
+        fast = {'betting_time': 0.2, 'growth': 2.0, 'pause': 0.0}
+        engine = CrashEngine(db, tg, fast, tick=0.02, draw=lambda: 2.0)
+        try:
+            for user_id in range(1, 6):
+                await db.create_user(user_id)
+            joins = await asyncio.gather(
+                engine.join(1, 1, 100, auto=1.5),
+                engine.join(5, 5, 200, auto=1.5),
+                engine.join(2, 2, 100),
+                engine.join(3, 3, 100, auto=3.0),
+                engine.join(4, 4, 5000),
+                # Ставка вне пределов отклоняется сразу и не срывает списание пачки
+                engine.join(6, 6, 10 ** 20))
+            if [joined for joined, _ in joins] != [True, True, True, True, False, False] \
+                    or (await engine.join(1, 1, 100))[0]:
+                print(f"❌ Ошибка приёма ставок: {joins}")
+                return False
+
+            while engine.multiplier < 1.2:
+                await asyncio.sleep(0.005)
+            cashed = engine.cashout(2)
+            if cashed is None or engine.cashout(2) is not None:
+                print("❌ Ручной вывод не принят или принят дважды")
+                return False
+            while engine.settled < 4:
+                await asyncio.sleep(0.01)
+            await engine.drain()
+
+            balances = [await db.get_balance(user_id) for user_id in range(1, 6)]
+            expected = [1050, 900 + int(100 * cashed), 900, 1000, 1100]
+            games = (await db.fetchone('SELECT COUNT(*) FROM games'))[0]
+            if balances != expected or games != 4 or engine.phase != IDLE or engine.cashout(3) is not None:
+                print(f"❌ Ошибка расчёта раунда: {balances}, ожидалось {expected}")
+                return False
+            # Ставки - одна транзакция, оба автовывода ×1.5 - одна, ручной вывод и краш - ещё по одной
+            if engine.transactions > 4:
+                print(f"❌ Транзакций больше, чем тиков с расчётом: {engine.transactions}")
+                return False
+            finals = {c: text for _, method, c, text in api.log if method == "editMessageText"}
+            if "Вывели на ×1.50" not in finals.get(1, "") or "Crash на ×2.00" not in finals.get(3, ""):
+                print(f"❌ Итоги не доставлены: {finals}")
+                return False
+
+            # Остановка во время приёма ставок возвращает ставку
+            engine = CrashEngine(db, tg, dict(fast, betting_time=10.0), tick=0.02)
+            await engine.join(1, 1, 300)
+            await engine.stop()
+            if await db.get_balance(1) != 1050:
+                print("❌ Ставка прерванного раунда не возвращена")
+                return False
+
+            print("✅ Crash работает")
+            return True
+        finally:
+            await engine.stop()
+            await tg.session.close()
+            await api.close()
+            await db.close()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(run(os.path.join(tmp, 'test.db')))
+    except Exception as e:
+        print(f"❌ Ошибка тестирования Crash: {e}")
+        return False
+
+def test_anticheat():
+    """Тест потокового анти-чита: флаги по окнам и восстановление из базы"""
+    print("\n🕵 Тестирование анти-чита...")
+
+    import asyncio
+    import tempfile
+
+    async def run(path):
+        from anticheat import CheatDetector
+        from database import DB
+
+        detector = CheatDetector({'max_games_per_hour': 30, 'min_games_for_check': 20})
+        now = 1_000_000.0
+        # Игры раз в 3 секунды с разными ставками и честным винрейтом - без флагов
+        for i in range(25):
+            flags = detector.observe(1, 100 + i, 200 if i % 2 else 0, now + i * 3)
+            if flags:
+                print(f"❌ Ложный флаг: {flags}")
+                return False
+        # 5 игр за 10 секунд
+        if detector.observe(2, 100, 0, now) or \
+                [detector.observe(2, 100 + i, 0, now + i * 2) for i in range(1, 5)][-1] != ('rapid_fire',):
+            print("❌ Частые игры не замечены")
+            return False
+        # Одинаковая ставка 50 раз подряд, флаг поднимается один раз
+        raised = [detector.observe(3, 100, 0, now + i * 200) for i in range(60)]
+        if sum(map(len, raised)) != 1 or raised[49] != ('same_bet',):
+            print("❌ Повтор ставки не замечен")
+            return False
+        # Больше 30 игр за час: прошлый час учитывается с весом оставшейся доли
+        hour = 3600 * 300
+        raised = [detector.observe(4, i, 0, hour - 1800 + i * 60) for i in range(20)]
+        raised += [detector.observe(4, i, 0, hour + 360 + i * 60) for i in range(18)]
+        if any(raised[:-1]) or raised[-1] != ('games_per_hour',):
+            print(f"❌ Скользящее окно по часу: {raised}")
+            return False
+        # Винрейт выше 85% по последним играм
+        for i in range(30):
+            detector.observe(5, 100 + i, 250, now + i * 5)
+        if detector.flags(5) != ('win_rate',) or detector.win_rate(5) != 1.0:
+            print(f"❌ Винрейт не замечен: {detector.flags(5)}")
+            return False
+
+        # Расчёт раунда обновляет детектор базы, состояние переживает перезапуск
+        db = await DB(path).connect()
+        try:
+            await db.create_user(1, "player")
+            await db.create_user(2, "quiet")
+            for i in range(5):
+                await db.settle_round(1, "dice", 10 + i, 0.0)
+            await db.settle_round(2, "dice", 100, 0.0)
+            if db.anticheat.flags(1) != ('rapid_fire',):
+                print(f"❌ Расчёт раунда не попал в анти-чит: {db.anticheat.flags(1)}")
+                return False
+        finally:
+            await db.close()
+        db = await DB(path).connect()
+        try:
+            from extra_games import AntiCheat
+            m = db.anticheat.metrics()
+            if m['users'] != 1 or not await AntiCheat.check_user_activity(db, 1) \
+                    or await AntiCheat.check_win_rate(db, 1):
+                print(f"❌ Состояние не восстановлено: {m}")
+                return False
+            await db.settle_round(1, "dice", 10, 0.0)
+            if db.anticheat.users[1].games != 6:
+                print("❌ Восстановленное состояние не продолжает окно")
+                return False
+
+            # Игрок без флагов загружается из базы при первой игре, а после сохранения
+            # выгружается (сверх лимита или давно не играл); отмеченные флагами остаются
+            await db.settle_round(2, "dice", 100, 0.0)
+            if db.anticheat.users[2].games != 2 or db.anticheat.metrics()['loaded'] != 1:
+                print("❌ Состояние игрока не подгружено из базы")
+                return False
+            db.anticheat.capacity = 0
+            await db.anticheat.checkpoint(db)
+            await db.settle_round(2, "dice", 100, 0.0)
+            kept = set(db.anticheat.users)
+            db.anticheat.idle_ttl = 0
+            await db.anticheat.checkpoint(db)
+            if kept != {1, 2} or set(db.anticheat.users) != {1} or db.anticheat.metrics()['evicted'] != 2:
+                print(f"❌ Ошибка выгрузки состояния: {kept}, {set(db.anticheat.users)}")
+                return False
+            await db.settle_round(2, "dice", 100, 0.0)
+            if db.anticheat.users[2].games != 4:
+                print("❌ Выгруженное состояние потеряно")
+                return False
+        finally:
+            await db.close()
+
+        print("✅ Анти-чит работает")
+        return True
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(run(os.path.join(tmp, 'test.db')))
+    except Exception as e:
+        print(f"❌ Ошибка тестирования анти-чита: {e}")
+        return False
+
+def test_throttle():
+    """Тест лимита апдейтов: GCRA, вытеснение простаивающих и место до FSM"""
+    print("\n🚦 Тестирование лимита апдейтов...")
+
+    import asyncio
+    from types import SimpleNamespace
+
+    async def run():
+        import bot
+        from throttle import GCRA, Throttle
+
+        limit = GCRA(2, 1.0, 3)
+        if [limit.allow(1, 0.0) for _ in range(4)] != [True, True, True, False]:
+            print("❌ Пропущено больше burst подряд")
+            return False
+        if limit.allow(1, 0.4) or not limit.allow(1, 0.5) or not limit.allow(2, 0.5):
+            print("❌ Ошибка интервала GCRA")
+            return False
+        limit.allow(3, 10.0)
+        if len(limit) != 1:
+            print(f"❌ Простаивающие игроки не вытеснены: {len(limit)}")
+            return False
+
+        now = 0.0
+        throttle = Throttle({'update_rate': 1.0, 'update_burst': 5, 'games_per_minute': 2, 'game_burst': 2},
+                            clock=lambda: now)
+        handled, answers = [], []
+
+        async def handler(event, data):
+            handled.append(event)
+
+        async def answer(text):
+            answers.append(text)
+
+        def update(data=None):
+            callback = SimpleNamespace(data=data, answer=answer) if data else None
+            return SimpleNamespace(callback_query=callback)
+
+        user = {'event_from_user': SimpleNamespace(id=1)}
+        for data in ("game_dice", "game_dice", "game_dice", None, None, None):
+            await throttle(handler, update(data), dict(user))
+        m = throttle.metrics()
+        if len(handled) != 4 or m['dropped_games'] != 1 or m['dropped'] != 1 or len(answers) != 1:
+            print(f"❌ Ошибка лимитов: {m}, ответов {len(answers)}")
+            return False
+        await throttle(handler, update(), {})  # апдейт без игрока не ограничивается
+        now = 60.0
+        await throttle(handler, update("game_dice"), dict(user))
+        if len(handled) != 6:
+            print("❌ Лимит не восстановился со временем")
+            return False
+
+        order = [type(m).__name__ for m in bot.dp.update.outer_middleware]
+        if order.index('Throttle') > order.index('FSMContextMiddleware'):
+            print(f"❌ Лимит стоит после FSM: {order}")
+            return False
+
+        print("✅ Лимит апдейтов работает")
+        return True
+
+    try:
+        return asyncio.run(run())
+    except Exception as e:
+        print(f"❌ Ошибка тестирования лимита: {e}")
+        return False
+
+def test_fsm_storage():
+    """Тест хранилища FSM в базе: общий доступ, атомарное изъятие и возврат брошенных ставок"""
+    print("\n💾 Тестирование хранилища состояний...")
+
+    import asyncio
+    import tempfile
+    import time
+
+    async def run(path):
+        from aiogram.fsm.storage.base import StorageKey
+        from database import DB
+        from fsm_storage import SQLiteStorage
+
+        first, second = await DB(path).connect(), await DB(path).connect()
+        try:
+            storage, other = SQLiteStorage(first, {'ttl': 60}), SQLiteStorage(second, {'ttl': 60})
+            keys = {user_id: StorageKey(bot_id=1, chat_id=user_id, user_id=user_id) for user_id in (5, 6)}
+            for user_id in keys:
+                await first.create_user(user_id)
+
+            # Ставка списана, игрок ждёт выбора; второй игрок только выбирает ставку
+            await first.place_bet(5, 300)
+            await storage.set_state(keys[5], 'GameStates:waiting_choice')
+            await storage.update_data(keys[5], {'game': 'coinflip', 'bet': 300})
+            await storage.set_state(keys[6], 'GameStates:waiting_bet')
+
+            # Второй процесс видит те же состояния
+            raw = await second.fetchone('SELECT data FROM fsm_states WHERE user_id = 5')
+            if await other.get_state(keys[5]) != 'GameStates:waiting_choice' \
+                    or await other.get_data(keys[5]) != {'game': 'coinflip', 'bet': 300} \
+                    or raw[0] != '{"game":"coinflip","bet":300}' or await other.get_data(keys[6]) != {}:
+                print(f"❌ Состояние не видно другому процессу: {raw}")
+                return False
+
+            # Ставку можно забрать только один раз
+            taken = await asyncio.gather(storage.pop(keys[5]), other.pop(keys[5]))
+            if sorted(map(len, taken)) != [0, 2] or await storage.get_state(keys[5]) is not None:
+                print(f"❌ Ставка забрана дважды: {taken}")
+                return False
+
+            # Брошенная ставка возвращается один раз, состояние без ставки просто удаляется
+            await storage.set_state(keys[5], 'GameStates:waiting_choice')
+            await storage.set_data(keys[5], {'game': 'coinflip', 'bet': 300})
+            if await storage.sweep() != (0, 0):
+                print("❌ Удалено состояние до истечения TTL")
+                return False
+            later = time.time() + 61
+            swept = await asyncio.gather(storage.sweep(later), other.sweep(later))
+            count = (await first.fetchone('SELECT COUNT(*) FROM fsm_states'))[0]
+            if sorted(swept) != [(0, 0), (2, 300)] or await first.get_balance(5) != 1000 \
+                    or await first.get_balance(6) != 1000 or count:
+                print(f"❌ Ошибка возврата брошенных ставок: {swept}, {await first.get_balance(5)}")
+                return False
+            if await storage.pop(keys[5]) != {}:
+                print("❌ Возвращённую ставку можно сыграть")
+                return False
+
+            # Через обработчики: ставка в монетку, затем другая игра или промокод вместо выбора
+            import bot
+            from bench import FakeCallback, FakeMessage, make_state
+            old_db, bot.db = bot.db, first
+            try:
+                state = make_state(storage, 5)
+                await bot.game_start(FakeCallback(5, "game_coinflip"), state)
+                await bot.handle_bet(FakeMessage(5, "300"), state)
+                staked = await first.get_balance(5), await state.get_data()
+                await bot.game_start(FakeCallback(5, "game_dice"), state)
+                switched = await first.get_balance(5), await state.get_data()
+                await bot.game_start(FakeCallback(5, "game_roulette"), state)
+                await bot.handle_bet(FakeMessage(5, "200"), state)
+                await bot.promo(FakeCallback(5, "promo"), state)
+                promo = await first.get_balance(5), await state.get_state()
+                # Не хватает средств - ни списания, ни состояния со ставкой
+                await bot.game_start(FakeCallback(5, "game_coinflip"), state)
+                await bot.handle_bet(FakeMessage(5, "5000"), state)
+                poor = await first.get_balance(5), await state.get_data()
+                # Старая кнопка выбора при ожидании ставки ничего не стирает
+                await bot.handle_pick(FakeCallback(5, "pick_heads"), state)
+                stale = await state.get_state(), await state.get_data()
+            finally:
+                bot.db = old_db
+            if staked != (700, {'game': 'coinflip', 'bet': 300}) or switched != (1000, {'game': 'dice'}) \
+                    or promo != (1000, 'GameStates:promo_input') or poor != (1000, {'game': 'coinflip'}):
+                print(f"❌ Ставка потеряна при смене игры: {staked}, {switched}, {promo}, {poor}")
+                return False
+            if stale != ('GameStates:waiting_bet', {'game': 'coinflip'}):
+                print(f"❌ Старая кнопка выбора стёрла состояние: {stale}")
+                return False
+
+            # Истёкшее состояние со ставкой возвращается в любом состоянии
+            await storage.stake(keys[6], 400, 'GameStates:waiting_bet', {'game': 'coinflip'})
+            if await storage.sweep(time.time() + 61) != (2, 400) or await first.get_balance(6) != 1000:
+                print("❌ Ставка вне ожидания выбора не возвращена")
+                return False
+
+            print("✅ Хранилище состояний работает")
+            return True
+        finally:
+            await second.close()
+            await first.close()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(run(os.path.join(tmp, 'test.db')))
+    except Exception as e:
+        print(f"❌ Ошибка тестирования хранилища состояний: {e}")
+        return False
+
+def test_supervisor():
+    """Тест супервизора: апдейты игрока - в один воркер, брошенные ставки - только своим игрокам"""
+    print("\n🧩 Тестирование супервизора...")
+
+    import asyncio
+    import tempfile
+    import time
+
+    from supervisor import route, update_user
+
+    user = {"id": 42, "is_bot": False, "first_name": "test"}
+    chat = {"id": 42, "type": "private"}
+    updates = [
+        {"update_id": 1, "message": {"message_id": 1, "date": 0, "chat": chat, "from": user, "text": "100"}},
+        {"update_id": 2, "callback_query": {"id": "1", "from": user, "chat_instance": "0", "data": "game_dice"}},
+        {"update_id": 3, "my_chat_member": {"chat": chat, "from": user, "date": 0}},
+    ]
+    if {update_user(update) for update in updates} != {42} or {route(update, 4) for update in updates} != {2}:
+        print("❌ Апдейты одного игрока ушли в разные воркеры")
+        return False
+    if update_user({"update_id": 4, "channel_post": {"chat": {"id": -100, "type": "channel"}}}) != -100 \
+            or route({"update_id": 5}, 3) != 0:
+        print("❌ Ошибка маршрута апдейта без игрока")
+        return False
+
+    async def run(path):
+        from aiogram.fsm.storage.base import StorageKey
+        from database import DB
+        from fsm_storage import SQLiteStorage
+
+        db = await DB(path).connect()
+        try:
+            storages = [SQLiteStorage(db, {'ttl': 60, 'partition': (i, 2)}) for i in range(2)]
+            for user_id in (7, 8):
+                await db.create_user(user_id)
+                await db.place_bet(user_id, 200)
+                key = StorageKey(bot_id=1, chat_id=user_id, user_id=user_id)
+                await storages[0].set_state(key, 'GameStates:waiting_choice')
+                await storages[0].set_data(key, {'game': 'coinflip', 'bet': 200})
+            later = time.time() + 61
+            swept = [await storage.sweep(later) for storage in storages]
+            if swept != [(1, 200), (1, 200)] or await db.get_balance(7) != 1000 or await db.get_balance(8) != 1000:
+                print(f"❌ Ошибка очистки по воркерам: {swept}")
+                return False
+
+            # Общий реестр: баланс списал другой процесс, кэш этого устарел
+            other = await DB(path).connect()
+            try:
+                await db.get_user(7)
+                await other.place_bet(7, 800)
+                accepted = await db.place_bets([(7, 500), (8, 500)])
+            finally:
+                await other.close()
+            if accepted != {8} or (await db.fetchone('SELECT balance FROM users WHERE user_id = 7'))[0] != 200:
+                print(f"❌ Пачка ставок увела баланс в минус: {accepted}")
+                return False
+
+            # Рейтинг дочитывает только балансы, изменённые после прошлого раза, и не затирает
+            # более новый баланс, записанный этим процессом, пока шло чтение
+            other = await DB(path).connect()
+            read = db.fetchall
+
+            async def racing(sql, params=()):
+                rows = await read(sql, params)
+                await db.update_balance(7, 50)
+                return rows
+
+            try:
+                await db.refresh_leaderboard()
+                await other.update_balance(7, 100)
+                await other.update_balance(8, 100)
+                db.fetchall = racing
+                updated = await db.refresh_leaderboard()
+                db.fetchall = read
+                balances = dict(await db.fetchall('SELECT user_id, balance FROM users'))
+                raced = dict(db.leaderboard.balances)
+                # Пропущенный игрок и всё после него перечитываются
+                again = await db.refresh_leaderboard()
+            finally:
+                db.fetchall = read
+                await other.close()
+            if updated != 1 or raced[7] != balances[7] or raced[8] != balances[8] or again != 2 \
+                    or db.leaderboard.balances != balances:
+                print(f"❌ Ошибка обновления рейтинга: {updated}, {again}, {raced}, {balances}")
+                return False
+
+            # Отказ getUpdates (неверный токен, стоит вебхук) - пауза, а не повтор без остановки
+            import aiohttp
+            from aiohttp import web
+            from aiohttp.test_utils import TestServer
+            from supervisor import Supervisor
+            calls = []
+
+            async def get_updates(request):
+                calls.append(1)
+                return web.json_response({"ok": False, "error_code": 409, "description": "Conflict"}, status=409)
+
+            app = web.Application()
+            app.router.add_post("/bot{token}/getUpdates", get_updates)
+            server = TestServer(app)
+            await server.start_server()
+            supervisor = Supervisor(1)
+            supervisor.session = aiohttp.ClientSession()
+            try:
+                task = asyncio.create_task(supervisor.poll("1:test", str(server.make_url("")).rstrip("/")))
+                await asyncio.sleep(0.5)
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+            finally:
+                await supervisor.session.close()
+                await server.close()
+            if len(calls) != 1:
+                print(f"❌ getUpdates повторяется без паузы: {len(calls)} запросов")
+                return False
+
+            # Остановка: воркер получает SIGTERM и успевает завершиться сам
+            import sys
+            marker = path + '.stopped'
+            worker = supervisor.workers[0]
+            worker.process = await asyncio.create_subprocess_exec(sys.executable, "-c", (
+                "import signal, sys, time\n"
+                f"signal.signal(signal.SIGTERM, lambda *a: (open({marker!r}, 'w').close(), sys.exit(0)))\n"
+                "print('ready', flush=True)\n"
+                "time.sleep(30)\n"), stdout=asyncio.subprocess.PIPE)
+            await worker.process.stdout.readline()
+            supervisor.session = None
+            await supervisor.stop(timeout=5)
+            if worker.process.returncode != 0 or not os.path.exists(marker):
+                print(f"❌ Воркер не получил SIGTERM: код {worker.process.returncode}")
+                return False
+            print("✅ Супервизор работает")
+            return True
+        finally:
+            await db.close()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(run(os.path.join(tmp, 'test.db')))
+    except Exception as e:
+        print(f"❌ Ошибка тестирования супервизора: {e}")
+        return False
+
+def test_ui():
+    """Тест готовых клавиатур и текстов: сборка при импорте, экранирование полей и кэш фрагментов"""
+    print("\n🧱 Тестирование клавиатур и текстов...")
+
+    try:
+        from games import GAMES
+        from markup import Markdown, Template, md
+        from ui import BET_PROMPTS, CHOICE_KBS, TEMPLATES, TEXTS, rating_kb, render
+
+        template = Template("*{a}* и {b:.1f}% {{x}} {c}", a="1-2")
+        if template.render(b=50, c=Markdown("*ж*")) != "*1\\-2* и 50\\.0% {x} *ж*" \
+                or md("a_b [c] (d) !") != "a\\_b \\[c\\] \\(d\\) \\!":
+            print(f"❌ Ошибка экранирования: {template.render(b=50, c=Markdown('*ж*'))}")
+            return False
+        lines = [template.cached(b=b, c="x") for b in (1, 2, 1)]
+        if lines[0] is not lines[2] or template.metrics()['hit_rate'] != 1 / 3:
+            print("❌ Фрагмент не взят из кэша")
+            return False
+        if render('rating_line', medal="4.", username="a_b", balance=10, rate=50) != "4\\. *a\\_b* \\- 10 \\(50%\\)\n" \
+                or render('main_menu', balance=1500) != "🎰 *Главное меню*\n💰 Баланс: *1500* очков" \
+                or "{" in TEXTS['help'] or "Мин\\. ставка: 100" not in TEXTS['help']:
+            print("❌ Ошибка сборки экранов")
+            return False
+        values = dict.fromkeys(TEMPLATES['stats'].names, 0)
+        values.update(profit=-1500, history=render('stats_history', queue_depth=2, avg_flush_ms=1.5, max_flush_ms=3))
+        if "💰 Прибыль: \\-1500\n" not in render('stats', **values) or "\n📝 Очередь истории: 2\n" not in render('stats', **values):
+            print("❌ Отрицательная прибыль в /stats не экранирована")
+            return False
+        # /rtp - тоже шаблон: имена ставок и отрицательное преимущество экранируются
+        import asyncio
+        import bot
+        from bench import FakeMessage
+        from config import RATING_SETTINGS
+        message = FakeMessage(bot.ADMIN_ID, "/rtp")
+        asyncio.run(bot.rtp_report(message))
+        report = message.answers[0] if message.answers else ""
+        if "roulette\\_number: " not in report or "dice: 150\\.00% \\(преимущество \\-50\\.00%\\)" not in report \
+                or f"ТОП\\-{RATING_SETTINGS['page_size']}*" not in TEXTS['rating_top']:
+            print(f"❌ Ошибка сборки /rtp или заголовка рейтинга: {report}")
+            return False
+        if set(BET_PROMPTS) != set(GAMES) or set(CHOICE_KBS) != {name for name, g in GAMES.items() if g.choices}:
+            print("❌ Не для всех игр собраны приглашения и кнопки выбора")
+            return False
+        if rating_kb(1, True) is not rating_kb(1, True) \
+                or [b.callback_data for b in rating_kb(1, True).inline_keyboard[0]] != ["rating_0", "rating_2"]:
+            print("❌ Клавиатура рейтинга собирается заново")
+            return False
+        print("✅ Клавиатуры и тексты работают")
+        return True
+    except Exception as e:
+        print(f"❌ Ошибка тестирования клавиатур и текстов: {e}")
+        return False
+
+def test_jackpot():
+    """Тест джекпота: ставки в базе, восстановление после перезапуска, розыгрыш одной транзакцией"""
+    print("\n💎 Тестирование джекпота...")
+
+    import asyncio
+    import sqlite3
+    import tempfile
+
+    async def run(path):
+        from database import DB
+        from jackpot import JackpotManager
+
+        settings = {'min_bet': 100, 'min_participants': 2, 'auto_draw_threshold': 3, 'commission': 0.05}
+        db = await DB(path).connect()
+        try:
+            for user_id in range(1, 4):
+                await db.create_user(user_id)
+            jackpot = JackpotManager(db, settings)
+            if await jackpot.add_entry(1, 50) is not False or await jackpot.add_entry(1, 5000) is not False:
+                print("❌ Принята ставка меньше минимума или без средств")
+                return False
+            if await jackpot.add_entry(1, 300) is not None or await jackpot.add_entry(2, 100) is not None:
+                print("❌ Розыгрыш до порога участников")
+                return False
+
+            # Перезапуск: банк восстанавливается из базы
+            jackpot = await JackpotManager(db, settings).load()
+            if jackpot.pot != 400 or sorted(jackpot.get_pot_info()['participants']) != [1, 2]:
+                print(f"❌ Банк не восстановлен: {jackpot.get_pot_info()}")
+                return False
+
+            # Сбой посреди розыгрыша: откатываются и ставка, и выплата
+            await db.conn.execute('''CREATE TEMP TRIGGER fail_draw BEFORE INSERT ON jackpot_draws
+                                     BEGIN SELECT RAISE(ABORT, 'сбой'); END''')
+            try:
+                await jackpot.add_entry(3, 200)
+                print("❌ Сбой розыгрыша не дошёл до вызывающего")
+                return False
+            except sqlite3.IntegrityError:
+                pass
+            await db.conn.execute('DROP TRIGGER fail_draw')
+            entries = (await db.fetchone('SELECT COUNT(*) FROM jackpot_entries'))[0]
+            if jackpot.pot != 400 or entries != 2 or await db.get_balance(3) != 1000:
+                print("❌ Сбой розыгрыша оставил частичные изменения")
+                return False
+
+            winner, prize = await jackpot.add_entry(3, 200)
+            balances = [await db.get_balance(user_id) for user_id in range(1, 4)]
+            row = await db.fetchone('SELECT winner, prize, pot, entries FROM jackpot_draws')
+            entries = (await db.fetchone('SELECT COUNT(*) FROM jackpot_entries'))[0]
+            if prize != 570 or sum(balances) != 3000 - 600 + 570 or row != (winner, 570, 600, 3) \
+                    or entries or jackpot.pot:
+                print(f"❌ Ошибка розыгрыша: {winner}, {prize}, {balances}, {row}")
+                return False
+
+            # Шанс пропорционален ставке
+            jackpot.append(1, 1)
+            jackpot.append(2, 3)
+            share = sum(jackpot.pick() == 2 for _ in range(8000)) / 8000
+            if abs(share - 0.75) > 0.03:
+                print(f"❌ Шанс не пропорционален ставке: {share:.3f}")
+                return False
+
+            print("✅ Джекпот работает")
+            return True
+        finally:
+            await db.close()
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            return asyncio.run(run(os.path.join(tmp, 'test.db')))
+    except Exception as e:
+        print(f"❌ Ошибка тестирования джекпота: {e}")
+        return False
+
+def test_games():
+    """Тест игровых функций"""
+    print("\n🎮 Тестирование игр...")
+
+    try:
+        # Импортируем игровые функции из bot.py
+        from games import coinflip, dice, slots, roulette
+
+        # Тест монетки
+        won, msg, mult = coinflip('heads')
+        if isinstance(won, bool) and isinstance(mult, float):
+            print("✅ Монетка работает")
+        else:
+            print("❌ Ошибка в монетке")
+            return False
+
+        # Тест костей
+        won, msg, mult = dice()
+        if isinstance(won, bool) and mult in [0.0, 2.0, 5.0]:
+            print("✅ Кости работают")
+        else:
+            print("❌ Ошибка в костях")
+            return False
+
+        # Тест слотов
+        won, msg, mult = slots()
+        if isinstance(won, bool) and mult in [0.0, 3.0, 10.0]:
+            print("✅ Слоты работают")
+        else:
+            print("❌ Ошибка в слотах")
+            return False
+
+        # Тест рулетки
+        won, msg, mult = roulette('color', 'red')
+        if isinstance(won, bool) and isinstance(mult, float):
+            print("✅ Рулетка работает")
+        else:
+            print("❌ Ошибка в рулетке")
+            return False
+
+        # Реестр: цвета рулетки из конфига, все игры в меню
+        from ui import GAMES_KB
+        from games import GAMES
+        roulette_game = GAMES['roulette']
+        if roulette_game.tables['color_red'][10] != 0.0 or roulette_game.tables['even'][10] == 0.0:
+            print("❌ Цвета рулетки не совпадают с ROULETTE_COLORS")
+            return False
+        buttons = {b.callback_data for row in GAMES_KB.inline_keyboard for b in row}
+        if not {f"game_{name}" for name in GAMES} <= buttons:
+            print("❌ Не все игры реестра есть в меню")
+            return False
+        print("✅ Реестр игр работает")
+
+        print("✅ Все игры протестированы успешно")
+        return True
+
+    except Exception as e:
+        print(f"❌ Ошибка тестирования игр: {e}")
+        return False
+
+def test_config():
+    """Тест конфигурации"""
+    print("\n⚙️ Проверка конфигурации...")
+
+    # Проверка .env файла
+    if os.path.exists('.env'):
+        print("✅ Файл .env найден")
+
+        from dotenv import load_dotenv
+        load_dotenv()
+
+        bot_token = os.getenv("BOT_TOKEN")
+        admin_id = os.getenv("ADMIN_ID")
+
+        if bot_token and bot_token != "YOUR_BOT_TOKEN_HERE":
+            print("✅ BOT_TOKEN настроен")
+        else:
+            print("⚠️ BOT_TOKEN не настроен - получите токен у @BotFather")
+
+        if admin_id and admin_id != "123456789":
+            print("✅ ADMIN_ID настроен")
+        else:
+            print("⚠️ ADMIN_ID не настроен - укажите ваш Telegram ID")
+    else:
+        print("⚠️ Файл .env не найден")
+
+    # Проверка зависимостей
+    try:
+        import aiogram
+        print("✅ aiogram установлен")
+    except ImportError:
+        print("❌ aiogram не установлен")
+        return False
+
+    try:
+        from dotenv import load_dotenv
+        print("✅ python-dotenv установлен")
+    except ImportError:
+        print("❌ python-dotenv не установлен")
+        return False
+
+    return True
+
+def test_performance():
+    """Тест производительности"""
+    print("\n⚡ Тест производительности...")
+
+    import time
+
+    try:
+        from games import coinflip, dice, slots
+
+        # Тест скорости игр
+        start_time = time.time()
+        for _ in range(1000):
+            coinflip('heads')
+            dice()
+            slots()
+        end_time = time.time()
+
+        games_per_second = 3000 / (end_time - start_time)
+        print(f"✅ Скорость игр: {games_per_second:.0f} игр/сек")
+
+        # Тест базы данных
+        import asyncio
+        from database import DB
+
+        async def run_db():
+            db = await DB().connect()
+
+            start_time = time.time()
+            test_user = 888888888
+
+            for i in range(100):
+                await db.create_user(test_user + i, f"test_user_{i}")
+                await db.update_balance(test_user + i, 100)
+                await db.add_game(test_user + i, "test", 100, 200, 2.0)
+
+            end_time = time.time()
+            operations_per_second = 300 / (end_time - start_time)
+            print(f"✅ Скорость БД: {operations_per_second:.0f} операций/сек")
+
+            # Очистка тестовых данных
+            for i in range(100):
+                await db.conn.execute('DELETE FROM users WHERE user_id = ?', (test_user + i,))
+                await db.conn.execute('DELETE FROM games WHERE user_id = ?', (test_user + i,))
+            await db.conn.commit()
+            await db.close()
+
+        asyncio.run(run_db())
+        return True
+
+    except Exception as e:
+        print(f"❌ Ошибка теста производительности: {e}")
+        return False
+
+def show_statistics():
+    """Показать статистику если бот уже работал"""
+    print("\n📊 Статистика (если есть данные)...")
+
+    if not os.path.exists('casino.db'):
+        print("ℹ️ База данных пока не создана")
+        return
+
+    try:
+        conn = sqlite3.connect('casino.db')
+        c = conn.cursor()
+
+        # Проверяем наличие данных
+        users_count = c.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        games_count = c.execute('SELECT COUNT(*) FROM games').fetchone()[0]
+
+        if users_count == 0:
+            print("ℹ️ Пользователей пока нет")
+        else:
+            print(f"👥 Пользователей: {users_count}")
+            print(f"🎮 Игр сыграно: {games_count}")
+
+            # Популярные игры
+            popular = c.execute('''
+                SELECT game_type, COUNT(*) as count
+                FROM games
+                GROUP BY game_type
+                ORDER BY count DESC
+                LIMIT 3
+            ''').fetchall()
+
+            if popular:
+                print("🏆 Популярные игры:")
+                for game, count in popular:
+                    print(f"  • {game}: {count} игр")
+
+        conn.close()
+
+    except Exception as e:
+        print(f"❌ Ошибка получения статистики: {e}")
+
+def main():
+    print("🎰 Тестирование Казино-Бота 🎰\n")
+
+    results = []
+
+    # Запускаем все тесты
+    results.append(("Конфигурация", test_config()))
+    results.append(("База данных", test_database()))
+    results.append(("Расчёт раундов", test_settlement()))
+    results.append(("Хранилище", test_storage_profile()))
+    results.append(("История игр", test_history_batch()))
+    results.append(("Рейтинг", test_leaderboard()))
+    results.append(("Статистика", test_rollups()))
+    results.append(("Планы запросов", test_query_plans()))
+    results.append(("Кэш игроков", test_user_cache()))
+    results.append(("Блокировки", test_user_locks()))
+    results.append(("Вебхук", test_webhook()))
+    results.append(("Анимация", test_animation()))
+    results.append(("Очередь отправки", test_outbox()))
+    results.append(("Генератор", test_rng()))
+    results.append(("RTP", test_rtp()))
+    results.append(("Crash", test_crash()))
+    results.append(("Джекпот", test_jackpot()))
+    results.append(("Анти-чит", test_anticheat()))
+    results.append(("Лимит апдейтов", test_throttle()))
+    results.append(("Хранилище состояний", test_fsm_storage()))
+    results.append(("Супервизор", test_supervisor()))
+    results.append(("Клавиатуры и тексты", test_ui()))
+    results.append(("Игровые функции", test_games()))
+    results.append(("Производительность", test_performance()))
+
+    # Показываем статистику
+    show_statistics()
+
+    # Итоги
+    print("\n" + "="*50)
+    print("📋 РЕЗУЛЬТАТЫ ТЕСТИРОВАНИЯ:")
+    print("="*50)
+
+    passed = 0
+    for test_name, result in results:
+        status = "✅ ПРОЙДЕН" if result else "❌ ПРОВАЛЕН"
+        print(f"{test_name:20} {status}")
+        if result:
+            passed += 1
+
+    print(f"\nИтого: {passed}/{len(results)} тестов пройдено")
+
+    if passed == len(results):
+        print("\n🎉 Все тесты пройдены! Бот готов к запуску!")
+        print("Запустите: python bot.py")
+    else:
+        print("\n⚠️ Есть проблемы. Проверьте настройки.")
+        print("Инструкция: python run.py check")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# Ограничение входящих апдейтов
+# Outer-middleware диспетчера: лишние апдейты игрока отбрасываются до FSM и базы.
+# Лимит - GCRA: на игрока хранится одно число, теоретическое время следующего
+# апдейта (TAT). Игрок, у которого TAT уже в прошлом, ничем не отличается от нового
+# и вытесняется из памяти
+
+import time
+from collections import OrderedDict
+
+from aiogram import BaseMiddleware
+
+from config import THROTTLE_SETTINGS
+
+class GCRA:
+    """rate событий за period секунд на ключ, подряд - не больше burst"""
+    def __init__(self, rate, period=1.0, burst=1):
+        self.interval = period / rate
+        self.tolerance = self.interval * (burst - 1)
+        self.tat = OrderedDict()   # ключ -> TAT, в порядке последнего обращения
+
+    def allow(self, key, now):
+        tat = self.tat.get(key, now)
+        if tat < now:
+            tat = now
+        if tat - now > self.tolerance:
+            return False
+        self.tat[key] = tat + self.interval
+        self.tat.move_to_end(key)
+        self.evict(now)
+        return True
+
+    def evict(self, now):
+        # Самые давние обращения в начале: за каждый вызов - не больше пары удалений
+        for _ in range(2):
+            if not self.tat:
+                return
+            key, tat = next(iter(self.tat.items()))
+            if tat > now:
+                return
+            del self.tat[key]
+
+    def __len__(self):
+        return len(self.tat)
+
+class Throttle(BaseMiddleware):
+    """Лимиты на игрока: все апдейты - update_rate в секунду, начала игр - max_games_per_minute.
+    Отброшенное нажатие кнопки получает короткий ответ, сообщение - молча пропускается"""
+    def __init__(self, settings=None, clock=time.monotonic):
+        s = dict(THROTTLE_SETTINGS, **(settings or {}))
+        self.settings = s
+        self.clock = clock
+        self.updates = GCRA(s['update_rate'], 1.0, s['update_burst'])
+        self.games = GCRA(s['games_per_minute'], 60.0, s['game_burst'])
+        # Метрики
+        self.passed = 0
+        self.dropped = 0
+        self.dropped_games = 0
+
+    async def __call__(self, handler, event, data):
+        user = data.get('event_from_user')
+        if user is None:
+            return await handler(event, data)
+        now = self.clock()
+        callback = event.callback_query
+        game = callback is not None and (callback.data or '').startswith('game_')
+        if not self.updates.allow(user.id, now):
+            self.dropped += 1
+        elif game and not self.games.allow(user.id, now):
+            self.dropped_games += 1
+        else:
+            self.passed += 1
+            return await handler(event, data)
+        if callback is not None and self.settings['notify']:
+            await callback.answer(self.settings['notify'])
+        return None
+
+    def metrics(self):
+        return {
+            'passed': self.passed,
+            'dropped': self.dropped,
+            'dropped_games': self.dropped_games,
+            'tracked': len(self.updates),
+        }
@@ -0,0 +1,76 @@
+# Клавиатуры и тексты экранов
+# Всё неизменяемое собирается один раз при импорте: клавиатуры, статичные экраны,
+# приглашения к ставке по играм. Тексты берутся из MESSAGES (уже в MarkdownV2) и
+# разбираются в шаблоны markup.Template: известные заранее значения (список игр,
+# пределы ставки, размер страницы рейтинга) подставляются при сборке, в ответе
+# экранируются только поля
+
+from functools import lru_cache
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from config import GAME_SETTINGS, MESSAGES, RATING_SETTINGS
+from games import GAMES
+from markup import Markdown, Template, md
+
+def button(text, data):
+    return InlineKeyboardButton(text=text, callback_data=data)
+
+BACK = button("🔙 Назад", "main")
+
+# Клавиатуры
+MAIN_KB = InlineKeyboardMarkup(inline_keyboard=[
+    [button("🎮 Игры", "games")],
+    [button("👤 Профиль", "profile"), button("🎁 Бонус", "bonus")],
+    [button("🏆 Рейтинг", "rating"), button("🏷 Промокод", "promo")],
+    [button("ℹ️ Помощь", "help")]
+])
+
+BACK_KB = InlineKeyboardMarkup(inline_keyboard=[[BACK]])
+
+def games_kb():
+    # По две игры в ряд в порядке реестра
+    buttons = [button(game.title, f"game_{name}") for name, game in GAMES.items()]
+    return InlineKeyboardMarkup(inline_keyboard=[buttons[i:i + 2] for i in range(0, len(buttons), 2)] + [[BACK]])
+
+GAMES_KB = games_kb()
+
+# Кнопки выбора ставки - для игр с choices
+CHOICE_KBS = {
+    name: InlineKeyboardMarkup(inline_keyboard=[[button(text, f"pick_{bet}") for text, bet in row]
+                                                for row in game.choices])
+    for name, game in GAMES.items() if game.choices
+}
+
+@lru_cache(maxsize=256)
+def rating_kb(page, has_next):
+    """Навигация по рейтингу: своя клавиатура на страницу, собирается при первом показе"""
+    nav = []
+    if page > 0:
+        nav.append(button("◀️", f"rating_{page - 1}"))
+    if has_next:
+        nav.append(button("▶️", f"rating_{page + 1}"))
+    return InlineKeyboardMarkup(inline_keyboard=([nav] if nav else []) + [[BACK]])
+
+# Тексты
+GAME_LISTS = {
+    'games_menu': "\n".join(f"*{md(game.title)}* \\- {md(game.summary)}" for game in GAMES.values()),
+    'help': "\n".join(f"• {md(game.title.split(' ', 1)[1])}: {md(game.summary)}" for game in GAMES.values()),
+}
+
+TEMPLATES = {
+    name: Template(template, count=len(GAMES), min_bet=GAME_SETTINGS['min_bet'], max_bet=GAME_SETTINGS['max_bet'],
+                   page_size=RATING_SETTINGS['page_size'], **({'games': Markdown(GAME_LISTS[name])} if name in GAME_LISTS else {}))
+    for name, template in MESSAGES.items()
+}
+TEXTS = {name: template.text for name, template in TEMPLATES.items() if template.text is not None}
+BET_PROMPTS = {name: Template(MESSAGES['bet_prompt'], title=game.title, min_bet=GAME_SETTINGS['min_bet']).text
+               for name, game in GAMES.items()}
+
+def render(name, **values):
+    """Текст экрана: значения полей экранируются"""
+    return TEMPLATES[name].render(**values)
+
+def fragment(name, **values):
+    """Повторяющийся кусок экрана (строка рейтинга): из кэша, пока значения те же"""
+    return TEMPLATES[name].cached(**values)
@@ -0,0 +1,117 @@
+# Режим вебхука
+# Telegram сам присылает апдейты на aiohttp-сервер вместо long polling
+
+import asyncio
+import logging
+import secrets
+import signal
+
+from aiohttp import web
+from aiogram.types import Update
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookHandler:
+    """Приём апдейтов: проверка секретного токена и не больше max_concurrency
+    обработчиков одновременно. Когда все слоты заняты, ответ на запрос
+    задерживается, и Telegram сам сбавляет поток"""
+    def __init__(self, dp, bot, secret, max_concurrency=64):
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.tasks = set()
+        self.received = 0
+        self.rejected = 0
+        self.failed = 0
+
+    async def handle(self, request):
+        if not secrets.compare_digest(request.headers.get(SECRET_HEADER, ""), self.secret):
+            self.rejected += 1
+            return web.Response(status=401)
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except ValueError:
+            return web.Response(status=400)
+
+        self.received += 1
+        await self.slots.acquire()
+        task = asyncio.create_task(self.process(update))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return web.Response()
+
+    async def process(self, update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            self.failed += 1
+            logging.exception(f"Ошибка обработки апдейта {update.update_id}")
+        finally:
+            self.slots.release()
+
+    async def drain(self):
+        """Дождаться всех начатых обработчиков"""
+        while self.tasks:
+            await asyncio.gather(*list(self.tasks), return_exceptions=True)
+
+    def metrics(self):
+        return {
+            'received': self.received,
+            'rejected': self.rejected,
+            'failed': self.failed,
+            'in_flight': len(self.tasks)
+        }
+
+def make_app(dp, bot, secret, path="/webhook", max_concurrency=64):
+    """aiohttp-приложение с обработчиком вебхука (он же в app['webhook'])"""
+    handler = WebhookHandler(dp, bot, secret, max_concurrency)
+    app = web.Application()
+    app.router.add_post(path, handler.handle)
+    app['webhook'] = handler
+
+    async def on_shutdown(app):
+        await handler.drain()
+
+    app.on_shutdown.append(on_shutdown)
+    return app
+
+async def wait_for_signal(signals=(signal.SIGTERM, signal.SIGINT)):
+    """Ждать первого из сигналов остановки вместо завершения процесса по умолчанию"""
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    for sig in signals:
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        for sig in signals:
+            loop.remove_signal_handler(sig)
+
+async def serve(dp, bot, url, settings, secret=None, register=True):
+    """Поднять сервер и зарегистрировать вебхук в Telegram.
+    register=False - воркер супервизора: апдейты присылает супервизор, а не Telegram"""
+    if register and not url:
+        raise ValueError("Не задан WEBHOOK_URL для режима вебхука")
+    secret = secret or secrets.token_urlsafe(32)
+    app = make_app(dp, bot, secret, settings['path'], settings['max_concurrency'])
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, settings['host'], settings['port']).start()
+    try:
+        await dp.emit_startup(bot=bot)
+        if register:
+            await bot.set_webhook(
+                url.rstrip("/") + settings['path'],
+                secret_token=secret,
+                max_connections=min(settings['max_concurrency'], 100),  # предел Telegram
+                allowed_updates=dp.resolve_used_update_types()
+            )
+        print(f"🌐 Вебхук слушает {settings['host']}:{settings['port']}{settings['path']}")
+        # SIGTERM (перезапуск хостингом, остановка супервизором) и SIGINT завершают сервер штатно:
+        # вызывающий код успевает сбросить историю, сохранить анти-чит и вернуть ставки Crash
+        await wait_for_signal()
+    finally:
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()